@@ -0,0 +1,121 @@
+"""Compare the quality and speed of the embedding backends of BlogMediaEnhancer.
+
+Every backend matches the alt texts of the fixture to the OCR text of its
+frames, as ``add_images_to_blog`` does. The frames are stored as their OCR
+text, so the evaluation runs without Tesseract.
+
+Usage:
+    python -m benchmarks.evaluate_embedding_backends --backends mpnet minilm-onnx-int8
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from essence_extractor.src.embedding_backends import (
+    EMBEDDING_BACKENDS,
+    get_embedding_backend,
+)
+
+DEFAULT_FIXTURE_PATH = os.path.join(
+    os.path.dirname(__file__), "fixtures", "frames_alt_texts.json",
+)
+
+
+def evaluate_backend(backend, frame_texts, queries, repeats=3):
+    """Measure how well and how fast a backend matches alt texts to frames.
+
+    Args:
+        backend: The embedding backend to evaluate.
+        frame_texts (dict): Maps frame names to the OCR text of the frame.
+        queries (List[Tuple[str, str]]): Pairs of an alt text and the name of
+            the frame it should retrieve.
+        repeats (int, optional): How often the texts are embedded to measure
+            the throughput. Defaults to 3.
+
+    Returns:
+        dict: The top-1 accuracy and mean reciprocal rank of the retrieval,
+        the seconds until the first embedding, including loading the model,
+        the texts embedded per second and the dimension of the embeddings.
+    """
+    frame_names = list(frame_texts)
+    alt_texts = [alt_text for alt_text, _ in queries]
+
+    start_time = time.perf_counter()
+    backend.encode(alt_texts[:1])
+    load_seconds = time.perf_counter() - start_time
+
+    texts = list(frame_texts.values()) + alt_texts
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        embeddings = backend.encode(texts)
+    texts_per_second = repeats * len(texts) / (time.perf_counter() - start_time)
+
+    embeddings = embeddings / np.clip(
+        np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None,
+    )
+    frame_embeddings = embeddings[:len(frame_names)]
+    query_embeddings = embeddings[len(frame_names):]
+    similarities = query_embeddings @ frame_embeddings.T
+
+    reciprocal_ranks = []
+    for (_, expected_frame), scores in zip(queries, similarities):
+        ranking = [frame_names[i] for i in np.argsort(-scores)]
+        reciprocal_ranks.append(1 / (ranking.index(expected_frame) + 1))
+    reciprocal_ranks = np.array(reciprocal_ranks)
+
+    return {
+        "top1_accuracy": float(np.mean(reciprocal_ranks == 1)),
+        "mean_reciprocal_rank": float(np.mean(reciprocal_ranks)),
+        "load_seconds": load_seconds,
+        "texts_per_second": texts_per_second,
+        "dimension": int(embeddings.shape[1]),
+    }
+
+
+def args_call():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Compare the quality and speed of the embedding backends.",
+    )
+    parser.add_argument("--backends", nargs="+", choices=list(EMBEDDING_BACKENDS),
+                        default=list(EMBEDDING_BACKENDS),
+                        help="The backends to evaluate.")
+    parser.add_argument("--fixture", type=str, default=DEFAULT_FIXTURE_PATH,
+                        help="A JSON file with frame texts and alt text queries.")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="How often the texts are embedded to measure speed.")
+    args = parser.parse_args()
+    main(args.backends, args.fixture, args.repeats)
+
+
+def main(backends, fixture_path, repeats=3):
+    """Evaluate the backends and print a table of the results.
+
+    Args:
+        backends (List[str]): The names of the backends to evaluate.
+        fixture_path (str): The path to the fixture file.
+        repeats (int, optional): How often the texts are embedded to measure
+            the throughput. Defaults to 3.
+    """
+    with open(fixture_path, "r") as f:
+        fixture = json.load(f)
+    queries = [tuple(query) for query in fixture["queries"]]
+
+    print(f"{'backend':<20}{'top-1':>8}{'MRR':>8}{'load s':>10}{'texts/s':>10}{'dim':>6}")
+    for name in backends:
+        result = evaluate_backend(
+            get_embedding_backend(name), fixture["frames"], queries, repeats=repeats,
+        )
+        print(
+            f"{name:<20}{result['top1_accuracy']:>8.2f}"
+            f"{result['mean_reciprocal_rank']:>8.2f}{result['load_seconds']:>10.1f}"
+            f"{result['texts_per_second']:>10.0f}{result['dimension']:>6}",
+        )
+
+
+if __name__ == "__main__":
+    args_call()
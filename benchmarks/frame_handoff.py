@@ -0,0 +1,117 @@
+"""Measure how much data handing frames to worker processes copies.
+
+Frames are either sent through a multiprocessing queue, which pickles each
+frame and writes it through a pipe, or written into a shared memory ring
+buffer, which only sends the index of the slot. Workers read every pixel of
+the frames they receive, as OCR would.
+
+Usage:
+    python -m benchmarks.frame_handoff
+"""
+
+import multiprocessing
+import pickle
+import time
+
+import numpy as np
+
+from essence_extractor.src.frame_ring_buffer import SharedFrameRingBuffer
+
+MODES = ("queue", "shared_memory")
+
+
+def _queue_worker(tasks, results):
+    while (frame := tasks.get()) is not None:
+        results.put(int(frame.sum()))
+
+
+def _ring_buffer_worker(ring_buffer, tasks, results):
+    try:
+        while (slot := tasks.get()) is not None:
+            checksum = int(ring_buffer.view(slot).sum())
+            ring_buffer.release(slot)
+            results.put(checksum)
+    finally:
+        ring_buffer.close()
+
+
+def measure_handoff(mode, n_frames=64, frame_shape=(720, 1280, 3), n_workers=2):
+    """Hand frames to worker processes and measure the copied data.
+
+    Args:
+        mode (str): "queue" to pickle the frames through a queue, or
+            "shared_memory" to pass them through a ring buffer.
+        n_frames (int, optional): The number of frames.
+        frame_shape (Tuple[int, ...], optional): The shape of the frames.
+        n_workers (int, optional): The number of worker processes.
+
+    Returns:
+        dict: The bytes written to the pipes, the bytes copied in user space,
+        the seconds it took and the frames handed over per second.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Mode must be one of {list(MODES)}")
+    context = multiprocessing.get_context("spawn")
+    frames = [np.full(frame_shape, i % 256, dtype=np.uint8) for i in range(4)]
+    tasks, results = context.Queue(), context.Queue()
+    ring_buffer = None
+    if mode == "queue":
+        args = (tasks, results)
+        target = _queue_worker
+    else:
+        ring_buffer = SharedFrameRingBuffer(
+            2 * n_workers, frame_shape, context=context,
+        )
+        args = (ring_buffer, tasks, results)
+        target = _ring_buffer_worker
+    workers = [context.Process(target=target, args=args) for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+
+    pipe_bytes = copied_bytes = 0
+    try:
+        start_time = time.perf_counter()
+        for i in range(n_frames):
+            frame = frames[i % len(frames)]
+            if mode == "queue":
+                message = frame
+                # Pickled by the producer and unpickled by the worker
+                copied_bytes += 2 * frame.nbytes
+            else:
+                message = ring_buffer.acquire()
+                ring_buffer.write(message, frame)
+                copied_bytes += frame.nbytes
+            pipe_bytes += len(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+            tasks.put(message)
+        for _ in range(n_frames):
+            results.get()
+        seconds = time.perf_counter() - start_time
+    finally:
+        for _ in workers:
+            tasks.put(None)
+        for worker in workers:
+            worker.join()
+        if ring_buffer is not None:
+            ring_buffer.close()
+    return {
+        "mode": mode,
+        "frames": n_frames,
+        "pipe_bytes": pipe_bytes,
+        "copied_bytes": copied_bytes,
+        "seconds": seconds,
+        "frames_per_second": n_frames / seconds if seconds else 0.0,
+    }
+
+
+def main():
+    """Print the copy volume and throughput of both modes."""
+    for mode in MODES:
+        result = measure_handoff(mode)
+        print(f"{mode:<15}pipe: {result['pipe_bytes'] / 1e6:>9.1f} MB  "
+              f"copied: {result['copied_bytes'] / 1e6:>9.1f} MB  "
+              f"{result['seconds']:>6.2f}s  "
+              f"{result['frames_per_second']:>7.1f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
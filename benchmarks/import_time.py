@@ -0,0 +1,91 @@
+"""Measure how long the entry points of Essence Extractor take to import.
+
+Every entry point runs in a fresh interpreter with ``-X importtime``. The
+import time is the sum of the time spent importing each module, so it does
+not depend on the work the entry point does afterwards.
+
+Usage:
+    python -m benchmarks.import_time
+"""
+
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    "essence-extractor --help": ["-m", "essence_extractor.main", "--help"],
+    "essence-extractor-service --help": ["-m", "essence_extractor.service", "--help"],
+    "essence-extractor-search --help": ["-m", "essence_extractor.search", "--help"],
+    "essence-extractor-ingest --help": ["-m", "essence_extractor.ingest", "--help"],
+    "import essence_extractor": ["-c", "import essence_extractor"],
+    "import essence_extractor.src.utils": ["-c", "import essence_extractor.src.utils"],
+    "import essence_extractor.src.blog_generator": [
+        "-c", "import essence_extractor.src.blog_generator",
+    ],
+}
+
+# Packages that only the stages processing media or calling the API need
+HEAVY_PACKAGES = {"faiss", "moviepy", "onnxruntime", "openai", "pytesseract", "pytube",
+                  "sentence_transformers", "torch", "transformers", "whisper"}
+
+IMPORT_TIME_BUDGET_SECONDS = 1.5
+
+
+def measure_import_time(args):
+    """Import an entry point in a fresh interpreter and time its imports.
+
+    Args:
+        args (List[str]): The arguments of the interpreter, such as
+            ``["-m", "essence_extractor.main", "--help"]``.
+
+    Returns:
+        dict: The total import time in seconds and the cumulative import
+        time of each module in seconds.
+
+    Raises:
+        RuntimeError: If the entry point fails.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=REPO_DIR, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{process.stderr}")
+
+    total_us = 0
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        modules[module.strip()] = int(cumulative_us) / 1e6
+    return {"seconds": total_us / 1e6, "modules": modules}
+
+
+def heavy_imports(modules):
+    """Find the heavy packages among imported modules.
+
+    Args:
+        modules (Iterable[str]): The names of the imported modules.
+
+    Returns:
+        Set[str]: The heavy packages that were imported.
+    """
+    return {module.split(".")[0] for module in modules} & HEAVY_PACKAGES
+
+
+def main():
+    """Print the import time of every entry point."""
+    for name, args in ENTRY_POINTS.items():
+        result = measure_import_time(args)
+        slowest = sorted(result["modules"].items(), key=lambda item: -item[1])[:3]
+        print(f"{name:<45}{result['seconds']:>7.3f}s  "
+              f"heavy: {sorted(heavy_imports(result['modules'])) or '-'}  "
+              f"slowest: {', '.join(f'{m} {s:.3f}s' for m, s in slowest)}")
+
+
+if __name__ == "__main__":
+    main()
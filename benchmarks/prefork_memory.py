@@ -0,0 +1,108 @@
+"""Measure how much memory each worker process needs for its own copy of the models.
+
+The models are stood in for by a dict of float32 weight arrays and many
+small Python objects, like the vocabulary of a tokenizer. Each worker reads
+all weights and runs the garbage collector, as a job would, and then reports
+the memory only it uses (USS). The workers either load the models themselves
+("spawn"), are forked from a parent that loaded them ("fork"), or are forked
+after the garbage collector was disabled while loading and the objects were
+frozen, as ``PreforkWorkerPool`` does ("fork_frozen").
+
+Usage:
+    python -m benchmarks.prefork_memory
+"""
+
+import gc
+import multiprocessing
+import os
+
+import numpy as np
+
+from essence_extractor.src.prefork_pool import process_memory
+
+MODES = ("spawn", "fork", "fork_frozen")
+
+
+def load_models(weight_mb=200, n_objects=500_000):
+    """Create stand-ins for loaded model weights and tokenizer tables.
+
+    Args:
+        weight_mb (int, optional): The size of the weights in MB.
+        n_objects (int, optional): The number of small Python objects.
+
+    Returns:
+        dict: The weights and the vocabulary.
+    """
+    rng = np.random.default_rng(0)
+    n_layers = 8
+    layer_size = weight_mb * 1024 ** 2 // 4 // n_layers
+    weights = {f"layer_{i}": rng.standard_normal(layer_size, dtype=np.float32)
+               for i in range(n_layers)}
+    vocabulary = {f"token_{i}": [i, str(i)] for i in range(n_objects)}
+    return {"weights": weights, "vocabulary": vocabulary}
+
+
+def _run_job(models, results):
+    gc.enable()
+    if models is None:
+        models = load_models()
+    # Reading the weights, as inference does, does not copy their pages.
+    checksum = sum(float(weights.max()) for weights in models["weights"].values())
+    # A job creates and drops many short-lived containers.
+    for _ in range(3):
+        garbage = [[i] for i in range(100_000)]
+        del garbage
+        gc.collect()
+    results.put((process_memory(os.getpid()), checksum))
+
+
+def measure_workers(mode, n_workers=2):
+    """Start workers in one of the modes and read their memory.
+
+    Args:
+        mode (str): "spawn", "fork" or "fork_frozen".
+        n_workers (int, optional): The number of worker processes.
+
+    Returns:
+        dict: The mean USS and PSS of the workers, in bytes.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Mode must be one of {list(MODES)}")
+    models = None
+    if mode == "spawn":
+        context = multiprocessing.get_context("spawn")
+    else:
+        context = multiprocessing.get_context("fork")
+        if mode == "fork_frozen":
+            gc.disable()
+        models = load_models()
+        if mode == "fork_frozen":
+            gc.freeze()
+    results = context.Queue()
+    workers = [context.Process(target=_run_job, args=(models, results))
+               for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    memories = [results.get()[0] for _ in workers]
+    for worker in workers:
+        worker.join()
+    if mode == "fork_frozen":
+        gc.unfreeze()
+        gc.enable()
+    return {
+        "mode": mode,
+        "uss": sum(memory["uss"] for memory in memories) / n_workers,
+        "pss": sum(memory["pss"] for memory in memories) / n_workers,
+    }
+
+
+def main():
+    """Print the memory per worker of all modes."""
+    for mode in MODES:
+        result = measure_workers(mode)
+        print(f"{mode:<13}USS per worker: {result['uss'] / 1024 ** 2:>7.1f} MB  "
+              f"PSS per worker: {result['pss'] / 1024 ** 2:>7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,36 @@
-from .src import YouTubeDownloader, Transcriber, BlogGenerator, BlogMediaEnhancer, utils, CostManager
-from . import main
+"""Turn YouTube videos into blog posts.
 
-__all__ = ["YouTubeDownloader", "Transcriber", "BlogGenerator", "BlogMediaEnhancer", "utils", "CostManager", "main"]
\ No newline at end of file
+The classes are imported when they are first accessed, so the command line
+interface starts without importing the heavy dependencies of every stage.
+"""
+
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "YouTubeDownloader": ".src",
+    "Transcriber": ".src",
+    "BlogGenerator": ".src",
+    "BlogMediaEnhancer": ".src",
+    "utils": ".src",
+    "CostManager": ".src",
+    "Pipeline": ".src",
+    "main": ".main",
+}
+
+__all__ = ["YouTubeDownloader", "Transcriber", "BlogGenerator", "BlogMediaEnhancer",
+           "utils", "CostManager", "Pipeline", "main"]
+
+
+def __getattr__(name):
+    """Import a class or module of the package on first access."""
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+    value = module if name == "main" else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """List the attributes of the package, including the lazy ones."""
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,171 @@
+"""Turn every video file dropped into a folder into a blog post."""
+
+import argparse
+import os
+import time
+
+from essence_extractor.src import utils
+from essence_extractor.src.embedding_backends import (
+    DEFAULT_EMBEDDING_BACKEND,
+    EMBEDDING_BACKENDS,
+)
+from essence_extractor.src.hot_folder import HotFolder
+from essence_extractor.src.job_queue import LOCAL_FILE, QUEUED, RUNNING, JobStore
+from essence_extractor.src.pipeline import Pipeline
+from essence_extractor.src.prefork_pool import PreforkWorkerPool
+from essence_extractor.src.resource_manager import ResourceManager
+
+MEMORY_LOG_INTERVAL = 60
+
+
+def args_call():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Turn every video file dropped into a folder into a blog post.",
+    )
+    parser.add_argument("watch_dir", type=str,
+                        help="The folder to watch for video files.")
+    parser.add_argument(
+        "output_dir",
+        type=str,
+        help="The directory to save the outputs and the job database.",
+    )
+    parser.add_argument("api_key",
+                        type=str,
+                        help="The API key for openai API.",
+                        )
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        default="gpt-3.5-turbo-1106",
+        help="The model name used as blog generator.",
+    )
+    parser.add_argument("--workers", type=int, default=1,
+                        help="The number of worker processes, which share the "
+                             "loaded models.")
+    parser.add_argument("--embedding_backend", type=str,
+                        choices=list(EMBEDDING_BACKENDS),
+                        default=DEFAULT_EMBEDDING_BACKEND,
+                        help="The backend that embeds the texts of frames and images.")
+    parser.add_argument("--timestamp_base_url", type=str, default=None,
+                        help="The URL the video files are published under. The "
+                             "timestamps of the blog posts link to the files at "
+                             "this URL, or stay plain text if it is not set.")
+    parser.add_argument("--search_index_dir", type=str, default=None,
+                        help="Add every video to the search index in this directory.")
+    parser.add_argument("--embedding_cache_dir", type=str,
+                        default=utils.DEFAULT_CACHE_DIR,
+                        help="The directory that caches the embeddings of the "
+                             "frame texts for later videos.")
+    parser.add_argument("--no_embedding_cache", action="store_true",
+                        help="Only cache the embeddings of the frame texts in memory.")
+    parser.add_argument("--num_threads", type=int, default=None,
+                        help="The number of CPU threads shared by all workers.")
+    parser.add_argument("--poll_interval", type=float, default=5.0,
+                        help="How often to look for new files, in seconds.")
+    parser.add_argument("--settle_seconds", type=float, default=5.0,
+                        help="How long a file must stay unchanged before it is "
+                             "ingested, so files that are still being copied are "
+                             "skipped.")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Also watch the subfolders.")
+    parser.add_argument("--once", action="store_true",
+                        help="Ingest the files in the folder and exit once they are "
+                             "done, instead of watching the folder.")
+    args = parser.parse_args()
+    main(args.watch_dir, args.output_dir, args.api_key, args.model_name,
+         args.workers, args.embedding_backend, args.timestamp_base_url,
+         args.search_index_dir, args.num_threads, args.poll_interval,
+         args.settle_seconds, args.recursive, args.once,
+         None if args.no_embedding_cache else args.embedding_cache_dir)
+
+
+def main(watch_dir, output_dir, api_key, model_name, workers=1,
+         embedding_backend=DEFAULT_EMBEDDING_BACKEND, timestamp_base_url=None,
+         search_index_dir=None, num_threads=None, poll_interval=5.0,
+         settle_seconds=5.0, recursive=False, once=False, embedding_cache_dir=None):
+    """Ingest the video files of a folder until it is interrupted.
+
+    Files are ingested once. Files that were ingested by an earlier run with
+    the same output directory are skipped.
+
+    Args:
+        watch_dir (str): The folder to watch for video files.
+        output_dir (str): The directory to save the outputs and the job database.
+        api_key (str): The API key for openai API.
+        model_name (str): The model name used as blog generator.
+        workers (int, optional): The number of worker processes. Defaults to 1.
+        embedding_backend (str, optional): The name of the embedding backend.
+            Defaults to "mpnet".
+        timestamp_base_url (str, optional): The URL the video files are
+            published under. Defaults to None, leaving the timestamps as text.
+        search_index_dir (str, optional): The directory of the search index
+            to add every video to. Defaults to None.
+        num_threads (int, optional): The number of CPU threads shared by all
+            workers. Defaults to the number of cores.
+        poll_interval (float, optional): How often to look for new files, in
+            seconds. Defaults to 5.
+        settle_seconds (float, optional): How long a file must stay unchanged
+            before it is ingested. Defaults to 5.
+        recursive (bool, optional): Whether to also watch the subfolders.
+            Defaults to False.
+        once (bool, optional): Whether to exit once the files in the folder
+            are done. Defaults to False.
+        embedding_cache_dir (str, optional): The directory that caches the
+            embeddings of the frame texts for later videos, or None to cache
+            them in memory only. Defaults to None.
+    """
+    os.environ["OPENAI_API_KEY"] = api_key
+    # The workers are separate processes, so each gets its own share of the cores.
+    resource_manager = ResourceManager(
+        total_threads=max(1, (num_threads or os.cpu_count() or 1) // workers),
+    )
+    resource_manager.configure_environment()
+    os.makedirs(output_dir, exist_ok=True)
+
+    job_store = JobStore(os.path.join(output_dir, "ingest.sqlite3"))
+    hot_folder = HotFolder(watch_dir, settle_seconds=settle_seconds, recursive=recursive)
+    hot_folder.mark_reported(job["url"] for job in job_store.list_jobs()
+                             if job["source"] == LOCAL_FILE)
+    worker_pool = PreforkWorkerPool(
+        job_store,
+        lambda: Pipeline(output_dir=output_dir, model_name=model_name,
+                         embedding_backend=embedding_backend,
+                         search_index_dir=search_index_dir,
+                         resource_manager=resource_manager,
+                         timestamp_base_url=timestamp_base_url,
+                         embedding_cache_dir=embedding_cache_dir),
+        n_workers=workers,
+        poll_interval=poll_interval,
+    )
+
+    worker_pool.start()
+    utils.logging.info(f"Watching {watch_dir} with {workers} workers")
+    last_memory_log = time.monotonic()
+    try:
+        while True:
+            for video_path in hot_folder.poll():
+                job_id = job_store.submit(video_path, source=LOCAL_FILE)
+                utils.logging.info(f"Queued job {job_id} for {video_path}")
+            worker_pool.respawn_dead_workers()
+            if time.monotonic() - last_memory_log >= MEMORY_LOG_INTERVAL:
+                last_memory_log = time.monotonic()
+                for pid, memory in worker_pool.worker_memory().items():
+                    if memory is not None:
+                        utils.logging.info(
+                            f"Worker {pid}: {memory['uss'] / 1024 ** 2:.0f} MB "
+                            f"private, {memory['pss'] / 1024 ** 2:.0f} MB "
+                            f"proportional",
+                        )
+            if (once and not hot_folder.pending and not job_store.count(QUEUED)
+                    and not job_store.count(RUNNING)):
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        utils.logging.info("Shutting down")
+    finally:
+        worker_pool.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    args_call()
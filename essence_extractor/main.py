@@ -5,13 +5,15 @@ import os
 
 from tqdm import tqdm
 
-from essence_extractor.src import utils
-from essence_extractor.src.blog_generator import BlogGenerator
-from essence_extractor.src.blog_media_enhancer import BlogMediaEnhancer
-from essence_extractor.src.cost_management import CostManager
+from essence_extractor.src import metrics, utils
+from essence_extractor.src.artifact_store import DEFAULT_ARTIFACT_STORE_DIR, ArtifactStore
 from essence_extractor.src.data_models import YouTubeURL
-from essence_extractor.src.downloader import YouTubeDownloader
-from essence_extractor.src.transcriber import Transcriber
+from essence_extractor.src.embedding_backends import (
+    DEFAULT_EMBEDDING_BACKEND,
+    EMBEDDING_BACKENDS,
+)
+from essence_extractor.src.pipeline import Pipeline
+from essence_extractor.src.resource_manager import ResourceManager
 
 
 def args_call():
@@ -34,79 +36,236 @@ def args_call():
         default="gpt-3.5-turbo-1106",
         help="The model name used as blog generator.",
     )
+    parser.add_argument(
+        "--no_resume",
+        action="store_true",
+        help="Start over instead of resuming an interrupted run of the video.",
+    )
+    parser.add_argument(
+        "--retrieval_mode",
+        type=str,
+        choices=["timestamp", "full"],
+        default="timestamp",
+        help="Search frames for an image only within the time range of its "
+             "section, or within the whole video.",
+    )
+    parser.add_argument(
+        "--embedding_backend",
+        type=str,
+        choices=list(EMBEDDING_BACKENDS),
+        default=DEFAULT_EMBEDDING_BACKEND,
+        help="The backend that embeds the texts of frames and images.",
+    )
+    parser.add_argument(
+        "--search_index_dir",
+        type=str,
+        default=None,
+        help="Add the frames and transcript of the video to the search index "
+             "in this directory.",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="The number of CPU threads shared by all stages. Defaults to the "
+             "number of cores.",
+    )
+    parser.add_argument(
+        "--artifact_store_dir",
+        type=str,
+        default=DEFAULT_ARTIFACT_STORE_DIR,
+        help="The directory that stores downloaded videos, audio and transcripts "
+             "for later runs.",
+    )
+    parser.add_argument(
+        "--artifact_store_max_gb",
+        type=float,
+        default=20,
+        help="The maximum size of the artifact store in GB.",
+    )
+    parser.add_argument(
+        "--no_artifact_store",
+        action="store_true",
+        help="Always download and transcribe the video again.",
+    )
+    parser.add_argument(
+        "--embedding_cache_dir",
+        type=str,
+        default=utils.DEFAULT_CACHE_DIR,
+        help="The directory that caches the embeddings of the frame texts for "
+             "later runs.",
+    )
+    parser.add_argument(
+        "--no_embedding_cache",
+        action="store_true",
+        help="Only cache the embeddings of the frame texts during the run.",
+    )
+    parser.add_argument(
+        "--ocr_workers",
+        type=int,
+        default=0,
+        help="The number of processes that run OCR on the video frames. "
+             "Defaults to running OCR in the main process.",
+    )
+    parser.add_argument(
+        "--no_compact_transcript",
+        action="store_true",
+        help="Generate the blog post from the full transcript, without removing "
+             "filler words and repetition first.",
+    )
+    parser.add_argument(
+        "--refine_strategy",
+        type=str,
+        choices=["full", "sections"],
+        default="full",
+        help="Rewrite the whole blog post with every chunk of the transcript, or "
+             "only write the new or changed sections, which takes fewer tokens "
+             "for long videos.",
+    )
+    parser.add_argument(
+        "--extra_artifacts",
+        type=str,
+        nargs="*",
+        choices=["summary", "chapters"],
+        default=[],
+        help="Also generate a short summary or a chapter list of the video. They "
+             "reuse the cached transcript prompt of the blog post.",
+    )
+    parser.add_argument(
+        "--frame_reader_processes",
+        type=lambda value: value if value == "auto" else int(value),
+        default="auto",
+        help='The number of processes that decode the video frames, each from its '
+             'own range of the video. Defaults to "auto", which uses more processes '
+             "for longer videos, up to the number of cores.",
+    )
+    parser.add_argument(
+        "--topic_chunking",
+        action="store_true",
+        help="Send the transcript to the language model in chunks of whole "
+             "topics, found with the embedding backend, instead of cutting it "
+             "at the token limit of a request.",
+    )
+    parser.add_argument(
+        "--metrics_textfile",
+        type=str,
+        default=None,
+        help="Write the metrics of the run to this file in the OpenMetrics text "
+             "format, for example into the textfile collector directory of the "
+             "Prometheus node exporter.",
+    )
     args = parser.parse_args()
-    main(args.output_dir, args.api_key, args.model_name)
+    main(args.output_dir, args.api_key, args.model_name, resume=not args.no_resume,
+         retrieval_mode=args.retrieval_mode, embedding_backend=args.embedding_backend,
+         search_index_dir=args.search_index_dir, num_threads=args.num_threads,
+         artifact_store_dir=None if args.no_artifact_store else args.artifact_store_dir,
+         artifact_store_max_gb=args.artifact_store_max_gb,
+         embedding_cache_dir=(None if args.no_embedding_cache
+                              else args.embedding_cache_dir),
+         ocr_workers=args.ocr_workers,
+         compact_transcript=not args.no_compact_transcript,
+         refine_strategy=args.refine_strategy,
+         extra_artifacts=args.extra_artifacts,
+         frame_reader_processes=args.frame_reader_processes,
+         metrics_textfile=args.metrics_textfile,
+         topic_chunking=args.topic_chunking)
 
-def main(output_dir, api_key, model_name):
+def main(output_dir, api_key, model_name, resume=True, retrieval_mode="timestamp",
+         embedding_backend=DEFAULT_EMBEDDING_BACKEND, search_index_dir=None,
+         num_threads=None, artifact_store_dir=None, artifact_store_max_gb=20,
+         ocr_workers=0, compact_transcript=True, refine_strategy="full",
+         extra_artifacts=(), frame_reader_processes="auto", metrics_textfile=None,
+         topic_chunking=False, embedding_cache_dir=None):
     """Download, transcribe, and generate blog post of a YouTube video.
 
     Args:
         output_dir (str): The directory to save the summary file.
         api_key (str): The API key for openai API.
         model_name (str): The model name used as blog generator.
+        resume (bool, optional): Whether to resume an interrupted run of the
+            video. Defaults to True.
+        retrieval_mode (str, optional): How frames are searched for an image,
+            "timestamp" or "full". Defaults to "timestamp".
+        embedding_backend (str, optional): The name of the embedding backend.
+            Defaults to "mpnet".
+        search_index_dir (str, optional): The directory of the search index
+            to add the video to. Defaults to None.
+        num_threads (int, optional): The number of CPU threads shared by all
+            stages. Defaults to the number of cores.
+        artifact_store_dir (str, optional): The directory of the artifact
+            store, or None to not store artifacts. Defaults to None.
+        artifact_store_max_gb (float, optional): The maximum size of the
+            artifact store in GB. Defaults to 20.
+        ocr_workers (int, optional): The number of processes that run OCR on
+            the video frames. Defaults to 0, running OCR in this process.
+        compact_transcript (bool, optional): Whether to remove filler words
+            and repetition from the transcript before generating the blog
+            post. Defaults to True.
+        refine_strategy (str, optional): How the blog post is refined with
+            each chunk of the transcript, "full" or "sections". Defaults to
+            "full".
+        extra_artifacts (List[str], optional): The artifacts to generate
+            along with the blog post, "summary" and "chapters". Defaults to
+            none.
+        frame_reader_processes (Union[int, str], optional): The number of
+            processes that decode the video frames, or "auto" to choose it
+            from the length of the video and the available cores. Defaults to
+            "auto".
+        metrics_textfile (str, optional): The file to write the metrics of the
+            run to. Defaults to None.
+        topic_chunking (bool, optional): Whether to send the transcript to the
+            language model in chunks of whole topics. Defaults to False.
+        embedding_cache_dir (str, optional): The directory that caches the
+            embeddings of the frame texts for later runs, or None to cache them
+            during the run only. Defaults to None.
     """
     os.environ["OPENAI_API_KEY"] = api_key
-    os.environ["TOKENIZERS_PARALLELISM"] = "false"
-    cost_manager = CostManager(model_name=model_name)
-    yt_downloader = YouTubeDownloader(output_path=output_dir)
-    transcriber = Transcriber(output_path=output_dir)
-    blog_generator = BlogGenerator(
-        output_path=output_dir, model_name=model_name, cost_manager=cost_manager,
-    )
-    media_enhancer = BlogMediaEnhancer(output_path=output_dir)
+    resource_manager = ResourceManager(total_threads=num_threads)
+    resource_manager.configure_environment()
+    artifact_store = None
+    if artifact_store_dir is not None:
+        artifact_store = ArtifactStore(
+            artifact_store_dir, max_bytes=int(artifact_store_max_gb * 1024 ** 3),
+        )
+    pipeline = Pipeline(
+        output_dir=output_dir, model_name=model_name, retrieval_mode=retrieval_mode,
+        embedding_backend=embedding_backend, search_index_dir=search_index_dir,
+        resource_manager=resource_manager, artifact_store=artifact_store,
+        ocr_workers=ocr_workers, compact_transcript=compact_transcript,
+        refine_strategy=refine_strategy, extra_artifacts=extra_artifacts,
+        frame_reader_processes=frame_reader_processes, topic_chunking=topic_chunking,
+        embedding_cache_dir=embedding_cache_dir,
+    )
 
     youtube_video_url = input("Please enter the YouTube video URL: ")
     youtube_video_url = YouTubeURL(url=youtube_video_url).url
 
-    tasks = ["Downloading Video", "Extracting Audio",
-             "Transcribing Audio", "Generating Blog Post",
-             "Adding Image Placeholders", "Adding URL Timestamps",
-             "Adding Images", "Formatting to Markdown",
-             "Saving to File"]
+    try:
+        with tqdm(total=len(pipeline.stage_names)) as pbar:
+            result = pipeline.run(
+                youtube_video_url,
+                on_stage_done=lambda stage, seconds: pbar.update(1),
+                resume=resume,
+            )
+    finally:
+        pipeline.close()
 
-    with tqdm(total=len(tasks)) as pbar:
-        video_path = yt_downloader.download_video(youtube_video_url)
-        utils.logging.info(f"Video downloaded to: {video_path}")
-        pbar.update(1)
-
-        audio_path = transcriber.extract_audio(video_path)
-        utils.logging.info(f"Audio extracted to: {audio_path}")
-        pbar.update(1)
-
-        transcription_path = transcriber.transcribe_audio(audio_path)
-        utils.logging.info(f"Audio transcribed to: {transcription_path}")
-        pbar.update(1)
-
-        blog_content = blog_generator.generate_article_content(transcription_path)
-        utils.logging.info(f"Blog post generated")
-        pbar.update(1)
-
-        blog_content = blog_generator.add_image_placeholder(blog_content)
-        utils.logging.info(f"Image placeholders added to blog post")
-        pbar.update(1)
-
-        blog_content = media_enhancer.add_url_timestamps_to_blog(
-            youtube_video_url, blog_content,
-        )
-        utils.logging.info(f"URL timestamps added to blog post")
-        pbar.update(1)
-
-        blog_content = media_enhancer.add_images_to_blog(video_path, blog_content)
-        utils.logging.info(f"Images added to blog post")
-        pbar.update(1)
-
-        blog_content = utils.format_to_markdown(blog_content)
-        pbar.update(1)
-
-        blog_post_name = video_path.replace(".mp4", "")
-
-        blog_post_path = os.path.join(
-            output_dir, f"{os.path.basename(blog_post_name)}.md",
-        )
-        utils.save_to_md_file(blog_content, blog_post_path)
-        pbar.update(1)
-
-    utils.logging.info(f"Blog post cost: {cost_manager.get_total_cost()}$")
+    utils.logging.info(f"Blog post cost: {result['cost']}$")
+    llm_tokens = result["llm_tokens"]
+    utils.logging.info(
+        f"Language model tokens: {llm_tokens['input_tokens']} input "
+        f"({llm_tokens['cache_hit_rate']:.0%} served from the prompt cache), "
+        f"{llm_tokens['output_tokens']} output",
+    )
+    token_cache_info = pipeline.blog_generator.token_counter.cache_info()
+    utils.logging.info(
+        f"Token count cache hit rate: {token_cache_info['hit_rate']:.1%} "
+        f"({token_cache_info['hits']} hits, {token_cache_info['misses']} misses)",
+    )
+    resource_manager.report()
+    if metrics_textfile is not None:
+        metrics.REGISTRY.write_textfile(metrics_textfile)
+        utils.logging.info(f"Metrics written to {metrics_textfile}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+"""Search the frames and transcripts of all processed videos."""
+
+import argparse
+import json
+import urllib.parse
+
+from essence_extractor.src.embedding_backends import (
+    DEFAULT_EMBEDDING_BACKEND,
+    EMBEDDING_BACKENDS,
+    get_embedding_backend,
+)
+from essence_extractor.src.semantic_index import SemanticIndex
+
+YOUTUBE_VIDEO_ID_LENGTH = 11
+YOUTUBE_HOSTS = ("youtube.com", "youtu.be", "youtube-nocookie.com")
+
+
+def args_call():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Search the frames and transcripts of all processed videos.",
+    )
+    parser.add_argument("index_dir", type=str,
+                        help="The directory of the search index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="Search the index.")
+    query_parser.add_argument("query", type=str, help="The text to search for.")
+    query_parser.add_argument("-k", type=int, default=10,
+                              help="The number of results.")
+    query_parser.add_argument("--kind", type=str, choices=["frame", "transcript"],
+                              default=None, help="Only return results of this kind.")
+    query_parser.add_argument("--video_id", type=str, default=None,
+                              help="Only return results of this video.")
+    query_parser.add_argument("--embedding_backend", type=str,
+                              choices=list(EMBEDDING_BACKENDS),
+                              default=DEFAULT_EMBEDDING_BACKEND,
+                              help="The backend the index was built with.")
+
+    delete_parser = subparsers.add_parser("delete", help="Delete a video.")
+    delete_parser.add_argument("video_id", type=str, help="The id of the video.")
+
+    subparsers.add_parser("stats", help="Describe the index.")
+
+    args = parser.parse_args()
+    if args.command == "query":
+        results = search(args.index_dir, args.query, k=args.k, kind=args.kind,
+                         video_id=args.video_id,
+                         embedding_backend=args.embedding_backend)
+        for result in results:
+            print(format_result(result))
+    elif args.command == "delete":
+        n_deleted = SemanticIndex(args.index_dir).delete_video(args.video_id)
+        print(f"Deleted {n_deleted} items of {args.video_id}")
+    else:
+        print(json.dumps(SemanticIndex(args.index_dir).stats(), indent=2))
+
+
+def search(index_dir, query, k=10, kind=None, video_id=None,
+           embedding_backend=DEFAULT_EMBEDDING_BACKEND):
+    """Search the index for a text.
+
+    Args:
+        index_dir (str): The directory of the search index.
+        query (str): The text to search for.
+        k (int, optional): The number of results. Defaults to 10.
+        kind (str, optional): Only return results of this kind.
+        video_id (str, optional): Only return results of this video.
+        embedding_backend (str, optional): The backend the index was built
+            with. Defaults to "mpnet".
+
+    Returns:
+        List[dict]: The most similar frames and transcript chunks.
+    """
+    backend = get_embedding_backend(embedding_backend)
+    index = SemanticIndex(index_dir, model_key=backend.cache_key)
+    return index.search(backend.encode([query])[0], k=k, kind=kind, video_id=video_id)
+
+
+def result_link(result):
+    """Link a search result to its timestamp in the video.
+
+    YouTube videos link to their watch page. Other videos link to the URL or
+    the path they were processed from, with a media fragment such as
+    ``talk.mp4#t=90``. Items indexed without a source only get a YouTube link
+    if their video id can be a YouTube id.
+
+    Args:
+        result (dict): A result of SemanticIndex.search.
+
+    Returns:
+        str: The link, or the video id if the video cannot be linked.
+    """
+    source = result.get("source")
+    start_time = result["start_time"]
+    host = urllib.parse.urlparse(source).netloc if source else ""
+    is_youtube = any(host == youtube_host or host.endswith(f".{youtube_host}")
+                     for youtube_host in YOUTUBE_HOSTS)
+    if source is not None and not is_youtube:
+        if start_time is None:
+            return source
+        return f"{source}#t={int(start_time)}"
+    if source is None and len(result["video_id"]) != YOUTUBE_VIDEO_ID_LENGTH:
+        return result["video_id"]
+    url = f"https://www.youtube.com/watch?v={result['video_id']}"
+    if start_time is not None:
+        url += f"&t={int(start_time)}s"
+    return url
+
+
+def format_result(result):
+    """Format a search result as one line with a link to its timestamp.
+
+    Args:
+        result (dict): A result of SemanticIndex.search.
+
+    Returns:
+        str: The formatted result.
+    """
+    url = result_link(result)
+    text = (result["text"] or result["name"]).replace("\n", " ")
+    if len(text) > 80:
+        text = text[:77] + "..."
+    return f"{result['score']:.3f}  {result['kind']:<10}  {url}  {text}"
+
+
+if __name__ == "__main__":
+    args_call()
@@ -0,0 +1,262 @@
+"""Serve a local job queue that turns YouTube videos into blog posts."""
+
+import argparse
+import json
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pydantic import ValidationError
+
+from essence_extractor.src import metrics, utils
+from essence_extractor.src.artifact_store import DEFAULT_ARTIFACT_STORE_DIR, ArtifactStore
+from essence_extractor.src.data_models import YouTubeURL
+from essence_extractor.src.embedding_backends import (
+    DEFAULT_EMBEDDING_BACKEND,
+    EMBEDDING_BACKENDS,
+)
+from essence_extractor.src.job_queue import QUEUED, RUNNING, JobStore, JobWorkerPool
+from essence_extractor.src.pipeline import Pipeline
+from essence_extractor.src.resource_manager import ResourceManager
+
+JOB_PATH_PATTERN = re.compile(r"^/jobs/([0-9a-f]{32})(/result)?$")
+# How long a short video waits for the short videos of other jobs, in seconds.
+CLIP_BATCH_WAIT = 0.5
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """Handles the HTTP API of the job queue.
+
+    Endpoints:
+        POST /jobs: Submit a job with a JSON body ``{"url": ...}``.
+        GET /jobs: List all jobs.
+        GET /jobs/<id>: Get the status, stage timings and result of a job.
+        GET /jobs/<id>/result: Get the generated blog post of a job.
+        DELETE /jobs/<id>: Cancel a job.
+        GET /metrics: Get the metrics of the service for Prometheus.
+    """
+
+    job_store = None
+
+    def _send_json(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_text(self, status, text, content_type="text/markdown; charset=utf-8"):
+        content = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        """Submit a job."""
+        if self.path != "/jobs":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            url = str(YouTubeURL(url=body.get("url")).url)
+        except (ValueError, ValidationError) as e:
+            self._send_json(400, {"error": f"Invalid job: {e}"})
+            return
+        job_id = self.job_store.submit(url)
+        self._send_json(201, {"id": job_id})
+
+    def do_GET(self):
+        """Get one or all jobs, the result of a job, or the metrics."""
+        if self.path == "/metrics":
+            self._send_text(200, metrics.REGISTRY.render(),
+                            content_type=metrics.OPENMETRICS_CONTENT_TYPE)
+            return
+        if self.path == "/jobs":
+            self._send_json(200, self.job_store.list_jobs())
+            return
+        match = JOB_PATH_PATTERN.match(self.path)
+        job = self.job_store.get(match.group(1)) if match else None
+        if job is None:
+            self._send_json(404, {"error": "Not found"})
+        elif not match.group(2):
+            self._send_json(200, job)
+        elif job["result"] is None:
+            self._send_json(409, {"error": f"Job is {job['status']}"})
+        else:
+            try:
+                with open(job["result"]["blog_post_path"], "r") as f:
+                    blog_post = f.read()
+            except OSError as e:
+                utils.logging.warning(
+                    f"Could not read the blog post of job {job['id']}: {e}",
+                )
+                self._send_json(410, {"error": "Blog post is no longer available"})
+                return
+            self._send_text(200, blog_post)
+
+    def do_DELETE(self):
+        """Cancel a job."""
+        match = JOB_PATH_PATTERN.match(self.path)
+        if not match or match.group(2) or self.job_store.get(match.group(1)) is None:
+            self._send_json(404, {"error": "Not found"})
+        elif self.job_store.cancel(match.group(1)):
+            self._send_json(202, self.job_store.get(match.group(1)))
+        else:
+            self._send_json(409, {"error": "Job already finished"})
+
+    def log_message(self, format, *args):
+        """Log requests with the package logger."""
+        utils.logging.info(f"{self.address_string()} - {format % args}")
+
+
+def create_server(job_store, host="127.0.0.1", port=8000):
+    """Create the HTTP server of the job queue.
+
+    The number of queued and running jobs is added to the metrics, read from
+    the job store whenever the metrics are scraped.
+
+    Args:
+        job_store (JobStore): The store of the jobs.
+        host (str, optional): The host to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on. Defaults to 8000.
+
+    Returns:
+        ThreadingHTTPServer: The server.
+    """
+    metrics.REGISTRY.gauge(
+        "jobs", "Jobs waiting in the queue or running.", ["status"],
+        function=lambda: {(status,): job_store.count(status)
+                          for status in (QUEUED, RUNNING)},
+    )
+    handler = type("BoundJobRequestHandler", (JobRequestHandler,), {
+        "job_store": job_store,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def args_call():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Serve a job queue that turns YouTube videos into blog posts.",
+    )
+    parser.add_argument(
+        "output_dir",
+        type=str,
+        help="The directory to save the outputs and the job database.",
+    )
+    parser.add_argument("api_key",
+                        type=str,
+                        help="The API key for openai API.",
+                        )
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        default="gpt-3.5-turbo-1106",
+        help="The model name used as blog generator.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                        help="The host to listen on.")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="The port to listen on.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="The number of jobs to run at the same time.")
+    parser.add_argument("--embedding_backend", type=str,
+                        choices=list(EMBEDDING_BACKENDS),
+                        default=DEFAULT_EMBEDDING_BACKEND,
+                        help="The backend that embeds the texts of frames and images.")
+    parser.add_argument("--search_index_dir", type=str, default=None,
+                        help="Add every video to the search index in this directory.")
+    parser.add_argument("--num_threads", type=int, default=None,
+                        help="The number of CPU threads shared by all jobs.")
+    parser.add_argument("--artifact_store_dir", type=str,
+                        default=DEFAULT_ARTIFACT_STORE_DIR,
+                        help="The directory that stores downloaded videos, audio "
+                             "and transcripts for later jobs.")
+    parser.add_argument("--artifact_store_max_gb", type=float, default=20,
+                        help="The maximum size of the artifact store in GB.")
+    parser.add_argument("--no_artifact_store", action="store_true",
+                        help="Always download and transcribe videos again.")
+    parser.add_argument("--embedding_cache_dir", type=str,
+                        default=utils.DEFAULT_CACHE_DIR,
+                        help="The directory that caches the embeddings of the "
+                             "frame texts for later jobs.")
+    parser.add_argument("--no_embedding_cache", action="store_true",
+                        help="Only cache the embeddings of the frame texts in memory.")
+    args = parser.parse_args()
+    main(args.output_dir, args.api_key, args.model_name,
+         args.host, args.port, args.workers, args.embedding_backend,
+         args.search_index_dir, args.num_threads,
+         None if args.no_artifact_store else args.artifact_store_dir,
+         args.artifact_store_max_gb,
+         None if args.no_embedding_cache else args.embedding_cache_dir)
+
+
+def main(output_dir, api_key, model_name, host="127.0.0.1", port=8000, workers=1,
+         embedding_backend=DEFAULT_EMBEDDING_BACKEND, search_index_dir=None,
+         num_threads=None, artifact_store_dir=None, artifact_store_max_gb=20,
+         embedding_cache_dir=None):
+    """Run the job queue service until it is interrupted.
+
+    Args:
+        output_dir (str): The directory to save the outputs and the job database.
+        api_key (str): The API key for openai API.
+        model_name (str): The model name used as blog generator.
+        host (str, optional): The host to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on. Defaults to 8000.
+        workers (int, optional): The number of worker threads. Defaults to 1.
+        embedding_backend (str, optional): The name of the embedding backend.
+            Defaults to "mpnet".
+        search_index_dir (str, optional): The directory of the search index
+            to add every video to. Defaults to None.
+        num_threads (int, optional): The number of CPU threads shared by all
+            jobs. Defaults to the number of cores.
+        artifact_store_dir (str, optional): The directory of the artifact
+            store, or None to not store artifacts. Defaults to None.
+        artifact_store_max_gb (float, optional): The maximum size of the
+            artifact store in GB. Defaults to 20.
+        embedding_cache_dir (str, optional): The directory that caches the
+            embeddings of the frame texts for later jobs, or None to cache
+            them in memory only. Defaults to None.
+    """
+    os.environ["OPENAI_API_KEY"] = api_key
+    # The workers share one budget, so concurrent jobs split the cores.
+    resource_manager = ResourceManager(total_threads=num_threads)
+    resource_manager.configure_environment()
+    artifact_store = None
+    if artifact_store_dir is not None:
+        artifact_store = ArtifactStore(
+            artifact_store_dir, max_bytes=int(artifact_store_max_gb * 1024 ** 3),
+        )
+    os.makedirs(output_dir, exist_ok=True)
+
+    job_store = JobStore(os.path.join(output_dir, "jobs.sqlite3"))
+    worker_pool = JobWorkerPool(
+        job_store,
+        lambda: Pipeline(output_dir=output_dir, model_name=model_name,
+                         embedding_backend=embedding_backend,
+                         search_index_dir=search_index_dir,
+                         resource_manager=resource_manager,
+                         artifact_store=artifact_store,
+                         embedding_cache_dir=embedding_cache_dir,
+                         # Short videos of concurrent jobs are decoded together.
+                         clip_batch_wait=CLIP_BATCH_WAIT if workers > 1 else None),
+        n_workers=workers,
+    )
+    worker_pool.start()
+    server = create_server(job_store, host=host, port=port)
+    utils.logging.info(f"Serving job queue on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        utils.logging.info("Shutting down")
+    finally:
+        server.server_close()
+        worker_pool.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    args_call()
@@ -1,11 +1,21 @@
-# noqa: D104
+"""The stages of Essence Extractor.
 
-from . import utils
-from .blog_generator import BlogGenerator
-from .blog_media_enhancer import BlogMediaEnhancer
-from .cost_management import CostManager
-from .downloader import YouTubeDownloader
-from .transcriber import Transcriber
+The classes are imported when they are first accessed, so importing a single
+module such as ``essence_extractor.src.utils`` does not import the heavy
+dependencies of every stage.
+"""
+
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "utils": ".utils",
+    "BlogGenerator": ".blog_generator",
+    "BlogMediaEnhancer": ".blog_media_enhancer",
+    "CostManager": ".cost_management",
+    "YouTubeDownloader": ".downloader",
+    "Pipeline": ".pipeline",
+    "Transcriber": ".transcriber",
+}
 
 __all__ = ["YouTubeDownloader",
            "Transcriber",
@@ -13,4 +23,20 @@ __all__ = ["YouTubeDownloader",
            "BlogMediaEnhancer",
            "utils",
            "CostManager",
+           "Pipeline",
            ]
+
+
+def __getattr__(name):
+    """Import a class of the package on first access."""
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+    value = module if name == "utils" else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """List the attributes of the package, including the lazy ones."""
+    return sorted(set(globals()) | set(__all__))
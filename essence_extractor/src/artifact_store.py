@@ -0,0 +1,337 @@
+"""A local store of downloads, audio and transcripts shared between runs."""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+
+from essence_extractor.src import metrics, utils
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+DEFAULT_ARTIFACT_STORE_DIR = os.path.join(utils.DEFAULT_CACHE_DIR, "artifacts")
+# The ioctl that clones a file on copy-on-write file systems such as Btrfs and XFS.
+FICLONE = 0x40049409
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """Hash the content of a file.
+
+    Args:
+        file_path (str): The path to the file.
+        chunk_size (int, optional): The number of bytes read at once.
+
+    Returns:
+        str: The hex digest of the SHA-256 hash.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source_path, target_path):
+    """Make a file available at another path without copying it if possible.
+
+    The file is hardlinked, or reflinked if it is on another device of a
+    copy-on-write file system, and only copied as a last resort. The target
+    is replaced atomically.
+
+    Args:
+        source_path (str): The path to the existing file.
+        target_path (str): The path to make the file available at.
+
+    Returns:
+        str: How the file was made available, "hardlink", "reflink" or "copy".
+    """
+    partial_path = os.path.join(
+        os.path.dirname(target_path), f".part-{os.path.basename(target_path)}",
+    )
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(partial_path)
+    try:
+        os.link(source_path, partial_path)
+        method = "hardlink"
+    except OSError:
+        method = "copy"
+        with open(source_path, "rb") as source, open(partial_path, "wb") as target:
+            if fcntl is not None:
+                try:
+                    fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                    method = "reflink"
+                except OSError:
+                    pass
+            if method == "copy":
+                shutil.copyfileobj(source, target)
+    os.replace(partial_path, target_path)
+    return method
+
+
+class ArtifactStore:
+    """Stores the files a run produces so later runs can reuse them.
+
+    Artifacts are keyed by the kind of file, the id of the video and the
+    parameters that produced it, such as the stream profile or the ASR model.
+    A hit is linked into the workspace of the run instead of being computed
+    again. Stored files are read-only, so a hardlinked copy cannot change
+    the artifact, and their size and SHA-256 hash are recorded to detect
+    corrupted artifacts. Once the store grows beyond ``max_bytes``, the
+    least recently used artifacts are evicted.
+
+    Attributes:
+        store_dir (str): The directory the artifacts are stored in.
+        max_bytes (int): The maximum total size of the artifacts.
+        verify_hashes (bool): Whether to check the hash of an artifact on
+            every hit, not only its size.
+        hits (int): The number of artifacts served from the store.
+        misses (int): The number of artifacts that had to be computed.
+        corrupted (int): The number of artifacts dropped because they were
+            missing or changed.
+        evictions (int): The number of artifacts evicted to stay in budget.
+    """
+
+    DB_FILE_NAME = "artifacts.sqlite3"
+    LOCK_FILE_NAME = "artifacts.lock"
+    OBJECTS_DIR_NAME = "objects"
+
+    def __init__(self, store_dir, max_bytes=20 * 1024 ** 3, verify_hashes=False):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.verify_hashes = verify_hashes
+        self.hits = 0
+        self.misses = 0
+        self.corrupted = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        os.makedirs(os.path.join(store_dir, self.OBJECTS_DIR_NAME), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+                """,
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(
+            os.path.join(self.store_dir, self.DB_FILE_NAME), timeout=30,
+            isolation_level=None,
+        )
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Locks the store against other threads and processes."""
+        lock_path = os.path.join(self.store_dir, self.LOCK_FILE_NAME)
+        with self._lock, open(lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def key(kind, video_id, params=None):
+        """Create the key of an artifact.
+
+        Args:
+            kind (str): The kind of artifact, such as "video" or "transcript".
+            video_id (str): The id of the video.
+            params (dict, optional): The parameters that produced the artifact.
+
+        Returns:
+            str: The key of the artifact.
+        """
+        description = json.dumps(
+            {"kind": kind, "video_id": video_id, "params": params or {}},
+            sort_keys=True,
+        )
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+    def _object_path(self, key, file_name):
+        return os.path.join(
+            self.store_dir, self.OBJECTS_DIR_NAME, key[:2], key, file_name,
+        )
+
+    def _remove(self, connection, row):
+        """Delete an artifact. Must be called with the store locked."""
+        connection.execute("DELETE FROM artifacts WHERE key = ?", (row["key"],))
+        shutil.rmtree(os.path.dirname(self._object_path(row["key"], row["file_name"])),
+                      ignore_errors=True)
+
+    def _is_intact(self, row):
+        """Check that a stored artifact still has its recorded content."""
+        object_path = self._object_path(row["key"], row["file_name"])
+        try:
+            if os.path.getsize(object_path) != row["size"]:
+                return False
+        except OSError:
+            return False
+        return not self.verify_hashes or file_sha256(object_path) == row["sha256"]
+
+    def get(self, key, target_dir):
+        """Link a stored artifact into a directory.
+
+        Args:
+            key (str): The key of the artifact.
+            target_dir (str): The directory to link the artifact into.
+
+        Returns:
+            str: The path to the linked artifact, or None if it is not stored.
+        """
+        with self._exclusive(), self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM artifacts WHERE key = ?", (key,),
+            ).fetchone()
+            if row is not None and not self._is_intact(row):
+                utils.logging.warning(
+                    f"Dropping corrupted {row['kind']} artifact of {row['video_id']}",
+                )
+                self._remove(connection, row)
+                self.corrupted += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.inc(cache="artifact", result="miss")
+                return None
+
+            os.makedirs(target_dir, exist_ok=True)
+            target_path = os.path.join(target_dir, row["file_name"])
+            link_or_copy(self._object_path(key, row["file_name"]), target_path)
+            connection.execute(
+                "UPDATE artifacts SET last_used_at = ? WHERE key = ?", (time.time(), key),
+            )
+            self.hits += 1
+        metrics.CACHE_LOOKUPS.inc(cache="artifact", result="hit")
+        utils.logging.info(f"Reusing stored {row['kind']} of {row['video_id']}")
+        return target_path
+
+    def put(self, key, file_path, kind="artifact", video_id=""):
+        """Store a file as an artifact.
+
+        Args:
+            key (str): The key of the artifact.
+            file_path (str): The path to the file.
+            kind (str, optional): The kind of artifact, for the log.
+            video_id (str, optional): The id of the video, for the log.
+        """
+        file_name = os.path.basename(file_path)
+        object_path = self._object_path(key, file_name)
+        with self._exclusive(), self._connect() as connection:
+            old_row = connection.execute(
+                "SELECT * FROM artifacts WHERE key = ?", (key,),
+            ).fetchone()
+            if old_row is not None:
+                self._remove(connection, old_row)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            link_or_copy(file_path, object_path)
+            os.chmod(object_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            now = time.time()
+            connection.execute(
+                "INSERT INTO artifacts (key, kind, video_id, file_name, size, sha256, "
+                "created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, video_id, file_name, os.path.getsize(object_path),
+                 file_sha256(object_path), now, now),
+            )
+            self._evict(connection, keep_key=key)
+
+    def _evict(self, connection, keep_key=None):
+        """Evict the least recently used artifacts beyond the size budget."""
+        total_bytes = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM artifacts",
+        ).fetchone()[0]
+        rows = connection.execute(
+            "SELECT * FROM artifacts WHERE key != ? ORDER BY last_used_at",
+            (keep_key or "",),
+        ).fetchall()
+        for row in rows:
+            if total_bytes <= self.max_bytes:
+                break
+            self._remove(connection, row)
+            total_bytes -= row["size"]
+            self.evictions += 1
+
+    def fetch_or_compute(self, key, target_dir, compute, kind="artifact", video_id=""):
+        """Get a stored artifact, or compute and store it.
+
+        Args:
+            key (str): The key of the artifact.
+            target_dir (str): The directory to link a stored artifact into.
+            compute (Callable): Produces the artifact and returns its path.
+            kind (str, optional): The kind of artifact, for the log.
+            video_id (str, optional): The id of the video, for the log.
+
+        Returns:
+            str: The path to the artifact.
+        """
+        stored_path = self.get(key, target_dir)
+        if stored_path is not None:
+            return stored_path
+        file_path = compute()
+        if file_path is not None and os.path.isfile(file_path):
+            self.put(key, file_path, kind=kind, video_id=video_id)
+        return file_path
+
+    def verify(self):
+        """Check the hash of every artifact and drop corrupted ones.
+
+        Returns:
+            int: The number of dropped artifacts.
+        """
+        n_dropped = 0
+        with self._exclusive(), self._connect() as connection:
+            for row in connection.execute("SELECT * FROM artifacts").fetchall():
+                object_path = self._object_path(row["key"], row["file_name"])
+                if (not os.path.isfile(object_path)
+                        or file_sha256(object_path) != row["sha256"]):
+                    self._remove(connection, row)
+                    n_dropped += 1
+        self.corrupted += n_dropped
+        return n_dropped
+
+    def stats(self):
+        """Describe the store.
+
+        Returns:
+            dict: The number and total size of the artifacts, and the hits,
+            misses, corrupted artifacts and evictions of this store object.
+        """
+        with self._connect() as connection:
+            n_artifacts, total_bytes = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts",
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "artifacts": n_artifacts,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "corrupted": self.corrupted,
+            "evictions": self.evictions,
+        }
@@ -1,13 +1,52 @@
 """Generate a blog post from a text file."""
 
 import os
+import re
 
-from openai import OpenAI
-
-from essence_extractor.src import data_models, utils
+from essence_extractor.src import data_models, metrics, utils
 from essence_extractor.src.cost_management import CostManager
 
+OpenAI = utils.lazy_import("openai", "OpenAI")
+
 OUTPUT_TOKEN_LENGTH_BUFFER = 1500
+REFINE_STRATEGIES = ("full", "sections")
+SECTION_HEADING_PATTERN = re.compile(r"^#{1,6}\s.*$", re.MULTILINE)
+TIMESTAMP_RANGE_PATTERN = re.compile(r"\[\d{1,2}:\d{2} - \d{1,2}:\d{2}\]")
+
+LLM_REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "llm_request_duration_seconds", "Latency of chat completion requests.", ["model"],
+)
+LLM_REQUEST_TOKENS = metrics.REGISTRY.histogram(
+    "llm_request_tokens", "Tokens of each chat completion request, as reported by "
+    "the provider.", ["model", "kind"], buckets=metrics.TOKEN_BUCKETS,
+)
+LLM_TOKENS = metrics.REGISTRY.counter(
+    "llm_tokens", "Tokens of all chat completion requests, as reported by the "
+    "provider.", ["model", "kind"],
+)
+
+BLOG_POST_INSTRUCTIONS = ("Your role is creating a finalized version "
+                          "of a ready to publish article based on given transcript. "
+                          "Write the article with a focus on educating the reader and"
+                          "a captivating introduction, body, and a concise conclusion, "
+                          "use markdown, than "
+                          "place each timestamp, formatted as [MM:SS], to "
+                          "the end of its relevant section using [MM:SS - MM:SS]."
+                          ".\n")
+# Requests of a session share the system message and the transcript as a
+# prefix, which the provider serves from its prompt cache after the first one.
+ARTIFACT_SYSTEM_MESSAGE = ("You turn the transcript of a video into written content. "
+                           "Every chunk of the transcript starts with its "
+                           "timestamp, formatted as [MM:SS].\n")
+ARTIFACT_INSTRUCTIONS = {
+    "blog_post": BLOG_POST_INSTRUCTIONS,
+    "summary": ("Summarize the video in one paragraph of three to five sentences, "
+                "without timestamps."),
+    "chapters": ("List the chapters of the video, one per line, formatted as "
+                 "[MM:SS] Title, using the timestamps of the transcript. "
+                 "Start with [00:00]."),
+}
+ARTIFACT_TYPES = tuple(ARTIFACT_INSTRUCTIONS)
 
 
 class BlogGenerator:
@@ -17,6 +56,15 @@ class BlogGenerator:
         model_name (str): The name of the model to use.
         output_path (str): The path to the output directory.
         cost_manager (CostManager): The cost manager.
+        refine_strategy (str): How the draft is refined with each chunk of the
+            transcript. "full" sends the whole draft and has the model write
+            it again. "sections" only sends the outline of the draft and has
+            the model write the new or changed sections, which are merged into
+            the draft, so the generated tokens grow linearly with the length
+            of the transcript.
+        topic_segmenter (TopicSegmenter): Splits the transcript into chunks
+            of whole topics, or None to split it wherever the token budget of
+            a request runs out.
     """
 
     def __init__(
@@ -24,7 +72,13 @@ class BlogGenerator:
             model_name=utils.DEFAULT_MODEL_NAME,
             output_path="blogs",
             cost_manager=None,
+            refine_strategy="full",
+            topic_segmenter=None,
     ):
+        if refine_strategy not in REFINE_STRATEGIES:
+            raise ValueError(f"Refine strategy must be one of {list(REFINE_STRATEGIES)}")
+        self.refine_strategy = refine_strategy
+        self.topic_segmenter = topic_segmenter
         self.model_name = data_models.LlmModelName(llm_name=model_name).llm_name
         self.output_path = output_path
         self.client = OpenAI()
@@ -50,6 +104,60 @@ class BlogGenerator:
             text = f.read()
         return text
 
+    def _record_usage(self, response, messages, answer):
+        """Add the tokens of a request to the cost manager and the metrics.
+
+        The usage reported by the provider is used if there is one, as it
+        includes the input tokens served from the prompt cache. Otherwise the
+        tokens are counted locally for the cost manager.
+
+        Args:
+            response: The response of the chat completions API.
+            messages (List[dict]): The messages of the request.
+            answer (str): The generated answer.
+        """
+        usage = getattr(response, "usage", None)
+        input_tokens = getattr(usage, "prompt_tokens", None)
+        if isinstance(input_tokens, int):
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None)
+            if not isinstance(cached_tokens, int):
+                cached_tokens = 0
+            output_tokens = usage.completion_tokens
+            for kind, tokens in [("input", input_tokens), ("output", output_tokens)]:
+                LLM_REQUEST_TOKENS.observe(tokens, model=self.model_name, kind=kind)
+            for kind, tokens in [("input", input_tokens - cached_tokens),
+                                 ("cached_input", cached_tokens),
+                                 ("output", output_tokens)]:
+                LLM_TOKENS.inc(tokens, model=self.model_name, kind=kind)
+            if self.cost_manager is not None:
+                self.cost_manager.calculate_cost_usage(
+                    input_tokens, output_tokens, cached_input_tokens=cached_tokens,
+                )
+            return
+        if self.cost_manager is None:
+            return
+        for message in messages:
+            self.cost_manager.calculate_cost_text(message["content"], is_input=True)
+        self.cost_manager.calculate_cost_text(answer or "", is_input=False)
+
+    def _chat(self, messages):
+        """Generate an answer to a list of messages.
+
+        Args:
+            messages (List[dict]): The messages, each with a role and content.
+
+        Returns:
+            str: The generated answer.
+        """
+        with LLM_REQUEST_SECONDS.time(model=self.model_name):
+            response = self.client.chat.completions.create(
+                model=self.model_name, messages=messages,
+            )
+        answer = response.choices[0].message.content
+        self._record_usage(response, messages, answer)
+        return answer
+
     def _generate_answer(self, system_prompt, user_prompt):
         """Generate an answer from a prompt.
 
@@ -60,14 +168,10 @@ class BlogGenerator:
         Returns:
             str: The generated answer.
         """
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        )
-        return response.choices[0].message.content
+        return self._chat([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ])
 
     def _split_into_first_chunk(self, text, chunk_size, separator=" "):
         """Split text into the first chunk of a given size.
@@ -96,6 +200,9 @@ class BlogGenerator:
     def _create_refine_prompt(self, existing_answer, text):
         """Create a prompt for refining an existing answer.
 
+        The instructions come first and the draft last, so consecutive
+        prompts share a prefix the provider can cache.
+
         Args:
             existing_answer (str): The existing answer.
             text (str): The text to refine the answer with.
@@ -104,72 +211,253 @@ class BlogGenerator:
             str: The prompt for refining the answer.
         """
         return (
-            f"We have provided an existing blog article "
-            f"up to a certain point: {existing_answer}\n"
-            "We have the opportunity to refine the existing blog article"
-            "(only if needed) with some more context below.\n"
+            "We have the opportunity to refine an existing blog article, "
+            "written up to a certain point, (only if needed) with the new "
+            "context between the lines below. Given the new context, refine the "
+            "original blog article. If the context isn't useful, return the "
+            "original blog article.\n"
             "------------\n"
             f"{text}\n"
             "------------\n"
-            "Given the new context, refine the original blog article"
-            "If the context isn't useful, return the original blog article."
+            f"The existing blog article: {existing_answer}"
         )
 
-    def generate_article_content(self, text_file_path):
+    def _create_section_refine_prompt(self, outline, text):
+        """Create a prompt for adding the sections of a chunk to a draft.
+
+        Args:
+            outline (str): The outline of the draft.
+            text (str): The text to add to the draft.
+
+        Returns:
+            str: The prompt for writing the new or changed sections.
+        """
+        return (
+            "We are writing a blog article from a transcript, one part at a time. "
+            "Write only the sections that the next part of the transcript, "
+            "between the lines below, adds to the article, or that it changes, "
+            "each starting with its markdown heading. To change a section, repeat "
+            "its heading exactly and write the whole section. Do not repeat "
+            "sections that stay the same. If the part adds nothing, return "
+            "nothing.\n"
+            "------------\n"
+            f"{text}\n"
+            "------------\n"
+            f"The article so far has these sections:\n{outline}"
+        )
+
+    @staticmethod
+    def _split_sections(markdown):
+        """Split markdown into sections at its headings.
+
+        Args:
+            markdown (str): The markdown.
+
+        Returns:
+            List[Tuple[str, str]]: The heading and the whole markdown of each
+            section. Text before the first heading is a section without a
+            heading.
+        """
+        starts = [match.start() for match in SECTION_HEADING_PATTERN.finditer(markdown)]
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        sections = []
+        for start, end in zip(starts, starts[1:] + [len(markdown)]):
+            section = markdown[start:end].strip()
+            if not section:
+                continue
+            first_line = section.splitlines()[0]
+            heading = first_line if SECTION_HEADING_PATTERN.match(first_line) else ""
+            sections.append((heading, section))
+        return sections
+
+    @staticmethod
+    def _section_key(heading):
+        """Normalize a heading, so a changed section matches its original.
+
+        Args:
+            heading (str): The markdown heading.
+
+        Returns:
+            str: The lowercase words of the heading, without its timestamps.
+        """
+        heading = TIMESTAMP_RANGE_PATTERN.sub("", heading)
+        return " ".join(re.findall(r"\w+", heading.lower()))
+
+    def _create_outline(self, blog_post):
+        """List the headings of a draft with the time ranges they cover.
+
+        Args:
+            blog_post (str): The draft of the blog post.
+
+        Returns:
+            str: One line per section.
+        """
+        lines = []
+        for heading, section in self._split_sections(blog_post):
+            body = section[len(heading):]
+            timestamps = " ".join(TIMESTAMP_RANGE_PATTERN.findall(body))
+            lines.append(f"{heading or '(introduction)'} {timestamps}".strip())
+        return "\n".join(lines) or "(none yet)"
+
+    def _merge_sections(self, blog_post, new_sections):
+        """Merge new and changed sections into a draft.
+
+        A section whose heading matches a section of the draft replaces it,
+        and other sections are added at the end, before the conclusion.
+
+        Args:
+            blog_post (str): The draft of the blog post.
+            new_sections (str): The sections written for the next chunk.
+
+        Returns:
+            str: The merged draft.
+        """
+        sections = self._split_sections(blog_post)
+        for heading, section in self._split_sections(new_sections):
+            key = self._section_key(heading)
+            keys = [self._section_key(old_heading) for old_heading, _ in sections]
+            if key and key in keys:
+                sections[keys.index(key)] = (heading, section)
+            elif keys and keys[-1].startswith("conclusion"):
+                sections.insert(len(sections) - 1, (heading, section))
+            else:
+                sections.append((heading, section))
+        return "\n\n".join(section for _, section in sections)
+
+    def generate_article_content(self, text_file_path, checkpoint=None):
         """Generate a blog post from a text file.
 
+        The text is sent in chunks that fill the token budget of a request,
+        each refining the draft of the chunks before. With a topic segmenter,
+        the chunks are made of whole topics instead of being cut at a word.
+
         Args:
             text_file_path (str): The path to the text file.
+            checkpoint (RunManifest, optional): Saves the draft after every
+                chunk and resumes an interrupted run from the last one.
 
         Returns:
             str: The path to the generated blog post.
         """
         input_text = self._read_text_file(text_file_path)
-        system_message = ("Your role is creating a finalized version "
-                          "of a ready to publish article based on given transcript. "
-                          "Write the article with a focus on educating the reader and"
-                          "a captivating introduction, body, and a concise conclusion, "
-                          "use markdown, than "
-                          "place each timestamp, formatted as [MM:SS], to "
-                          "the end of its relevant section using [MM:SS - MM:SS]."
-                          ".\n")
+        system_message = BLOG_POST_INSTRUCTIONS
         system_msg_length = self.token_counter.count_tokens(system_message)
 
-        user_msg_length = self.token_counter.count_tokens(
-            self._create_refine_prompt("", ""),
-        )
-        chunk_size = (
-                self.token_counter.model_token_length -
-                system_msg_length -
-                user_msg_length -
-                OUTPUT_TOKEN_LENGTH_BUFFER
-        )
+        sections = self.refine_strategy == "sections"
+        if sections:
+            create_prompt = self._create_section_refine_prompt
+        else:
+            create_prompt = self._create_refine_prompt
+        user_msg_length = self.token_counter.count_tokens(create_prompt("", ""))
 
         blog_post = ""
-        while input_text:
-            chunk = self._split_into_first_chunk(input_text, chunk_size)
-            user_message = self._create_refine_prompt(blog_post, chunk)
-
-            if self.cost_manager:
-                self.cost_manager.calculate_cost_text(user_message, is_input=True)
-
-            blog_post = self._generate_answer(system_message, user_message)
-            blog_post_length = self.token_counter.count_tokens(blog_post)
-            if self.cost_manager:
-                self.cost_manager.calculate_cost_token(blog_post_length, is_input=False)
+        refine_state = None
+        if checkpoint is not None:
+            refine_state = checkpoint.load_refine_state()
+        if refine_state is not None:
+            blog_post, input_text = refine_state
+            utils.logging.info("Resuming blog post generation from the last chunk")
+        topics = None
+        if self.topic_segmenter is not None:
+            topics = self.topic_segmenter.segment(input_text)
+            utils.logging.info(f"Split the transcript into {len(topics)} topics")
 
+        while input_text:
+            # The part of the draft that is sent along with the next chunk
+            draft = self._create_outline(blog_post) if sections else blog_post
             chunk_size = (
                     self.token_counter.model_token_length -
                     system_msg_length -
                     user_msg_length -
-                    blog_post_length -
+                    self.token_counter.count_tokens(draft) -
                     OUTPUT_TOKEN_LENGTH_BUFFER
             )
-
-            input_text = input_text.replace(chunk, "")
+            if topics is None:
+                chunk = self._split_into_first_chunk(input_text, chunk_size)
+            else:
+                chunk, topics = self.topic_segmenter.first_chunk(
+                    topics, chunk_size, self.token_counter.count_tokens,
+                )
+            user_message = create_prompt(draft, chunk)
+            answer = self._generate_answer(system_message, user_message)
+            blog_post = self._merge_sections(blog_post, answer) if sections else answer
+
+            # Every chunk is a prefix of the remaining text. Removing it by
+            # position keeps later passages that repeat it word for word.
+            input_text = input_text[len(chunk):]
+            if checkpoint is not None:
+                checkpoint.save_refine_state(blog_post, input_text)
 
         return blog_post
 
+    def _artifact_messages(self, context, artifact_type):
+        """Create the messages that generate one artifact from a context.
+
+        Args:
+            context (str): The transcript, or the blog post, of the video.
+            artifact_type (str): The type of the artifact.
+
+        Returns:
+            List[dict]: The messages. All but the last are the same for every
+            artifact type.
+        """
+        return [
+            {"role": "system", "content": ARTIFACT_SYSTEM_MESSAGE},
+            {"role": "user", "content": context},
+            {"role": "user", "content": ARTIFACT_INSTRUCTIONS[artifact_type]},
+        ]
+
+    def generate_artifacts(self, text_file_path, artifact_types=ARTIFACT_TYPES,
+                           checkpoint=None):
+        """Generate several artifacts, such as a blog post and a summary, at once.
+
+        The requests of all artifacts start with the same system message and
+        transcript and only differ in their last message, so the provider
+        serves the transcript from its prompt cache after the first request.
+        A transcript too long for one request is turned into a blog post
+        with ``generate_article_content`` first, and the other artifacts are
+        generated from the blog post.
+
+        Args:
+            text_file_path (str): The path to the transcript.
+            artifact_types (Iterable[str], optional): The artifacts to generate,
+                out of "blog_post", "summary" and "chapters". Defaults to all.
+            checkpoint (RunManifest, optional): Saves the draft of a blog post
+                generated chunk by chunk. See ``generate_article_content``.
+
+        Returns:
+            dict: Maps each artifact type to the generated text.
+        """
+        artifact_types = list(artifact_types)
+        unknown_types = set(artifact_types) - set(ARTIFACT_INSTRUCTIONS)
+        if unknown_types:
+            raise ValueError(f"Unknown artifact types: {sorted(unknown_types)}")
+
+        context = f"Transcript of the video:\n{self._read_text_file(text_file_path)}"
+        max_context_length = (
+                self.token_counter.model_token_length -
+                self.token_counter.count_tokens(ARTIFACT_SYSTEM_MESSAGE) -
+                max(self.token_counter.count_tokens(instructions)
+                    for instructions in ARTIFACT_INSTRUCTIONS.values()) -
+                OUTPUT_TOKEN_LENGTH_BUFFER
+        )
+        artifacts = {}
+        if self.token_counter.count_tokens(context) > max_context_length:
+            utils.logging.info("The transcript does not fit into one request, "
+                               "generating the other artifacts from the blog post")
+            artifacts["blog_post"] = self.generate_article_content(
+                text_file_path, checkpoint=checkpoint,
+            )
+            context = f"Blog article about the video:\n{artifacts['blog_post']}"
+
+        for artifact_type in artifact_types:
+            if artifact_type not in artifacts:
+                artifacts[artifact_type] = self._chat(
+                    self._artifact_messages(context, artifact_type),
+                )
+        return {name: artifacts[name] for name in artifact_types}
+
     def add_image_placeholder(self, blog_content):
         """Adds image placeholder to the blog content.
 
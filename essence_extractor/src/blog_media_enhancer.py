@@ -1,88 +1,633 @@
 """Adds images to a blog post based on the content of the blog post."""
 
+import io
+import itertools
 import math
+import multiprocessing
 import os
+import queue
 import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import faiss
 import numpy as np
-import pytesseract
-from moviepy.editor import VideoFileClip
-from sentence_transformers import SentenceTransformer
+from PIL import Image
 
-from essence_extractor.src import utils
+from essence_extractor.src import metrics, utils
 from essence_extractor.src.data_models import YouTubeURL
+from essence_extractor.src.embedding_backends import (
+    DEFAULT_EMBEDDING_BACKEND,
+    get_embedding_backend,
+)
+from essence_extractor.src.embedding_cache import EmbeddingCache
+from essence_extractor.src.frame_ring_buffer import SharedFrameRingBuffer
+from essence_extractor.src.text_detector import TextPresenceDetector
+
+faiss = utils.lazy_import("faiss")
+pytesseract = utils.lazy_import("pytesseract")
+VideoFileClip = utils.lazy_import("moviepy.editor", "VideoFileClip")
+
+IMAGE_FORMATS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+FRAME_NAME_PATTERN = re.compile(r"^frame_at_(\d+)_seconds\.\w+$")
+TIMESTAMP_RANGE_PATTERN = re.compile(r"\[(\d{1,2}):(\d{2}) - (\d{1,2}):(\d{2})\]")
+IMAGE_TAG_PATTERN = re.compile(r'(!\[.*?\]\(\s*.*?\s*(?: ".*?")?\s*\))')
+RETRIEVAL_MODES = ("timestamp", "full")
+# Starting a reader process takes about a second, so short videos are
+# decoded in this process.
+MIN_SECONDS_PER_READER = 300
+
+OCR_FRAMES = metrics.REGISTRY.counter(
+    "ocr_frames", "Video frames decoded, read with OCR and embedded.",
+)
+OCR_SKIPPED_FRAMES = metrics.REGISTRY.counter(
+    "ocr_skipped_frames", "Video frames OCR skipped because they show no text.",
+)
+OCR_FRAMES_PER_SECOND = metrics.REGISTRY.histogram(
+    "ocr_frames_per_second", "Frames indexed per second by each call of "
+    "index_video_frames.", buckets=metrics.FRAMES_PER_SECOND_BUCKETS,
+)
+
+
+def image_to_text(img, threads=1):
+    """Reads the text of an image with Tesseract.
+
+    The OpenMP thread limit of Tesseract is only set in the environment of
+    the Tesseract process, because OMP_THREAD_LIMIT in this process would
+    also cap the intra-op threads of torch.
+
+    Args:
+        img (Union[np.ndarray, PIL.Image]): The image.
+        threads (int, optional): The number of threads Tesseract may use.
+            Defaults to 1, for OCR worker processes that already run in
+            parallel over frames.
+
+    Returns:
+        str: The text of the image.
+
+    Raises:
+        pytesseract.TesseractNotFoundError: If Tesseract is not installed.
+        subprocess.CalledProcessError: If Tesseract fails.
+    """
+    if isinstance(img, np.ndarray):
+        img = Image.fromarray(img)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    env = dict(os.environ, OMP_THREAD_LIMIT=str(threads))
+    try:
+        completed = subprocess.run(
+            [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout"],
+            input=buffer.getvalue(), capture_output=True, env=env, check=True,
+        )
+    except FileNotFoundError as e:
+        raise pytesseract.TesseractNotFoundError() from e
+    return completed.stdout.decode("utf-8")
+
+
+def extract_text_from_frame(img, text_detector=None, crop_to_text=True, threads=1):
+    """Extracts text from a frame.
+
+    Frames that are unlikely to contain text are skipped, and OCR only reads
+    the part of the frame where text was detected.
+
+    Args:
+        img (Union[np.ndarray, PIL.Image]): The frame to extract text from.
+        text_detector (TextPresenceDetector, optional): Skips frames without
+            text. Defaults to running OCR on every frame.
+        crop_to_text (bool, optional): Whether OCR only reads the detected
+            text regions. Defaults to True.
+        threads (int, optional): The number of threads Tesseract may use.
+            Defaults to 1.
+
+    Returns:
+        Tuple[str, bool]: The extracted text, and whether the frame was
+        skipped because it shows no text.
+    """
+    if text_detector is not None and isinstance(img, np.ndarray):
+        regions = text_detector.detect_text_regions(img)
+        if not regions:
+            return "", True
+        if crop_to_text:
+            top, left, bottom, right = text_detector.bounding_box(regions)
+            img = img[top:bottom, left:right]
+    try:
+        text = image_to_text(img, threads)
+    except Exception as e:
+        utils.logging.info(f"Error processing {e}")
+        text = ""
+    return text, False
+
+
+def ocr_worker(ring_buffer, tasks, results, text_detector=None, crop_to_text=True):
+    """Runs OCR on the frames of a shared ring buffer in a worker process.
+
+    The worker reads each frame as a view of its slot and releases the slot
+    as soon as the text is extracted.
+
+    Args:
+        ring_buffer (SharedFrameRingBuffer): The buffer the frames are in.
+        tasks (multiprocessing.Queue): The slot and name of every frame,
+            followed by None once there are no more frames.
+        results (multiprocessing.Queue): Receives the name, the text and
+            whether the frame was skipped as without text, for every frame.
+        text_detector (TextPresenceDetector, optional): Skips frames without
+            text.
+        crop_to_text (bool, optional): Whether OCR only reads the detected
+            text regions. Defaults to True.
+    """
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            slot, img_name = task
+            try:
+                text, skipped = extract_text_from_frame(
+                    ring_buffer.view(slot), text_detector, crop_to_text,
+                )
+            finally:
+                ring_buffer.release(slot)
+            results.put((img_name, text, skipped))
+    finally:
+        ring_buffer.close()
+
+
+def frame_reader(video_file_path, timestamps, ring_buffer, results):
+    """Decodes the frames at a range of timestamps in a reader process.
+
+    Args:
+        video_file_path (str): The path to the video file.
+        timestamps (List[int]): The timestamps of the frames, in seconds.
+        ring_buffer (SharedFrameRingBuffer): The buffer to write the frames to.
+        results (multiprocessing.Queue): Receives the timestamp and slot of
+            every frame, followed by None once the range is decoded.
+    """
+    video = VideoFileClip(video_file_path)
+    try:
+        for timestamp in timestamps:
+            frame = video.get_frame(timestamp)
+            slot = ring_buffer.acquire()
+            ring_buffer.write(slot, frame)
+            results.put((timestamp, slot))
+        results.put(None)
+    finally:
+        video.close()
+        ring_buffer.close()
 
 
 class BlogMediaEnhancer:
     """Adds images to a blog post based on the content of the blog post.
 
+    Frames are only written to disk once they are chosen for the blog post,
+    resized to at most ``max_image_width`` and compressed as ``image_format``.
+
+    In the "timestamp" retrieval mode, each image placeholder is matched only
+    against frames inside the ``[MM:SS - MM:SS]`` range of its section, so
+    only those frames are extracted and read. Placeholders without a range
+    fall back to the "full" mode, which searches every frame of the video.
+
     Attributes:
         output_path (str): The path to the output directory.
+        embedding_cache_dir (str): The directory of the on-disk embedding
+            cache, or None to cache embeddings in memory only.
+        image_format (str): The format of the written images, one of "jpeg",
+            "webp" or "png".
+        max_image_width (int): The maximum width of the written images, in
+            pixels, or None to keep the width of the video.
+        image_quality (int): The quality of lossy image formats, from 1 to 100.
+        retrieval_mode (str): How frames are searched for a placeholder,
+            "timestamp" or "full".
+        frames_per_window (int): The minimum number of frames sampled from
+            the timestamp range of a section.
+        text_detector (TextPresenceDetector): Skips OCR on frames without
+            text, or None to run OCR on every frame.
+        crop_to_text (bool): Whether OCR only reads the detected text regions.
+        embedding_backend: Embeds the OCR and alt texts. See
+            embedding_backends.EMBEDDING_BACKENDS for the available backends.
+        ocr_workers (int): The number of processes that run OCR on the frames,
+            or 0 to run OCR in this process. Frames reach the workers through
+            a shared memory ring buffer.
+        resource_manager (ResourceManager): Sizes the thread pools to the
+            thread budget of the running stage, or None to use up to 4 threads.
+        frame_reader_processes (Union[int, str]): The number of processes that
+            decode the frames of a video, each from its own range of the
+            video, or "auto" to choose it from the length of the video and the
+            available cores.
     """
-    def __init__(self, output_path='images'):
+    def __init__(
+            self,
+            output_path='images',
+            embedding_cache_dir=None,
+            image_format="jpeg",
+            max_image_width=1280,
+            image_quality=85,
+            retrieval_mode="timestamp",
+            frames_per_window=3,
+            use_text_prefilter=True,
+            crop_to_text=True,
+            embedding_backend=DEFAULT_EMBEDDING_BACKEND,
+            resource_manager=None,
+            ocr_workers=0,
+            frame_reader_processes=1,
+    ):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Image format must be one of {list(IMAGE_FORMATS)}")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Retrieval mode must be one of {list(RETRIEVAL_MODES)}")
+        self.retrieval_mode = retrieval_mode
+        self.frames_per_window = frames_per_window
+        self.text_detector = TextPresenceDetector() if use_text_prefilter else None
+        self.crop_to_text = crop_to_text
+        self.resource_manager = resource_manager
+        self.ocr_workers = ocr_workers
+        if frame_reader_processes != "auto" and frame_reader_processes < 1:
+            raise ValueError('Frame reader processes must be at least 1 or "auto"')
+        self.frame_reader_processes = frame_reader_processes
         self.output_path = output_path
+        self.image_format = image_format
+        self.max_image_width = max_image_width
+        self.image_quality = image_quality
         self.image_dir_name = 'images'
         self.image_output_path = os.path.join(output_path, self.image_dir_name)
-        self.model = SentenceTransformer(
-            'sentence-transformers/paraphrase-multilingual-mpnet-base-v2',
+        self.embedding_backend = get_embedding_backend(embedding_backend)
+        self.embedding_cache = EmbeddingCache(
+            self.embedding_backend.cache_key, cache_dir=embedding_cache_dir,
         )
         if not os.path.exists(self.image_output_path):
             os.makedirs(self.image_output_path)
 
-    def _extract_images(self, video_file_path, interval=10):
+    def _extract_images(self, video_file_path, interval=10, start=0, end=None):
         """Extracts images from the video at the specified interval.
 
+        Frames are decoded lazily, one at a time, so the memory used does not
+        depend on the length of the video. With several frame reader
+        processes, each decodes its own range of the video and the frames
+        arrive in the order they are decoded.
+
         Args:
             video_file_path (str): The path to the video file.
             interval (int): The interval at which to extract images, in seconds.
+            start (int): The timestamp of the first image, in seconds.
+            end (int, optional): The last timestamp to extract an image at,
+                in seconds. Defaults to the end of the video.
 
         Returns:
-            List[str]: A list of paths to the extracted images.
+            Iterator[Tuple[str, np.array]]: The name and frame of each image.
         """
         if not isinstance(interval, int) or interval <= 0:
             raise ValueError("Interval must be a positive integer")
 
-        if not os.path.exists(self.image_output_path):
-            os.makedirs(self.image_output_path)
-
         video = VideoFileClip(video_file_path)
         duration = video.duration
 
         if interval > duration:
+            video.close()
             raise ValueError("Interval cannot be longer than the video duration")
 
-        extracted_images = {}
+        stop = math.ceil(duration) if end is None else min(math.ceil(duration), end + 1)
+        timestamps = list(range(start, stop, interval))
+        n_readers = self._frame_reader_count(stop - start, len(timestamps))
+
+        def iter_frames():
+            try:
+                for i in timestamps:
+                    yield self._frame_image_name(i), video.get_frame(i)
+            finally:
+                video.close()
+
+        if n_readers <= 1:
+            return iter_frames()
+        # The first frame gives the shape of the shared slots.
+        first_frame = video.get_frame(timestamps[0])
+        video.close()
+        return itertools.chain(
+            [(self._frame_image_name(timestamps[0]), first_frame)],
+            self._extract_images_in_readers(
+                video_file_path, timestamps[1:], n_readers, first_frame,
+            ),
+        )
+
+    def _frame_reader_count(self, duration, n_frames):
+        """Chooses the number of processes that decode the frames of a video.
+
+        Args:
+            duration (float): The length of the decoded range, in seconds.
+            n_frames (int): The number of frames to decode.
+
+        Returns:
+            int: The number of reader processes, or 1 to decode in this process.
+        """
+        if self.frame_reader_processes != "auto":
+            return max(1, min(self.frame_reader_processes, n_frames - 1))
+        if self.resource_manager is None:
+            cores = os.cpu_count() or 1
+        else:
+            cores = self.resource_manager.threads()
+        return max(1, min(cores, int(duration // MIN_SECONDS_PER_READER), n_frames - 1))
+
+    def _extract_images_in_readers(self, video_file_path, timestamps, n_readers,
+                                   first_frame, n_slots_per_reader=2):
+        """Decodes frames in reader processes, each from its own range of the video.
+
+        The timestamps are split into contiguous ranges, and every reader
+        seeks to the start of its range. Frames come back through a shared
+        memory ring buffer, and readers wait while all slots are in use.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            timestamps (List[int]): The timestamps of the frames, in seconds.
+            n_readers (int): The number of reader processes.
+            first_frame (np.ndarray): A frame of the video, for its shape.
+            n_slots_per_reader (int, optional): The number of decoded frames
+                that can wait for each reader. Defaults to 2.
+
+        Yields:
+            Tuple[str, np.ndarray]: The name and frame of each image, in the
+            order they are decoded.
+        """
+        utils.logging.info(f"Decoding {len(timestamps) + 1} frames in "
+                           f"{n_readers} reader processes")
+        context = multiprocessing.get_context("spawn")
+        ring_buffer = SharedFrameRingBuffer(
+            n_readers * n_slots_per_reader, first_frame.shape, first_frame.dtype,
+            context=context,
+        )
+        results = context.Queue()
+        readers = [
+            context.Process(
+                target=frame_reader,
+                args=(video_file_path, [int(t) for t in shard], ring_buffer, results),
+                daemon=True,
+            )
+            for shard in np.array_split(np.array(timestamps, dtype=int), n_readers)
+        ]
+        for reader in readers:
+            reader.start()
+
+        n_done = 0
+        try:
+            while n_done < len(readers):
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    if any(reader.exitcode not in (None, 0) for reader in readers):
+                        raise RuntimeError("A frame reader process failed")
+                    continue
+                if result is None:
+                    n_done += 1
+                    continue
+                timestamp, slot = result
+                frame = np.array(ring_buffer.view(slot))
+                ring_buffer.release(slot)
+                yield self._frame_image_name(timestamp), frame
+        finally:
+            for reader in readers:
+                if n_done < len(readers):
+                    reader.terminate()
+                reader.join()
+            ring_buffer.close()
+
+    @staticmethod
+    def _buffered(iterable, buffer_size):
+        """Produces the items of an iterable in a background thread.
+
+        At most ``buffer_size`` items wait in the buffer, so decoding the next
+        frames overlaps with processing the current one without holding more
+        than a fixed number of frames in memory.
+
+        Args:
+            iterable (Iterable): The items to produce.
+            buffer_size (int): The maximum number of buffered items.
+
+        Yields:
+            The items of the iterable, in order.
+        """
+        buffer = queue.Queue(maxsize=buffer_size)
+        stop_event = threading.Event()
+        end_of_items = object()
+
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for item in iterable:
+                    if not put(item):
+                        return
+                put(end_of_items)
+            except Exception as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is end_of_items:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop_event.set()
+            producer.join()
+
+    def _frame_image_name(self, timestamp):
+        """Creates the image name of the frame at a timestamp.
+
+        Args:
+            timestamp (int): The timestamp of the frame, in seconds.
+
+        Returns:
+            str: The image name.
+        """
+        return f'frame_at_{timestamp}_seconds.{IMAGE_FORMATS[self.image_format]}'
 
-        for i in range(0, math.ceil(duration), interval):
-            frame = video.get_frame(i)
-            frame_image_filename = f'frame_at_{i}_seconds.png'
-            frame_image_path = os.path.join(self.image_output_path, frame_image_filename)
-            video.save_frame(frame_image_path, t=i)
-            extracted_images[frame_image_filename] = frame
+    @staticmethod
+    def frame_timestamp(image_name):
+        """Finds the timestamp of the frame an image was taken from.
+
+        Args:
+            image_name (str): The image name.
+
+        Returns:
+            int: The timestamp of the frame, in seconds.
+        """
+        return int(FRAME_NAME_PATTERN.match(image_name).group(1))
+
+    def _save_image(self, frame, image_path):
+        """Resizes and compresses a frame and saves it.
+
+        Args:
+            frame (np.array): The RGB frame.
+            image_path (str): The path to save the image to.
+        """
+        image = Image.fromarray(np.asarray(frame, dtype=np.uint8))
+        if self.max_image_width and image.width > self.max_image_width:
+            height = round(image.height * self.max_image_width / image.width)
+            image = image.resize((self.max_image_width, height), Image.LANCZOS)
+        options = {} if self.image_format == "png" else {"quality": self.image_quality}
+        image.save(image_path, format=self.image_format.upper(), **options)
 
+    def _save_images(self, video_file_path, image_names, image_dir=None):
+        """Saves the frames chosen for the blog post.
+
+        The frames are decoded again from the video, so no frame has to be
+        kept in memory or written to disk before it is chosen. Encoding and
+        writing happen in parallel.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            image_names (List[str]): The names of the images to save.
+            image_dir (str, optional): The directory to save the images to.
+                Defaults to the image output path.
+        """
+        image_dir = image_dir or self.image_output_path
+        image_names = sorted(set(image_names))
+        if not image_names:
+            return
+        os.makedirs(image_dir, exist_ok=True)
+
+        video = VideoFileClip(video_file_path)
+        frames = [
+            video.get_frame(self.frame_timestamp(img_name))
+            for img_name in image_names
+        ]
         video.close()
 
-        return extracted_images
+        image_paths = [os.path.join(image_dir, img_name) for img_name in image_names]
+        if self.resource_manager is None:
+            max_workers = min(len(image_names), 4)
+        else:
+            max_workers = self.resource_manager.pool_size(len(image_names))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self._save_image, frames, image_paths))
+
+    def _ocr_threads(self):
+        """Gets the number of threads OCR may use in this process.
 
-    def _extract_text_from_image(self, img):
+        Returns:
+            int: The thread budget of the running stage, or the number of
+            cores without a resource manager.
+        """
+        if self.resource_manager is None:
+            return os.cpu_count() or 1
+        return self.resource_manager.threads()
+
+    def _extract_text_from_image(self, img, threads=None):
         """Extracts text from the given image.
 
+        Frames that are unlikely to contain text are skipped, and OCR only
+        reads the part of the frame where text was detected.
+
         Args:
             img (PIL.Image): The image to extract text from.
+            threads (int, optional): The number of threads Tesseract may use.
+                Defaults to the thread budget of the running stage.
 
         Returns:
-            str: The extracted text.
+            Tuple[str, bool]: The extracted text, and whether the image was
+            skipped because it shows no text.
+        """
+        return extract_text_from_frame(
+            img, self.text_detector, self.crop_to_text,
+            threads or self._ocr_threads(),
+        )
+
+    def _extract_texts_in_workers(self, images, n_workers, n_slots_per_worker=2):
+        """Extracts the text of frames in worker processes.
+
+        The frames are copied once into the slots of a shared memory ring
+        buffer, and only the slot indexes are sent to the workers. Decoding
+        waits while all slots are in use.
+
+        Args:
+            images (Iterator[Tuple[str, np.ndarray]]): The name and frame of
+                each image.
+            n_workers (int): The number of worker processes. Tesseract runs
+                single threaded in each of them.
+            n_slots_per_worker (int, optional): The number of frames that can
+                wait for each worker. Defaults to 2.
+
+        Yields:
+            Tuple[str, str, bool]: The name and text of each image, and
+            whether it was skipped as without text, in the order OCR finishes.
         """
+        first_image = next(images, None)
+        if first_image is None:
+            return
+        first_frame = np.asarray(first_image[1])
+        context = multiprocessing.get_context("spawn")
+        ring_buffer = SharedFrameRingBuffer(
+            n_workers * n_slots_per_worker, first_frame.shape,
+            first_frame.dtype, context=context,
+        )
+        tasks, results = context.Queue(), context.Queue()
+        workers = [
+            context.Process(
+                target=ocr_worker,
+                args=(ring_buffer, tasks, results, self.text_detector, self.crop_to_text),
+                daemon=True,
+            )
+            for _ in range(n_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        def check_workers():
+            if not all(worker.is_alive() for worker in workers):
+                raise RuntimeError("An OCR worker process died")
+
+        def receive(block):
+            while True:
+                try:
+                    result = results.get(timeout=1 if block else 0)
+                except queue.Empty:
+                    if not block:
+                        return
+                    check_workers()
+                    continue
+                yield result
+                if block:
+                    return
+
+        n_pending = 0
         try:
-            text = pytesseract.image_to_string(img)
-        except Exception as e:
-            utils.logging.info(f"Error processing {e}")
-            text = ""
-        return text
+            for img_name, frame in itertools.chain([first_image], images):
+                while True:
+                    try:
+                        slot = ring_buffer.acquire(timeout=1)
+                        break
+                    except queue.Empty:
+                        check_workers()
+                ring_buffer.write(slot, frame)
+                tasks.put((slot, img_name))
+                n_pending += 1
+                for result in receive(block=False):
+                    n_pending -= 1
+                    yield result
+            while n_pending:
+                for result in receive(block=True):
+                    n_pending -= 1
+                    yield result
+        finally:
+            for _ in workers:
+                tasks.put(None)
+            for worker in workers:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+            ring_buffer.close()
 
     def _embed_text(self, text):
-        """Embeds the given texts using the specified SentenceTransformer model.
+        """Embeds the given texts using the embedding backend.
 
         Args:
             text (str): The text to embed.
@@ -90,20 +635,39 @@ class BlogMediaEnhancer:
         Returns:
             A list of numpy arrays, each representing the embedded text.
         """
-        embeddings = self.model.encode(text, show_progress_bar=False)
+        return self.embed_texts([text])[0]
+
+    def embed_texts(self, texts):
+        """Embeds the given texts, skipping the model for cached texts.
+
+        The topic segmenter and the search index embed their texts with it,
+        so they share the model and the cache of the frame texts.
+
+        Args:
+            texts (List[str]): The texts to embed.
 
-        return embeddings
+        Returns:
+            np.array: One embedding per text.
+        """
+        return self.embedding_cache.embed(
+            texts, self.embedding_backend.encode,
+        )
 
     def _create_index(self, embeddings):
         """Creates an index for the given embeddings.
 
+        The embeddings are normalized, so the inner products computed by the
+        index are cosine similarities. Queries must be normalized as well.
+
         Args:
             embeddings (List[np.array]): The embeddings to create the index for.
 
         Returns:
             A Faiss index.
         """
-        index = faiss.IndexFlatL2(embeddings.shape[1])
+        embeddings = np.array(embeddings, dtype=np.float32)
+        faiss.normalize_L2(embeddings)
+        index = faiss.IndexFlatIP(embeddings.shape[1])
         index.add(embeddings)
         return index
 
@@ -134,13 +698,12 @@ class BlogMediaEnhancer:
         Returns:
             dict: A dictionary mapping alt text to their respective image markdown tags.
         """
-        image_pattern = re.compile(r'(!\[.*?\]\(\s*.*?\s*(?: ".*?")?\s*\))')
         description_image_tags = {}
 
         lines = markdown_content.split('\n')
 
         for line in lines:
-            image_match = image_pattern.search(line)
+            image_match = IMAGE_TAG_PATTERN.search(line)
             if image_match:
                 image_tag = image_match.group(1).strip()
                 alt_text_match = re.search(r'!\[(.*?)\]', image_tag)
@@ -150,55 +713,234 @@ class BlogMediaEnhancer:
 
         return description_image_tags
 
-    def _remove_unused_images(self, keep_image_names):
+    def _remove_unused_images(self, keep_image_names, image_dir=None):
         """Removes the images that are not used in the blog post.
 
+        Only files directly in ``image_dir`` are removed, so the image
+        directories of other jobs are left alone.
+
         Args:
             keep_image_names (List[str]): A list of image names to keep.
+            image_dir (str, optional): The directory of the images of the blog
+                post. Defaults to the image output path.
+        """
+        image_dir = image_dir or self.image_output_path
+        if not os.path.isdir(image_dir):
+            return
+        for img_name in os.listdir(image_dir):
+            img_path = os.path.join(image_dir, img_name)
+            if img_name not in keep_image_names and not os.path.isdir(img_path):
+                os.remove(img_path)
+
+    def index_video_frames(
+            self, video_file_path, buffer_size=4, batch_size=32, window=None,
+    ):
+        """Extracts frames of the video and embeds the text shown in them.
+
+        Frames stream through a bounded buffer into OCR and are dropped right
+        after, and texts are embedded in fixed-size batches, so only the text
+        embedding of each frame is kept. This only depends on the video, so
+        it can run while the blog post is still being generated. With
+        ``ocr_workers``, OCR runs in worker processes that read the frames
+        from shared memory, at most one per thread of the stage budget, and
+        with ``frame_reader_processes``, ranges of the video are decoded in
+        parallel. The result is the same either way.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            buffer_size (int): The maximum number of decoded frames waiting
+                for OCR in this process.
+            batch_size (int): The number of texts embedded at once.
+            window (Tuple[int, int], optional): Only index frames between these
+                timestamps, in seconds. Defaults to the whole video.
+
+        Returns:
+            dict: A dict mapping image names to their embedded text.
+        """
+        start_time = time.perf_counter()
+        if window is None:
+            images = self._extract_images(video_file_path)
+        else:
+            start, end = window
+            interval = max(1, min(10, (end - start) // self.frames_per_window))
+            images = self._extract_images(
+                video_file_path, interval=interval, start=start, end=end,
+            )
+        threads = self._ocr_threads()
+        if self.ocr_workers:
+            image_texts = self._extract_texts_in_workers(
+                images, min(self.ocr_workers, threads),
+            )
+        else:
+            image_texts = (
+                (img_name, *self._extract_text_from_image(img, threads))
+                for img_name, img in self._buffered(images, buffer_size)
+            )
+        if self.ocr_workers or self.frame_reader_processes != 1:
+            # Texts may arrive out of order, so they are embedded in the order
+            # of the frames, in the same batches as when decoding in order.
+            image_texts = sorted(
+                image_texts, key=lambda item: self.frame_timestamp(item[0]),
+            )
+        images_text_dict = {}
+        batch = []
+        n_skipped = 0
+        for img_name, text, skipped in image_texts:
+            n_skipped += skipped
+            batch.append((img_name, text))
+            if len(batch) == batch_size:
+                images_text_dict.update(self._embed_batch(batch))
+                batch = []
+        images_text_dict.update(self._embed_batch(batch))
+        seconds = time.perf_counter() - start_time
+        OCR_FRAMES.inc(len(images_text_dict))
+        OCR_SKIPPED_FRAMES.inc(n_skipped)
+        if images_text_dict and seconds > 0:
+            OCR_FRAMES_PER_SECOND.observe(len(images_text_dict) / seconds)
+        if self.text_detector is not None and images_text_dict:
+            utils.logging.info(
+                f"Skipped OCR on {n_skipped}/{len(images_text_dict)} frames "
+                f"without text ({n_skipped / len(images_text_dict):.1%})",
+            )
+        return images_text_dict
+
+    def _embed_batch(self, batch):
+        """Embeds a batch of image texts.
+
+        Args:
+            batch (List[Tuple[str, str]]): The name and text of each image.
+
+        Returns:
+            dict: A dict mapping image names to their embedded text.
+        """
+        if not batch:
+            return {}
+        img_names, texts = zip(*batch)
+        return dict(zip(img_names, self.embed_texts(list(texts))))
+
+    @staticmethod
+    def _section_window(section):
+        """Finds the range of the video a section of the blog post is about.
+
+        Args:
+            section (str): The markdown of the section.
+
+        Returns:
+            Tuple[int, int]: The first and last second covered by the
+            timestamp ranges of the section, or None if it has none.
         """
-        for img_name in os.listdir(self.image_output_path):
-            if img_name not in keep_image_names:
-                os.remove(os.path.join(self.image_output_path, img_name))
+        timestamps = []
+        for match in TIMESTAMP_RANGE_PATTERN.finditer(section):
+            start_min, start_sec, end_min, end_sec = map(int, match.groups())
+            timestamps += [start_min * 60 + start_sec, end_min * 60 + end_sec]
+        if not timestamps:
+            return None
+        return min(timestamps), max(timestamps)
+
+    def _extract_placeholder_windows(self, markdown_content):
+        """Maps each image placeholder to the timestamp range of its section.
+
+        Placeholders in a section without a range use the range of the next
+        section, since images are often placed right before the section they
+        illustrate, or else of the previous one.
 
-    def add_images_to_blog(self, video_file_path, blog_content):
+        Args:
+            markdown_content (str): The markdown content to extract from.
+
+        Returns:
+            dict: A dictionary mapping alt text to the first and last second
+            of the range, for every placeholder with a range.
+        """
+        sections = [[]]
+        for line in markdown_content.split('\n'):
+            if line.lstrip().startswith('#') and sections[-1]:
+                sections.append([])
+            sections[-1].append(line)
+        section_windows = [self._section_window('\n'.join(lines)) for lines in sections]
+
+        placeholder_windows = {}
+        for i, lines in enumerate(sections):
+            candidates = section_windows[i:i + 2] + section_windows[max(i - 1, 0):i]
+            window = next((w for w in candidates if w is not None), None)
+            if window is None:
+                continue
+            for alt_text in self._extract_alt_text_with_image_tags('\n'.join(lines)):
+                placeholder_windows[alt_text] = window
+        return placeholder_windows
+
+    def add_images_to_blog(
+            self, video_file_path, blog_content, images_text_dict=None,
+            image_subdir=None,
+    ):
         """Adds the images to the blog content.
 
         Args:
             video_file_path (str): The path to the video file.
             blog_content (str): The blog content.
+            images_text_dict (dict, optional): The result of
+                index_video_frames, if the frames were already indexed.
+            image_subdir (str, optional): A directory inside the image output
+                path that only holds the images of this blog post, such as
+                the id of the job. Defaults to the image output path itself.
 
         Returns:
             str: The blog content with the images added.
         """
-        images_dict = self._extract_images(video_file_path)
         image_placeholder_queries = self._extract_alt_text_with_image_tags(blog_content)
-
-        images_text_dict = {}
-        for img_name, img in images_dict.items():
-            text = self._extract_text_from_image(img)
-            embedded_text = self._embed_text(text)
-            images_text_dict[img_name] = embedded_text
-
-        embeddings = [embedding for img_name, embedding in images_text_dict.items()]
-        embeddings = np.array(embeddings)
-
-        index = self._create_index(embeddings)
-
+        placeholder_windows = {}
+        if self.retrieval_mode == "timestamp":
+            placeholder_windows = self._extract_placeholder_windows(blog_content)
+
+        indexes = {}
+
+        def get_index(window):
+            if window not in indexes:
+                frames = None
+                if window is not None and images_text_dict:
+                    frames = {
+                        name: embedding for name, embedding in images_text_dict.items()
+                        if window[0] <= self.frame_timestamp(name) <= window[1]
+                    }
+                elif window is not None:
+                    frames = self.index_video_frames(video_file_path, window=window)
+                if not frames:
+                    frames = get_index(None)[1] if window is not None else (
+                        images_text_dict or self.index_video_frames(video_file_path)
+                    )
+                indexes[window] = (self._create_index(np.array(list(frames.values()))),
+                                   frames)
+            return indexes[window]
+
+        image_dir, image_link_dir = self.image_output_path, self.image_dir_name
+        if image_subdir is not None:
+            image_dir = os.path.join(image_dir, image_subdir)
+            image_link_dir = os.path.join(image_link_dir, image_subdir)
         used_images = []
 
-        for alt_text, img_tag in image_placeholder_queries.items():
-            query = self._embed_text(alt_text)
+        alt_texts = list(image_placeholder_queries.keys())
+        queries = np.array(self.embed_texts(alt_texts), dtype=np.float32)
+        faiss.normalize_L2(queries)
+
+        for alt_text, query in zip(alt_texts, queries):
+            img_tag = image_placeholder_queries[alt_text]
             query = query.reshape(1, -1)
-            retrieved_image_name = self._query_index(
-                index, query, images_text_dict, k=1,
-            )[0]
+            index, frames = get_index(placeholder_windows.get(alt_text))
+            retrieved_image_name = self._query_index(index, query, frames, k=1)[0]
             used_images.append(retrieved_image_name)
-            image_path = os.path.join(self.image_dir_name, retrieved_image_name)
+            image_path = os.path.join(image_link_dir, retrieved_image_name)
             blog_content = blog_content.replace(
                 img_tag, f"![{alt_text}]({image_path})",
             )
 
-        self._remove_unused_images(used_images)
+        windowed = sum(1 for alt_text in alt_texts if alt_text in placeholder_windows)
+        utils.logging.info(
+            f"Matched {windowed}/{len(alt_texts)} images within their section's "
+            f"time range, embedding cache hit rate: "
+            f"{self.embedding_cache.hit_rate():.1%}",
+        )
+
+        self._save_images(video_file_path, used_images, image_dir)
+        self._remove_unused_images(used_images, image_dir)
 
         return blog_content
 
@@ -214,13 +956,46 @@ class BlogMediaEnhancer:
             first timestamp of a range added in Markdown format.
         """
         youtube_url = YouTubeURL(url=youtube_url).url
+        return self._link_timestamps(
+            blog_content, lambda seconds: f"{youtube_url}&t={seconds}s",
+        )
+
+    def add_media_fragment_timestamps_to_blog(self, video_url, blog_content):
+        """Links the timestamps of the blog content to a video file.
+
+        The links use a media fragment, such as ``video.mp4#t=90``, which
+        browsers play from the given second.
+
+        Args:
+            video_url (str): The URL of the video file.
+            blog_content (str): The blog content.
+
+        Returns:
+            str: The blog content with every timestamp range linked to its
+            first timestamp in the video.
+        """
+        return self._link_timestamps(
+            blog_content, lambda seconds: f"{video_url}#t={seconds}",
+        )
+
+    @staticmethod
+    def _link_timestamps(blog_content, make_url):
+        """Links every timestamp range of the blog content.
+
+        Args:
+            blog_content (str): The blog content.
+            make_url (Callable): Creates the URL of a second of the video.
+
+        Returns:
+            str: The blog content with the links in Markdown format.
+        """
         timestamp_pattern = r"\[(\d{1,2}):(\d{2}) - \d{1,2}:\d{2}\]"
 
         def timestamp_to_link(match):
             first_minutes, first_seconds = match.group(1), match.group(2)
             total_seconds = int(first_minutes) * 60 + int(first_seconds)
             full_range = match.group(0)
-            return f"{full_range}({youtube_url}&t={total_seconds}s)"
+            return f"{full_range}({make_url(total_seconds)})"
 
         return re.sub(timestamp_pattern, timestamp_to_link, blog_content)
 
@@ -0,0 +1,131 @@
+"""Records the progress of a pipeline run so it can be resumed after a crash."""
+
+import json
+import os
+import threading
+
+from essence_extractor.src import utils
+
+
+class RunManifest:
+    """Records the completed stages of a pipeline run.
+
+    The manifest stores the artifact of every completed stage, either a path
+    to a file or the text the stage produced, and the draft of the blog post
+    after every refined chunk. It is rewritten atomically after each update,
+    so a crash never leaves a stage half recorded.
+
+    Attributes:
+        manifest_path (str): The path to the manifest file.
+        params (dict): The parameters of the run. A manifest recorded with
+            other parameters is discarded.
+    """
+
+    def __init__(self, manifest_path, params=None):
+        self.manifest_path = manifest_path
+        self.params = params or {}
+        self._manifest = {"params": self.params, "stages": {}, "refine_state": None}
+        self._lock = threading.Lock()
+
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                utils.logging.warning(f"Ignoring unreadable run manifest: {e}")
+            else:
+                if manifest.get("params") == self.params:
+                    self._manifest = manifest
+                else:
+                    utils.logging.info("Run parameters changed, starting over")
+
+    def _save(self):
+        """Atomically write the manifest. Must be called with the lock held."""
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        utils.atomic_write(self.manifest_path, json.dumps(self._manifest))
+
+    def is_complete(self, stage):
+        """Check whether a stage was completed and its artifact still exists.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            bool: Whether the stage can be skipped.
+        """
+        record = self._manifest["stages"].get(stage)
+        if record is None:
+            return False
+        if record["is_path"] and not os.path.exists(record["artifact"]):
+            return False
+        return True
+
+    def get(self, stage):
+        """Get the artifact of a completed stage.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            str: The path or text the stage produced.
+        """
+        return self._manifest["stages"][stage]["artifact"]
+
+    def complete(self, stage, artifact, is_path=False):
+        """Record that a stage was completed.
+
+        Args:
+            stage (str): The name of the stage.
+            artifact (str): The path or text the stage produced.
+            is_path (bool, optional): Whether the artifact is a path to a
+                file. Defaults to False.
+        """
+        with self._lock:
+            self._manifest["stages"][stage] = {"artifact": artifact, "is_path": is_path}
+            self._save()
+
+    def discard(self, stages=None, refine_state=True):
+        """Forget recorded progress, for example because a stage is redone.
+
+        Args:
+            stages (Iterable[str], optional): The stages to forget. Defaults
+                to all stages.
+            refine_state (bool, optional): Whether to forget the state of the
+                refine loop as well. Defaults to True.
+        """
+        with self._lock:
+            if stages is None:
+                self._manifest["stages"] = {}
+            else:
+                for stage in stages:
+                    self._manifest["stages"].pop(stage, None)
+            if refine_state:
+                self._manifest["refine_state"] = None
+            self._save()
+
+    def load_refine_state(self):
+        """Load the state of an interrupted refine loop.
+
+        Returns:
+            Tuple[str, str]: The draft of the blog post and the transcript
+            text that was not refined yet, or None if there is no state.
+        """
+        refine_state = self._manifest["refine_state"]
+        if refine_state is None:
+            return None
+        return refine_state["draft"], refine_state["remaining_text"]
+
+    def save_refine_state(self, draft, remaining_text):
+        """Save the state of the refine loop after a chunk.
+
+        Args:
+            draft (str): The draft of the blog post.
+            remaining_text (str): The transcript text that was not refined yet.
+        """
+        with self._lock:
+            self._manifest["refine_state"] = {
+                "draft": draft, "remaining_text": remaining_text,
+            }
+            self._save()
@@ -6,8 +6,14 @@ from essence_extractor.src import utils
 class CostManager:
     """This class is used to calculate the cost of a text.
 
+    Input tokens that the provider served from its prompt cache are counted
+    separately, since they are billed at ``cached_input_token_cost``.
+
     Attributes:
         model_name (str): The name of the model to use.
+        input_tokens (int): The input tokens counted so far, cached or not.
+        cached_input_tokens (int): The input tokens served from the cache.
+        output_tokens (int): The output tokens counted so far.
     """
     def __init__(self, model_name):
         self.model_name = model_name
@@ -15,27 +21,60 @@ class CostManager:
             utils.MODEL_TOKEN_LENGTH_MAPPING[model_name]["input_token_cost"]
         self.output_token_cost = \
             utils.MODEL_TOKEN_LENGTH_MAPPING[model_name]["output_token_cost"]
+        self.cached_input_token_cost = utils.MODEL_TOKEN_LENGTH_MAPPING[model_name].get(
+            "cached_input_token_cost", self.input_token_cost,
+        )
         self.token_counter = utils.TokenCounter(self.model_name)
         self.total_cost = 0
         self.per_n_tokens = 1000
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
 
-    def calculate_cost_token(self, token_count, is_input=True):
+    def calculate_cost_token(self, token_count, is_input=True, is_cached=False):
         """Calculate the cost of a text.
 
         Args:
             token_count (int): The number of tokens in the text.
             is_input (bool, optional): Whether text is input or output. Defaults to True.
+            is_cached (bool, optional): Whether the input tokens were served
+                from the prompt cache of the provider. Defaults to False.
 
         Returns:
             float: The cost of the text.
         """
-        if is_input:
+        if is_input and is_cached:
+            cost = (token_count / self.per_n_tokens) * self.cached_input_token_cost
+            self.input_tokens += token_count
+            self.cached_input_tokens += token_count
+        elif is_input:
             cost = (token_count / self.per_n_tokens) * self.input_token_cost
+            self.input_tokens += token_count
         else:
             cost = (token_count / self.per_n_tokens) * self.output_token_cost
+            self.output_tokens += token_count
         self.total_cost += cost
         return cost
 
+    def calculate_cost_usage(self, input_tokens, output_tokens, cached_input_tokens=0):
+        """Calculate the cost of a request from the usage the provider reported.
+
+        Args:
+            input_tokens (int): The input tokens of the request, cached or not.
+            output_tokens (int): The output tokens of the request.
+            cached_input_tokens (int, optional): The input tokens served from
+                the prompt cache. Defaults to 0.
+
+        Returns:
+            float: The cost of the request.
+        """
+        return (
+            self.calculate_cost_token(input_tokens - cached_input_tokens, is_input=True)
+            + self.calculate_cost_token(cached_input_tokens, is_input=True,
+                                        is_cached=True)
+            + self.calculate_cost_token(output_tokens, is_input=False)
+        )
+
     def calculate_cost_text(self, text, is_input=True):
         """Calculate the cost of a text.
 
@@ -50,6 +89,21 @@ class CostManager:
         token_count = self.token_counter.count_tokens(text)
         return self.calculate_cost_token(token_count, is_input=is_input)
 
+    def get_token_usage(self):
+        """Get the tokens counted so far.
+
+        Returns:
+            dict: The input, cached input and output tokens, and the share of
+            the input tokens served from the prompt cache.
+        """
+        return {
+            "input_tokens": self.input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_hit_rate": (self.cached_input_tokens / self.input_tokens
+                               if self.input_tokens else 0.0),
+        }
+
     def get_total_cost(self):
         """Get the total cost of the text.
 
@@ -4,6 +4,11 @@ import re
 
 from pydantic import BaseModel, HttpUrl, validator
 
+YOUTUBE_REGEX = (
+    r'(https?://)?(www\.)?'
+    r'(youtube|youtu|youtube-nocookie)\.(com|be)/'
+    r'(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})')
+
 
 class YouTubeURL(BaseModel):
     """Data model for YouTube URL."""
@@ -12,15 +17,15 @@ class YouTubeURL(BaseModel):
     @validator('url')
     def validate_youtube_url(cls, v):
         """Validate that the URL is a valid YouTube URL."""
-        youtube_regex = (
-            r'(https?://)?(www\.)?'
-            '(youtube|youtu|youtube-nocookie)\.(com|be)/'
-            '(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})')
-
         url_str = str(v)
 
-        if not re.match(youtube_regex, url_str):
+        if not re.match(YOUTUBE_REGEX, url_str):
             raise ValueError('Invalid YouTube URL')
         if 't=' in url_str:
             raise ValueError('URL contains timestamp, please remove the timestamp')
         return v
+
+    @property
+    def video_id(self):
+        """str: The id of the YouTube video."""
+        return re.match(YOUTUBE_REGEX, str(self.url)).group(6)
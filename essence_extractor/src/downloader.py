@@ -1,42 +1,65 @@
 """Download a YouTube video."""
 
 import os
+import time
 
-from pytube import YouTube
-
-from essence_extractor.src import utils
+from essence_extractor.src import metrics, utils
 from essence_extractor.src.data_models import YouTubeURL
 
+YouTube = utils.lazy_import("pytube", "YouTube")
+
+DOWNLOADED_BYTES = metrics.REGISTRY.counter(
+    "download_bytes", "Bytes of video downloaded from YouTube.",
+)
+DOWNLOAD_THROUGHPUT = metrics.REGISTRY.histogram(
+    "download_throughput_bytes_per_second", "Download speed of each video.",
+    buckets=metrics.BYTES_PER_SECOND_BUCKETS,
+)
+
 
 class YouTubeDownloader:
     """Download a YouTube video.
 
     Attributes:
         output_path (str): The path to the output directory.
+        stream_profile (str): Which stream of the video is downloaded.
     """
+    stream_profile = "highest_resolution"
+
     def __init__(self, output_path="videos"):
         self.output_path = output_path
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
 
-    def download_video(self, url):
+    def download_video(self, url, output_path=None):
         """Download a YouTube video.
 
         Args:
             url (str): The URL of the YouTube video.
+            output_path (str, optional): The directory to save the video to.
+                Defaults to the output directory of the downloader.
 
         Returns:
             str: The path to the downloaded video file.
         """
         url = str(YouTubeURL(url=url).url)
+        output_path = output_path or self.output_path
         try:
             yt = YouTube(url)
 
             ys = yt.streams.get_highest_resolution()
 
-            video_file_path = os.path.join(self.output_path, ys.default_filename)
+            video_file_path = os.path.join(output_path, ys.default_filename)
 
-            ys.download(self.output_path)
+            partial_file_name = f".part-{ys.default_filename}"
+            start_time = time.perf_counter()
+            ys.download(output_path, filename=partial_file_name, skip_existing=False)
+            seconds = time.perf_counter() - start_time
+            os.replace(os.path.join(output_path, partial_file_name), video_file_path)
+            n_bytes = os.path.getsize(video_file_path)
+            DOWNLOADED_BYTES.inc(n_bytes)
+            if seconds > 0:
+                DOWNLOAD_THROUGHPUT.observe(n_bytes / seconds)
             return video_file_path
 
         except Exception as e:
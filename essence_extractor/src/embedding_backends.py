@@ -0,0 +1,328 @@
+"""Text embedding backends that trade retrieval quality for CPU speed."""
+
+import contextlib
+import inspect
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from essence_extractor.src import utils
+
+SentenceTransformer = utils.lazy_import("sentence_transformers", "SentenceTransformer")
+
+MPNET_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+MINILM_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+EMBEDDING_BACKENDS = {
+    "mpnet": {"model_name": MPNET_MODEL_NAME},
+    "minilm": {"model_name": MINILM_MODEL_NAME},
+    "mpnet-onnx-int8": {"model_name": MPNET_MODEL_NAME, "onnx": True, "quantize": True},
+    "minilm-onnx-int8": {"model_name": MINILM_MODEL_NAME, "onnx": True, "quantize": True},
+}
+DEFAULT_EMBEDDING_BACKEND = "mpnet"
+ONNX_INSTALL_HINT = (
+    "Install the onnx extra, pip install 'essence-extractor[onnx]', to use the ONNX "
+    "embedding backend"
+)
+
+
+def _onnx_export_options(export):
+    """Chooses the options of ``torch.onnx.export`` that the installed torch knows.
+
+    Newer torch versions export with the dynamo exporter by default, which
+    handles the dynamic axes differently, so the TorchScript exporter is asked
+    for where the ``dynamo`` option exists.
+
+    Args:
+        export (Callable): The ``torch.onnx.export`` function.
+
+    Returns:
+        dict: The extra keyword arguments of the export.
+    """
+    if "dynamo" in inspect.signature(export).parameters:
+        return {"dynamo": False}
+    return {}
+
+
+@contextlib.contextmanager
+def _replacing(path):
+    """Yields a unique temporary path that replaces ``path`` once written.
+
+    Processes exporting the same model at once each write their own file, and
+    the file is removed if writing it fails.
+
+    Args:
+        path (str): The path of the file to write.
+
+    Yields:
+        str: The temporary path to write the file to.
+    """
+    fd, part_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix=".part",
+    )
+    os.close(fd)
+    try:
+        yield part_path
+        os.replace(part_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(part_path)
+        raise
+
+
+class SentenceTransformerBackend:
+    """Embeds texts with a sentence-transformers model on PyTorch.
+
+    Attributes:
+        model_name (str): The name or path of the sentence-transformers model.
+        cache_key (str): Identifies the embeddings of this backend in caches.
+    """
+
+    def __init__(self, model_name=MPNET_MODEL_NAME):
+        self.model_name = model_name
+        self.cache_key = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        # The fast tokenizers fail when two threads use them at once.
+        self._encode_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """SentenceTransformer: The embedding model, loaded on first use."""
+        with self._lock:
+            if self._model is None:
+                self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def load(self):
+        """Loads the model now instead of on first use."""
+        return self.model
+
+    def encode(self, texts):
+        """Embeds texts.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: One float32 embedding per text.
+        """
+        model = self.model
+        with self._encode_lock:
+            embeddings = model.encode(texts, show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+class OnnxBackend:
+    """Embeds texts with an ONNX export of a sentence-transformers model.
+
+    The model is exported once and stored in ``onnx_dir``. With ``quantize``
+    its weights are converted to int8 with dynamic quantization, which makes
+    CPU inference several times faster for a small loss in quality. The
+    ``onnxruntime`` and ``onnx`` packages of the ``onnx`` extra are needed to
+    use this backend.
+
+    Attributes:
+        model_name (str): The name or path of the sentence-transformers model.
+        quantize (bool): Whether to run the int8 quantized model.
+        onnx_dir (str): The directory the exported model is stored in.
+        max_length (int): Texts are truncated to this many tokens.
+        num_threads (int): The number of threads ONNX Runtime uses, or None
+            to let it decide.
+        cache_key (str): Identifies the embeddings of this backend in caches.
+    """
+
+    POOLING_FILE_NAME = "pooling.json"
+
+    def __init__(
+            self,
+            model_name=MPNET_MODEL_NAME,
+            quantize=True,
+            onnx_dir=None,
+            max_length=128,
+            num_threads=None,
+    ):
+        self.model_name = model_name
+        self.quantize = quantize
+        variant = "onnx-int8" if quantize else "onnx"
+        if onnx_dir is None:
+            onnx_dir = os.path.join(
+                utils.DEFAULT_CACHE_DIR, "onnx", model_name.replace("/", "__"),
+            )
+        self.onnx_dir = onnx_dir
+        self.max_length = max_length
+        self.num_threads = num_threads
+        self.cache_key = f"{model_name}-{variant}"
+        self._session = None
+        self._tokenizer = None
+        self._pooling = None
+        self._lock = threading.Lock()
+        # The fast tokenizers fail when two threads use them at once.
+        self._encode_lock = threading.Lock()
+
+    @property
+    def model_path(self):
+        """str: The path to the ONNX model file that is run."""
+        file_name = "model_int8.onnx" if self.quantize else "model.onnx"
+        return os.path.join(self.onnx_dir, file_name)
+
+    def export(self):
+        """Exports the model to ONNX and quantizes it, if not done yet."""
+        fp32_path = os.path.join(self.onnx_dir, "model.onnx")
+        if not os.path.exists(fp32_path):
+            self._export_fp32(fp32_path)
+        if self.quantize and not os.path.exists(self.model_path):
+            try:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+            except ImportError as e:
+                raise ImportError(ONNX_INSTALL_HINT) from e
+            utils.logging.info(f"Quantizing {self.model_name} to int8")
+            with _replacing(self.model_path) as part_path:
+                quantize_dynamic(fp32_path, part_path, weight_type=QuantType.QInt8)
+
+    def _export_fp32(self, fp32_path):
+        """Exports the transformer of the model and its pooling settings.
+
+        Args:
+            fp32_path (str): The path to write the ONNX model to.
+        """
+        import torch
+        from sentence_transformers.models import Normalize, Pooling
+
+        utils.logging.info(f"Exporting {self.model_name} to ONNX")
+        os.makedirs(self.onnx_dir, exist_ok=True)
+        sentence_model = SentenceTransformer(self.model_name, device="cpu")
+        transformer = sentence_model[0]
+        pooling = next(m for m in sentence_model if isinstance(m, Pooling))
+        transformer.tokenizer.save_pretrained(self.onnx_dir)
+
+        dummy = transformer.tokenizer(["An example text"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                       if name in dummy]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+        class TokenEmbeddings(torch.nn.Module):
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                kwargs = dict(zip(input_names, inputs))
+                return self.auto_model(**kwargs, return_dict=False)[0]
+
+        with _replacing(fp32_path) as part_path, torch.no_grad():
+            torch.onnx.export(
+                TokenEmbeddings(transformer.auto_model.eval()),
+                tuple(dummy[name] for name in input_names),
+                part_path,
+                input_names=input_names,
+                output_names=["token_embeddings"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                **_onnx_export_options(torch.onnx.export),
+            )
+
+        # Older sentence-transformers versions store one flag per pooling mode
+        pooling_mode = pooling.get_config_dict()
+        is_cls = (pooling_mode.get("pooling_mode") == "cls"
+                  or pooling_mode.get("pooling_mode_cls_token", False))
+        pooling_config = {
+            "mode": "cls" if is_cls else "mean",
+            "normalize": any(isinstance(m, Normalize) for m in sentence_model),
+        }
+        utils.atomic_write(
+            os.path.join(self.onnx_dir, self.POOLING_FILE_NAME),
+            json.dumps(pooling_config),
+        )
+
+    def _load(self):
+        """Loads the tokenizer and the ONNX Runtime session."""
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(ONNX_INSTALL_HINT) from e
+        from transformers import AutoTokenizer
+
+        self.export()
+        options = onnxruntime.SessionOptions()
+        if self.num_threads is not None:
+            options.intra_op_num_threads = self.num_threads
+        self._session = onnxruntime.InferenceSession(
+            self.model_path, options, providers=["CPUExecutionProvider"],
+        )
+        self._tokenizer = AutoTokenizer.from_pretrained(self.onnx_dir)
+        with open(os.path.join(self.onnx_dir, self.POOLING_FILE_NAME), "r") as f:
+            self._pooling = json.load(f)
+
+    def load(self):
+        """Loads the model now instead of on first use."""
+        with self._lock:
+            if self._session is None:
+                self._load()
+
+    def encode(self, texts, batch_size=32):
+        """Embeds texts.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            batch_size (int, optional): The number of texts run at once.
+                Defaults to 32.
+
+        Returns:
+            np.ndarray: One float32 embedding per text.
+        """
+        self.load()
+        input_names = {node.name for node in self._session.get_inputs()}
+
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            with self._encode_lock:
+                tokens = self._tokenizer(
+                    list(texts[start:start + batch_size]), padding=True,
+                    truncation=True, max_length=self.max_length, return_tensors="np",
+                )
+            feed = {name: tokens[name].astype(np.int64)
+                    for name in input_names if name in tokens}
+            token_embeddings = self._session.run(None, feed)[0]
+
+            if self._pooling["mode"] == "cls":
+                pooled = token_embeddings[:, 0]
+            else:
+                mask = tokens["attention_mask"][..., None].astype(np.float32)
+                pooled = (token_embeddings * mask).sum(axis=1) / np.clip(
+                    mask.sum(axis=1), 1e-9, None,
+                )
+            if self._pooling["normalize"]:
+                pooled = pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+            embeddings.append(pooled.astype(np.float32))
+
+        if not embeddings:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(embeddings)
+
+
+def get_embedding_backend(backend=DEFAULT_EMBEDDING_BACKEND):
+    """Creates an embedding backend from its name.
+
+    Args:
+        backend (str or object): The name of a backend in EMBEDDING_BACKENDS,
+            or a backend instance, which is returned as is.
+
+    Returns:
+        The embedding backend.
+
+    Raises:
+        ValueError: If there is no backend with this name.
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Embedding backend must be one of {list(EMBEDDING_BACKENDS)}")
+    config = dict(EMBEDDING_BACKENDS[backend])
+    if config.pop("onnx", False):
+        return OnnxBackend(**config)
+    return SentenceTransformerBackend(**config)
@@ -0,0 +1,272 @@
+"""Caches text embeddings in memory and on disk."""
+
+import contextlib
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from essence_extractor.src import metrics, utils
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# The number of embeddings kept in memory, about 30 MB of 768-dimensional ones.
+EMBEDDING_CACHE_SIZE = 10_000
+
+
+class EmbeddingCache:
+    """Caches text embeddings keyed by the hash of the normalized text.
+
+    The most recently used embeddings live in memory and, if a cache
+    directory is given, all embeddings live in a flat float32 file per model
+    that is read through a NumPy memmap. An index maps each text hash to its
+    row in that file. Both files are only ever appended to, so storing new
+    embeddings takes time proportional to their number, not to the size of
+    the cache.
+
+    Attributes:
+        model_name (str): The name of the model that produced the embeddings.
+        cache_dir (str): The directory of the on-disk cache, or None to keep
+            the embeddings in memory only.
+        maxsize (int): The maximum number of embeddings kept in memory.
+        hits (int): The number of texts served from the cache.
+        misses (int): The number of texts that had to be embedded.
+    """
+
+    VECTORS_FILE_NAME = "vectors.f32"
+    INDEX_FILE_NAME = "index.tsv"
+
+    def __init__(self, model_name, cache_dir=None, maxsize=EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.maxsize = maxsize
+        self.cache_dir = None
+        if cache_dir is not None:
+            safe_model_name = model_name.replace("/", "__")
+            self.cache_dir = os.path.join(cache_dir, "embeddings", safe_model_name)
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._disk_offsets = {}
+        self._index_position = 0
+        self._dimension = None
+        self._vectors = None
+        self._lock = threading.Lock()
+        if self.cache_dir is not None:
+            self._load_index()
+
+    @staticmethod
+    def normalize_text(text):
+        """Normalizes text so trivially different OCR results share a key.
+
+        Args:
+            text (str): The text to normalize.
+
+        Returns:
+            str: The lower-cased text with collapsed whitespace.
+        """
+        return " ".join(text.lower().split())
+
+    def make_key(self, text):
+        """Creates the cache key of a text.
+
+        Args:
+            text (str): The text to create the key for.
+
+        Returns:
+            str: The hex digest of the model name and the normalized text.
+        """
+        content = f"{self.model_name}\0{self.normalize_text(text)}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _path(self, file_name):
+        return os.path.join(self.cache_dir, file_name)
+
+    def _load_index(self):
+        """Reads the lines appended to the on-disk index since the last read.
+
+        The first line of the index holds the dimension of the embeddings, and
+        every other line a cache key and its row in the vectors file. A line
+        that is still being written is read the next time.
+        """
+        index_path = self._path(self.INDEX_FILE_NAME)
+        if not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, "r") as f:
+                f.seek(self._index_position)
+                for line in iter(f.readline, ""):
+                    if not line.endswith("\n"):
+                        break
+                    self._index_position = f.tell()
+                    key, _, value = line.rstrip("\n").partition("\t")
+                    if key == "dimension":
+                        self._dimension = int(value)
+                    else:
+                        self._disk_offsets[key] = int(value)
+        except (OSError, ValueError) as e:
+            utils.logging.warning(f"Ignoring unreadable embedding index: {e}")
+
+    def _read_from_disk(self, key):
+        """Reads an embedding from the on-disk cache.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            np.ndarray: The embedding, or None if it is not cached on disk.
+        """
+        offset = self._disk_offsets.get(key)
+        if offset is None:
+            return None
+        if self._vectors is None or offset >= self._vectors.shape[0]:
+            vectors_path = self._path(self.VECTORS_FILE_NAME)
+            n_rows = os.path.getsize(vectors_path) // (4 * self._dimension)
+            if offset >= n_rows:
+                return None
+            self._vectors = np.memmap(
+                vectors_path, dtype=np.float32, mode="r",
+                shape=(n_rows, self._dimension),
+            )
+        return np.array(self._vectors[offset])
+
+    @contextlib.contextmanager
+    def _locked_index(self):
+        """Opens the on-disk index for appending and locks it.
+
+        Holding the lock, the index is brought up to date with the lines other
+        writers appended, so concurrent writers never hand out the same row.
+
+        Yields:
+            The index file.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._path(self.INDEX_FILE_NAME), "a") as index_file:
+            if fcntl is not None:
+                fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                self._load_index()
+                yield index_file
+                index_file.flush()
+                self._index_position = index_file.tell()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(index_file, fcntl.LOCK_UN)
+
+    def _write_to_disk(self, new_embeddings):
+        """Appends embeddings to the on-disk cache.
+
+        The rows are written before the index lines that point to them.
+
+        Args:
+            new_embeddings (dict): Maps cache keys to their embeddings.
+        """
+        with self._locked_index() as index_file:
+            dimension = len(next(iter(new_embeddings.values())))
+            if self._dimension is None:
+                self._dimension = dimension
+                index_file.write(f"dimension\t{dimension}\n")
+            elif self._dimension != dimension:
+                raise ValueError(
+                    f"Embedding dimension {dimension} does not match "
+                    f"the cached dimension {self._dimension}",
+                )
+            new_rows = {}
+            with open(self._path(self.VECTORS_FILE_NAME), "ab") as f:
+                f.seek(0, os.SEEK_END)
+                row = f.tell() // (4 * self._dimension)
+                for key, embedding in new_embeddings.items():
+                    if key in self._disk_offsets or key in new_rows:
+                        continue
+                    f.write(np.asarray(embedding, dtype=np.float32).tobytes())
+                    new_rows[key] = row
+                    row += 1
+            index_file.writelines(f"{key}\t{row}\n" for key, row in new_rows.items())
+            self._disk_offsets.update(new_rows)
+
+    def _remember(self, key, embedding):
+        """Keeps an embedding in memory, forgetting the least recently used one."""
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, text):
+        """Gets the cached embedding of a text.
+
+        Args:
+            text (str): The text to look up.
+
+        Returns:
+            np.ndarray: The embedding, or None if the text is not cached.
+        """
+        key = self.make_key(text)
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is None and self.cache_dir is not None:
+                embedding = self._read_from_disk(key)
+            if embedding is not None:
+                self._remember(key, embedding)
+        return embedding
+
+    def embed(self, texts, encode):
+        """Embeds texts, encoding only the ones that are not cached yet.
+
+        Duplicate texts are encoded once, and all missing texts are encoded in
+        a single call of ``encode``.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            encode (Callable): Encodes a list of texts into a 2D array.
+
+        Returns:
+            np.ndarray: One embedding per text, in the order of ``texts``.
+        """
+        if not texts:
+            return np.empty((0, self._dimension or 0), dtype=np.float32)
+
+        keys = [self.make_key(text) for text in texts]
+        embeddings = {}
+        missing = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in embeddings or key in missing:
+                    continue
+                embedding = self._memory.get(key)
+                if embedding is None and self.cache_dir is not None:
+                    embedding = self._read_from_disk(key)
+                if embedding is None:
+                    missing[key] = text
+                else:
+                    embeddings[key] = embedding
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        n_hits = len(texts) - len(missing)
+        metrics.CACHE_LOOKUPS.inc(n_hits, cache="embedding", result="hit")
+        metrics.CACHE_LOOKUPS.inc(len(missing), cache="embedding", result="miss")
+
+        if missing:
+            encoded = np.asarray(encode(list(missing.values())), dtype=np.float32)
+            new_embeddings = dict(zip(missing.keys(), encoded))
+            embeddings.update(new_embeddings)
+            with self._lock:
+                if self.cache_dir is not None:
+                    self._write_to_disk(new_embeddings)
+
+        with self._lock:
+            for key, embedding in embeddings.items():
+                self._remember(key, embedding)
+        return np.array([embeddings[key] for key in keys], dtype=np.float32)
+
+    def hit_rate(self):
+        """Gets the share of texts served from the cache.
+
+        Returns:
+            float: The hit rate, or 0.0 if nothing was looked up yet.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
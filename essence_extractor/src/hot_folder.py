@@ -0,0 +1,92 @@
+"""Finds video files dropped into a folder once they are completely written."""
+
+import os
+import time
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".webm", ".m4v", ".avi")
+
+
+class HotFolder:
+    """Finds new video files in a folder once they are completely written.
+
+    The folder is polled, which works the same on every platform and on
+    network file systems, where file system events are unreliable. A file
+    that is still being copied into the folder keeps growing, so a file is
+    only ready once its size and modification time have not changed for
+    ``settle_seconds``. Every file is reported once.
+
+    Attributes:
+        watch_dir (str): The folder to watch.
+        extensions (Tuple[str, ...]): The lowercase extensions of the video
+            files, other files are ignored.
+        settle_seconds (float): How long a file must stay unchanged before it
+            is ready.
+        recursive (bool): Whether to also watch the subfolders.
+    """
+
+    def __init__(self, watch_dir, extensions=VIDEO_EXTENSIONS, settle_seconds=5.0,
+                 recursive=False, clock=time.monotonic):
+        self.watch_dir = watch_dir
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.settle_seconds = settle_seconds
+        self.recursive = recursive
+        self._clock = clock
+        self._pending = {}
+        self._reported = set()
+
+    def mark_reported(self, file_paths):
+        """Never report these files, for example because they were ingested before.
+
+        Args:
+            file_paths (Iterable[str]): The paths to the files.
+        """
+        self._reported.update(os.path.abspath(file_path) for file_path in file_paths)
+
+    @property
+    def pending(self):
+        """List[str]: The files found that are not ready yet."""
+        return sorted(self._pending)
+
+    def _video_files(self):
+        """List the video files in the folder, without hidden files."""
+        for root, dirs, file_names in os.walk(self.watch_dir):
+            if not self.recursive:
+                dirs.clear()
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            for file_name in sorted(file_names):
+                if (not file_name.startswith(".")
+                        and file_name.lower().endswith(self.extensions)):
+                    yield os.path.abspath(os.path.join(root, file_name))
+
+    def poll(self):
+        """Look for video files that became ready since the last poll.
+
+        Returns:
+            List[str]: The absolute paths to the ready files, oldest first.
+        """
+        now = self._clock()
+        ready = []
+        seen = set()
+        for file_path in self._video_files():
+            if file_path in self._reported:
+                continue
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            seen.add(file_path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            pending = self._pending.get(file_path)
+            if pending is None or pending[0] != signature:
+                self._pending[file_path] = (signature, now)
+                pending = self._pending[file_path]
+            if now - pending[1] >= self.settle_seconds:
+                ready.append((stat.st_mtime_ns, file_path))
+        # Forget files that were removed before they were ready.
+        for file_path in set(self._pending) - seen:
+            del self._pending[file_path]
+        ready_paths = [file_path for _, file_path in sorted(ready)]
+        for file_path in ready_paths:
+            del self._pending[file_path]
+            self._reported.add(file_path)
+        return ready_paths
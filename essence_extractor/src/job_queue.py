@@ -0,0 +1,405 @@
+"""Queues pipeline jobs in SQLite and runs them on warm workers."""
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from essence_extractor.src import utils
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+YOUTUBE = "youtube"
+LOCAL_FILE = "file"
+
+
+def _process_is_alive(pid):
+    """Check whether a process is running.
+
+    Args:
+        pid (int): The id of the process.
+
+    Returns:
+        bool: Whether the process exists. Processes of other users count as
+        running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Stores pipeline jobs in a SQLite table.
+
+    Every call opens its own connection, so a store can be shared by the
+    worker threads and the request handlers of a service.
+
+    Attributes:
+        db_path (str): The path to the SQLite database file.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    stage_timings TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    source TEXT NOT NULL DEFAULT 'youtube',
+                    worker_pid INTEGER
+                )
+                """,
+            )
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["stage_timings"] = json.loads(job["stage_timings"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def submit(self, url, source=YOUTUBE):
+        """Add a job to the queue.
+
+        Args:
+            url (str): The URL of the YouTube video, or the path to a local
+                video file.
+            source (str, optional): What the URL is, YOUTUBE or LOCAL_FILE.
+                Defaults to YOUTUBE.
+
+        Returns:
+            str: The id of the job.
+        """
+        if source not in (YOUTUBE, LOCAL_FILE):
+            raise ValueError(f"Source must be {YOUTUBE!r} or {LOCAL_FILE!r}")
+        job_id = uuid.uuid4().hex
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, url, status, created_at, source) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, url, QUEUED, time.time(), source),
+            )
+        return job_id
+
+    def get(self, job_id):
+        """Get a job.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            dict: The job, or None if there is no job with this id.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_jobs(self, status=None):
+        """List the jobs, oldest first.
+
+        Args:
+            status (str, optional): Only list jobs with this status.
+
+        Returns:
+            List[dict]: The jobs.
+        """
+        query = "SELECT * FROM jobs"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY created_at", params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count(self, status):
+        """Count the jobs with a status.
+
+        Args:
+            status (str): The status to count.
+
+        Returns:
+            int: The number of jobs with the status.
+        """
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (status,),
+            ).fetchone()[0]
+
+    def claim_next(self):
+        """Mark the oldest queued job as running and return it.
+
+        The job records the id of the process that claimed it, so the jobs of
+        a worker process that died can be found.
+
+        Returns:
+            dict: The claimed job, or None if the queue is empty.
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, worker_pid = ? WHERE id = ?",
+                (RUNNING, time.time(), os.getpid(), row["id"]),
+            )
+            connection.execute("COMMIT")
+        return self.get(row["id"])
+
+    def requeue_running(self):
+        """Put jobs back into the queue that were running when a service died.
+
+        Only jobs whose worker process is gone are requeued, so the jobs that
+        another live service or pool on the same store is running are kept.
+
+        Returns:
+            int: The number of requeued jobs.
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,),
+            ).fetchall()
+            orphaned = [
+                row["id"] for row in rows
+                if row["worker_pid"] is None or not _process_is_alive(row["worker_pid"])
+            ]
+            connection.executemany(
+                "UPDATE jobs SET status = ?, started_at = NULL, worker_pid = NULL "
+                "WHERE id = ? AND status = ?",
+                [(QUEUED, job_id, RUNNING) for job_id in orphaned],
+            )
+            connection.execute("COMMIT")
+        return len(orphaned)
+
+    def fail_running(self, worker_pid, error):
+        """Mark the jobs of a worker process that died as failed.
+
+        Args:
+            worker_pid (int): The id of the worker process.
+            error (str): The error message of the jobs.
+
+        Returns:
+            int: The number of failed jobs.
+        """
+        with self._connect() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? "
+                "WHERE status = ? AND worker_pid = ?",
+                (FAILED, time.time(), error, RUNNING, worker_pid),
+            ).rowcount
+
+    def record_stage_timing(self, job_id, stage, seconds):
+        """Record how long a stage of a job took.
+
+        Args:
+            job_id (str): The id of the job.
+            stage (str): The name of the stage.
+            seconds (float): The duration of the stage.
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT stage_timings FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+            stage_timings = json.loads(row["stage_timings"])
+            stage_timings[stage] = seconds
+            connection.execute(
+                "UPDATE jobs SET stage_timings = ? WHERE id = ?",
+                (json.dumps(stage_timings), job_id),
+            )
+            connection.execute("COMMIT")
+
+    def finish(self, job_id, status, result=None, error=None):
+        """Mark a job as finished.
+
+        Args:
+            job_id (str): The id of the job.
+            status (str): The final status of the job.
+            result (dict, optional): The result of the job.
+            error (str, optional): The error message of a failed job.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? "
+                "WHERE id = ?",
+                (status, time.time(), json.dumps(result) if result else None,
+                 error, job_id),
+            )
+
+    def cancel(self, job_id):
+        """Cancel a job.
+
+        Queued jobs are cancelled right away. Running jobs are asked to stop
+        and are cancelled before their next stage starts.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            bool: Whether the job was queued or running.
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            cancelled = connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            ).rowcount
+            cancel_requested = connection.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                (job_id, RUNNING),
+            ).rowcount
+            connection.execute("COMMIT")
+        return bool(cancelled or cancel_requested)
+
+    def is_cancel_requested(self, job_id):
+        """Check whether a job was asked to stop.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            bool: Whether the job was asked to stop.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+
+class JobWorkerPool:
+    """Runs queued jobs on worker threads that keep their models loaded.
+
+    The pool creates one pipeline that all workers share, so Whisper, the
+    sentence embedding model and the tokenizers are loaded once and stay warm
+    between jobs. The models take turns where they cannot run in two threads
+    at once.
+
+    Attributes:
+        job_store (JobStore): The store to take jobs from.
+        pipeline_factory (Callable): Creates the pipeline shared by the workers.
+        n_workers (int): The number of worker threads.
+        poll_interval (float): How long an idle worker waits before looking
+            for new jobs, in seconds.
+    """
+
+    def __init__(self, job_store, pipeline_factory, n_workers=1, poll_interval=1.0):
+        self.job_store = job_store
+        self.pipeline_factory = pipeline_factory
+        self.n_workers = n_workers
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._pipeline = None
+
+    def start(self):
+        """Create the pipeline and start the worker threads.
+
+        Raises:
+            Exception: If the pipeline cannot be created. No worker is started.
+        """
+        self.job_store.requeue_running()
+        try:
+            self._pipeline = self.pipeline_factory()
+        except Exception as e:
+            utils.logging.error(f"Could not create the pipeline of the workers: {e}")
+            self.stop()
+            raise
+        self._stop_event.clear()
+        for i in range(self.n_workers):
+            thread = threading.Thread(
+                target=self._process_jobs, args=(self._pipeline,),
+                name=f"essence-worker-{i}", daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the worker threads after their current job and close the pipeline.
+
+        Args:
+            timeout (float, optional): How long to wait for each worker.
+        """
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._pipeline is not None:
+            self._pipeline.close()
+            self._pipeline = None
+
+    def run_job(self, pipeline, job):
+        """Run a job and record its outcome.
+
+        Args:
+            pipeline (Pipeline): The pipeline to run the job with.
+            job (dict): The job to run.
+        """
+        job_id = job["id"]
+        utils.logging.info(f"Starting job {job_id} for {job['url']}")
+        run = pipeline.run_file if job["source"] == LOCAL_FILE else pipeline.run
+        try:
+            result = run(
+                job["url"],
+                on_stage_done=lambda stage, seconds: self.job_store.record_stage_timing(
+                    job_id, stage, seconds,
+                ),
+                is_cancelled=lambda: self.job_store.is_cancel_requested(job_id),
+                job_id=job_id,
+            )
+        except utils.JobCancelledError as e:
+            utils.logging.info(f"Job {job_id} cancelled: {e}")
+            self.job_store.finish(job_id, CANCELLED, error=str(e))
+        except Exception as e:
+            utils.logging.error(f"Job {job_id} failed: {e}")
+            self.job_store.finish(job_id, FAILED, error=str(e))
+        else:
+            utils.logging.info(f"Job {job_id} finished")
+            self.job_store.finish(job_id, SUCCEEDED, result=result)
+
+    def _process_jobs(self, pipeline):
+        """Run queued jobs with a pipeline until the pool is stopped."""
+        while not self._stop_event.is_set():
+            job = self.job_store.claim_next()
+            if job is None:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            self.run_job(pipeline, job)
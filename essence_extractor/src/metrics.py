@@ -0,0 +1,355 @@
+"""Counters and histograms of the pipeline, in the OpenMetrics text format."""
+
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+from essence_extractor.src import utils
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+METRIC_PREFIX = "essence_extractor_"
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300, 600, 1800)
+RATIO_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+BYTES_PER_SECOND_BUCKETS = (1e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 1e9)
+FRAMES_PER_SECOND_BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100)
+
+
+def _format_value(value):
+    """Format a sample value, with integers written without a fraction."""
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label_value(value):
+    """Escape backslashes, double quotes and newlines in a label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    """Format the labels of a sample, such as ``{stage="Saving"}``."""
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"'
+                          for name, value in labels) + "}"
+
+
+class _Metric:
+    """A family of samples that share a name and label names.
+
+    The values are either updated where they are measured, or read from
+    ``function`` whenever the metrics are rendered, for values that are
+    already counted elsewhere.
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} needs the labels {list(self.labelnames)}")
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError:
+            raise ValueError(f"{self.name} needs the labels {list(self.labelnames)}")
+
+    def _items(self):
+        """Get the label values and value of every sample."""
+        if self.function is None:
+            with self._lock:
+                return list(self._values.items())
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(tuple(str(value) for value in key), value)
+                for key, value in values.items()]
+
+    def _sample_lines(self):
+        raise NotImplementedError
+
+    def render(self):
+        """Render the metric in the OpenMetrics text format.
+
+        Returns:
+            List[str]: The lines of the metric.
+        """
+        return [f"# TYPE {self.name} {self.type_name}",
+                f"# HELP {self.name} {self.documentation}",
+                *self._sample_lines()]
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as the number of downloaded bytes."""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Add to the counter.
+
+        Args:
+            amount (float, optional): The amount to add. Defaults to 1.
+            **labels: The value of every label of the counter.
+        """
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Get the value of the counter.
+
+        Args:
+            **labels: The value of every label of the counter.
+
+        Returns:
+            float: The value.
+        """
+        key = self._key(labels)
+        return dict(self._items()).get(key, 0)
+
+    def _sample_lines(self):
+        return [f"{self.name}_total{_format_labels(zip(self.labelnames, key))} "
+                f"{_format_value(value)}"
+                for key, value in sorted(self._items())]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, such as the number of queued jobs."""
+
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        """Set the gauge.
+
+        Args:
+            value (float): The new value.
+            **labels: The value of every label of the gauge.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _sample_lines(self):
+        return [f"{self.name}{_format_labels(zip(self.labelnames, key))} "
+                f"{_format_value(value)}"
+                for key, value in sorted(self._items())]
+
+
+class Histogram(_Metric):
+    """Counts observations, such as latencies, in cumulative buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Add an observation.
+
+        Args:
+            value (float): The observed value.
+            **labels: The value of every label of the histogram.
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block, in seconds.
+
+        Args:
+            **labels: The value of every label of the histogram.
+
+        Yields:
+            None
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def count(self, **labels):
+        """Get the number of observations.
+
+        Args:
+            **labels: The value of every label of the histogram.
+
+        Returns:
+            int: The number of observations.
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            return 0 if state is None else state[2]
+
+    def _sample_lines(self):
+        lines = []
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2]))
+                           for key, state in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = labels + [("le", "+Inf" if bound == math.inf
+                                           else repr(float(bound)))]
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} "
+                             f"{cumulative}")
+            label_text = _format_labels(labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the metrics of a process and renders them for Prometheus.
+
+    Metrics are created once, usually when the module that updates them is
+    imported, and updating one only takes a lock and a dict update, so they
+    stay on in hot paths. The registry is rendered in the OpenMetrics text
+    format, which Prometheus scrapes from the ``/metrics`` endpoint of the
+    job queue service or reads from a file through the textfile collector of
+    the node exporter.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name, documentation, labelnames, **kwargs):
+        name = METRIC_PREFIX + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif (type(metric) is not metric_class
+                  or metric.labelnames != tuple(labelnames)):
+                raise ValueError(f"{name} is already registered differently")
+            elif kwargs.get("function") is not None:
+                metric.function = kwargs["function"]
+            return metric
+
+    def counter(self, name, documentation, labelnames=(), function=None):
+        """Get or create a counter.
+
+        Args:
+            name (str): The name of the counter, without the package prefix
+                and the "_total" suffix.
+            documentation (str): What the counter counts.
+            labelnames (Tuple[str, ...], optional): The names of its labels.
+            function (Callable, optional): Returns the value, or a dict mapping
+                label value tuples to values, whenever the metrics are
+                rendered. Replaces the function of an existing counter.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self._get_or_create(Counter, name, documentation, labelnames,
+                                   function=function)
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        """Get or create a gauge.
+
+        Args:
+            name (str): The name of the gauge, without the package prefix.
+            documentation (str): What the gauge measures.
+            labelnames (Tuple[str, ...], optional): The names of its labels.
+            function (Callable, optional): Returns the value, or a dict mapping
+                label value tuples to values, whenever the metrics are
+                rendered. Replaces the function of an existing gauge.
+
+        Returns:
+            Gauge: The gauge.
+        """
+        return self._get_or_create(Gauge, name, documentation, labelnames,
+                                   function=function)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Get or create a histogram.
+
+        Args:
+            name (str): The name of the histogram, without the package prefix.
+            documentation (str): What the histogram observes.
+            labelnames (Tuple[str, ...], optional): The names of its labels.
+            buckets (Tuple[float, ...], optional): The upper bounds of the
+                buckets. Defaults to latencies from 0.1 seconds to 30 minutes.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self._get_or_create(Histogram, name, documentation, labelnames,
+                                   buckets=buckets)
+
+    def render(self):
+        """Render all metrics in the OpenMetrics text format.
+
+        Returns:
+            str: The metrics, ending with "# EOF".
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            try:
+                lines += metric.render()
+            except Exception as e:
+                utils.logging.warning(f"Could not collect {metric.name}: {e}")
+        return "\n".join(lines + ["# EOF"]) + "\n"
+
+    def write_textfile(self, file_path):
+        """Write all metrics to a file, replacing it atomically.
+
+        Args:
+            file_path (str): The path to the file, such as a ".prom" file in
+                the directory of the node exporter textfile collector.
+        """
+        utils.atomic_write(file_path, self.render())
+
+
+def _token_count_cache_lookups():
+    """Read the hits and misses of the token count caches."""
+    lookups = {}
+    for encoding_name, cache in utils.get_token_count_caches().items():
+        info = cache.info()
+        lookups[(encoding_name, "hit")] = info["hits"]
+        lookups[(encoding_name, "miss")] = info["misses"]
+    return lookups
+
+
+# The registry of the process. The stages add their metrics to it.
+REGISTRY = MetricsRegistry()
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "cache_lookups", "Lookups of the embedding cache and the artifact store.",
+    ["cache", "result"],
+)
+# Token counts are looked up far more often than they are scraped, so the
+# counts the caches keep anyway are read at scrape time.
+TOKEN_COUNT_CACHE_LOOKUPS = REGISTRY.counter(
+    "token_count_cache_lookups", "Lookups of the token count caches.",
+    ["encoding", "result"], function=_token_count_cache_lookups,
+)
@@ -0,0 +1,575 @@
+"""Runs all stages that turn a YouTube video into a blog post."""
+
+import copy
+import hashlib
+import importlib
+import os
+import re
+import time
+import urllib.parse
+
+from essence_extractor.src import metrics, utils
+from essence_extractor.src.blog_generator import BlogGenerator
+from essence_extractor.src.blog_media_enhancer import BlogMediaEnhancer
+from essence_extractor.src.checkpoint import RunManifest
+from essence_extractor.src.cost_management import CostManager
+from essence_extractor.src.data_models import YouTubeURL
+from essence_extractor.src.downloader import YouTubeDownloader
+from essence_extractor.src.embedding_backends import DEFAULT_EMBEDDING_BACKEND
+from essence_extractor.src.resource_manager import ResourceManager
+from essence_extractor.src.scheduler import Stage, StageScheduler, descendants
+from essence_extractor.src.semantic_index import SemanticIndex
+from essence_extractor.src.topic_segmenter import TopicSegmenter
+from essence_extractor.src.transcriber import Transcriber
+from essence_extractor.src.transcript_compactor import TranscriptCompactor
+from essence_extractor.src.workspace import JobWorkspace
+
+STAGES = ["Downloading Video", "Extracting Audio",
+          "Transcribing Audio", "Compacting Transcript", "Generating Blog Post",
+          "Adding Image Placeholders", "Adding URL Timestamps",
+          "Indexing Video Frames", "Adding Images",
+          "Formatting to Markdown", "Saving to File"]
+PATH_STAGES = {"Downloading Video", "Extracting Audio",
+               "Transcribing Audio", "Compacting Transcript", "Saving to File"}
+TRANSIENT_STAGES = {"Indexing Video Frames"}
+SEARCH_INDEX_STAGE = "Updating Search Index"
+TRANSCRIPT_CHUNK_PATTERN = re.compile(r"\[(\d+):(\d{2})\]")
+
+# Imported by load_models, so forked workers share them instead of each
+# importing them on first use.
+PRELOADED_MODULES = ("moviepy.editor", "pytesseract", "faiss")
+
+STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "stage_duration_seconds", "Duration of each pipeline stage.", ["stage"],
+)
+
+
+def local_video_id(video_path):
+    """Create the id of a local video file.
+
+    The id is made of the file name and a hash of the path, size and
+    modification time of the file, so a changed recording gets a new id.
+
+    Args:
+        video_path (str): The path to the video file.
+
+    Returns:
+        str: The id, made of letters, digits, "_" and "-".
+    """
+    stat = os.stat(video_path)
+    description = f"{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256(description.encode("utf-8")).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    name = re.sub(r"[^A-Za-z0-9_-]+", "-", name).strip("-")
+    return f"{name or 'video'}-{digest}"
+
+
+class Pipeline:
+    """Runs all stages that turn a YouTube video into a blog post.
+
+    The models of all stages are loaded once when the pipeline is created, so
+    a pipeline can process many videos without loading them again, also at
+    the same time from several threads. The stages
+    form a dependency graph: indexing the video frames only needs the video,
+    so it runs while the audio is transcribed and the blog post generated.
+
+    The intermediate files and the images of every run are kept in the
+    workspace of its job, so runs of several pipelines can share an output
+    directory.
+
+    Attributes:
+        output_dir (str): The directory to save the outputs to.
+        model_name (str): The model name used as blog generator.
+        max_workers (int): The maximum number of stages running at once.
+        retrieval_mode (str): How frames are searched for an image placeholder,
+            "timestamp" to search only the time range of its section or "full".
+        embedding_backend (str): The name of the backend that embeds the texts
+            of the frames and the alt texts of the images.
+        search_index (SemanticIndex): The index the frames and transcript
+            chunks of every video are added to, or None.
+        resource_manager (ResourceManager): Gives every stage its share of
+            the CPU threads. Pipelines running in the same process should
+            share one.
+        cleanup_workspace (bool): Whether to delete the intermediate files of
+            a job once its blog post is saved.
+        artifact_store (ArtifactStore): Stores the downloaded videos, audio
+            and transcripts, so a video processed before is not downloaded
+            and transcribed again, or None.
+        ocr_workers (int): The number of processes that run OCR on the video
+            frames, or 0 to run OCR in the process of the pipeline.
+        frame_reader_processes (Union[int, str]): The number of processes that
+            decode the video frames, or "auto" to choose it from the length of
+            the video and the available cores.
+        transcript_compactor (TranscriptCompactor): Removes filler and
+            repetition from the transcript before the blog post is generated
+            from it, or None to generate it from the full transcript.
+        refine_strategy (str): How the blog post is refined with each chunk of
+            the transcript, "full" or "sections". See BlogGenerator.
+        extra_artifacts (List[str]): The artifacts generated along with the
+            blog post, such as "summary" and "chapters". They reuse the
+            transcript prompt of the blog post and are saved next to it.
+        topic_chunking (bool): Whether the transcript is sent to the language
+            model in chunks of whole topics, found with the embedding backend,
+            instead of being cut at a word.
+        timestamp_base_url (str): The URL the local video files are published
+            under. The timestamps of a blog post generated from a local file
+            link to the file at this URL, or stay plain text if it is None.
+        clip_batch_wait (float): How long the transcription of a video of at
+            most 30 seconds waits for the short videos of other runs, so they
+            are decoded in one batch, in seconds, or None to not batch them.
+        embedding_cache_dir (str): The directory the embeddings of the frame
+            texts are cached in for later runs, or None to cache them in
+            memory only.
+    """
+
+    def __init__(
+            self, output_dir, model_name=utils.DEFAULT_MODEL_NAME, max_workers=4,
+            retrieval_mode="timestamp", embedding_backend=DEFAULT_EMBEDDING_BACKEND,
+            search_index_dir=None, resource_manager=None, cleanup_workspace=False,
+            artifact_store=None, ocr_workers=0, compact_transcript=True,
+            refine_strategy="full", extra_artifacts=(), frame_reader_processes=1,
+            topic_chunking=False, timestamp_base_url=None, clip_batch_wait=None,
+            embedding_cache_dir=None,
+    ):
+        self.output_dir = output_dir
+        self.cleanup_workspace = cleanup_workspace
+        self.artifact_store = artifact_store
+        self.resource_manager = resource_manager or ResourceManager()
+        self.model_name = model_name
+        self.retrieval_mode = retrieval_mode
+        self.embedding_backend = embedding_backend
+        self.clip_batch_wait = clip_batch_wait
+        self.embedding_cache_dir = embedding_cache_dir
+        self.refine_strategy = refine_strategy
+        self.scheduler = StageScheduler(max_workers=max_workers)
+        self.yt_downloader = YouTubeDownloader(output_path=output_dir)
+        self.transcriber = Transcriber(output_path=output_dir,
+                                       clip_batch_wait=clip_batch_wait)
+        self.blog_generator = BlogGenerator(
+            output_path=output_dir, model_name=model_name,
+            refine_strategy=refine_strategy,
+        )
+        self.extra_artifacts = list(extra_artifacts)
+        self.transcript_compactor = None
+        if compact_transcript:
+            self.transcript_compactor = TranscriptCompactor(model_name=model_name)
+        self.media_enhancer = BlogMediaEnhancer(
+            output_path=output_dir, retrieval_mode=retrieval_mode,
+            embedding_backend=embedding_backend,
+            resource_manager=self.resource_manager, ocr_workers=ocr_workers,
+            frame_reader_processes=frame_reader_processes,
+            embedding_cache_dir=embedding_cache_dir,
+        )
+        self.topic_chunking = topic_chunking
+        self.timestamp_base_url = timestamp_base_url
+        if topic_chunking:
+            # Shares the embedding model and cache of the frame texts.
+            self.blog_generator.topic_segmenter = TopicSegmenter(
+                self.media_enhancer.embed_texts,
+            )
+        self.search_index = None
+        if search_index_dir is not None:
+            self.search_index = SemanticIndex(
+                search_index_dir,
+                model_key=self.media_enhancer.embedding_backend.cache_key,
+            )
+
+    @property
+    def stage_names(self):
+        """List[str]: The names of the stages of a run."""
+        if self.search_index is None:
+            return list(STAGES)
+        return STAGES + [SEARCH_INDEX_STAGE]
+
+    def load_models(self):
+        """Load the embedding model and the heavy modules of the stages now.
+
+        They are otherwise loaded when a stage first needs them. Loading them
+        before worker processes are forked lets all workers share them.
+        """
+        self.media_enhancer.embedding_backend.load()
+        for module_name in PRELOADED_MODULES:
+            try:
+                importlib.import_module(module_name)
+            except ImportError as e:
+                utils.logging.warning(f"Could not preload {module_name}: {e}")
+
+    def close(self):
+        """Write the changes the search index keeps in memory to disk."""
+        if self.search_index is not None:
+            self.search_index.close()
+
+    @staticmethod
+    def _read_transcript_chunks(transcript_path):
+        """Splits a transcript into its timestamped chunks.
+
+        Args:
+            transcript_path (str): The path to the transcript file.
+
+        Returns:
+            Tuple[List[float], List[str]]: The start time in seconds and the
+            text of each chunk.
+        """
+        with open(transcript_path, "r") as f:
+            parts = TRANSCRIPT_CHUNK_PATTERN.split(f.read())
+        start_times, texts = [], []
+        for minutes, seconds, text in zip(parts[1::3], parts[2::3], parts[3::3]):
+            if text.strip():
+                start_times.append(int(minutes) * 60 + int(seconds))
+                texts.append(text.strip())
+        return start_times, texts
+
+    def _create_manifest(self, workspace):
+        """Create the manifest that records the progress of a run.
+
+        The manifest holds every option that changes the output of a stage,
+        so resuming a run with other options starts over instead of reusing
+        stale results.
+
+        Args:
+            workspace (JobWorkspace): The workspace of the job.
+
+        Returns:
+            RunManifest: The manifest of the job.
+        """
+        params = {
+            "model_name": self.model_name,
+            "compact_transcript": self.transcript_compactor is not None,
+            "refine_strategy": self.refine_strategy,
+            "extra_artifacts": sorted(self.extra_artifacts),
+            "topic_chunking": self.topic_chunking,
+            "retrieval_mode": self.retrieval_mode,
+            "embedding_backend": self.embedding_backend,
+            "timestamp_base_url": self.timestamp_base_url,
+        }
+        return RunManifest(workspace.manifest_path, params=params)
+
+    def _artifact_params(self):
+        """Describe the processing that produces each kind of artifact.
+
+        Returns:
+            dict: Maps the kinds of artifacts to the parameters that are part
+            of their key in the artifact store.
+        """
+        video = {"stream": self.yt_downloader.stream_profile}
+        audio = {**video, "audio_format": "wav"}
+        transcript = {
+            **audio, "asr": "whisper", "model": self.transcriber.model_name,
+            "chunk_size": self.transcriber.chunk_size, "vad": self.transcriber.use_vad,
+            "clip_batching": self.transcriber.clip_batch_wait is not None,
+        }
+        return {"video": video, "audio": audio, "transcript": transcript}
+
+    def _build_stages(self, source, manifest, redone, workspace, blog_generator,
+                      job_id=None):
+        """Build the dependency graph of the stages of a run.
+
+        Args:
+            source (dict): The id of the video, the URL its timestamps link
+                to or None, and the path to a local video file or None to
+                download the video from the URL.
+            manifest (RunManifest): The manifest of the run.
+            redone (Set[str]): The stages that have to be redone in this run.
+            workspace (JobWorkspace): The workspace of the job.
+            blog_generator (BlogGenerator): The blog generator of the run,
+                which counts its costs.
+            job_id (str, optional): The id of the job, which is part of the
+                name of its blog post, so jobs never overwrite each other's
+                post. Defaults to naming the post after the video only.
+
+        Returns:
+            List[Stage]: The stages of the run.
+        """
+        video_id = source["video_id"]
+        artifact_params = self._artifact_params() if self.artifact_store else {}
+
+        def stored(kind, target_dir, func):
+            if self.artifact_store is None:
+                return func
+            key = self.artifact_store.key(kind, video_id, artifact_params[kind])
+
+            def fetch_or_compute(*args, **kwargs):
+                return self.artifact_store.fetch_or_compute(
+                    key, target_dir, lambda: func(*args, **kwargs),
+                    kind=kind, video_id=video_id,
+                )
+            return fetch_or_compute
+
+        def compact_transcript(transcript_path):
+            if self.transcript_compactor is None:
+                return transcript_path
+            return self.transcript_compactor.compact_file(transcript_path)
+
+        def generate_blog_post(transcript_path):
+            if not self.extra_artifacts:
+                return blog_generator.generate_article_content(
+                    transcript_path, checkpoint=manifest,
+                )
+            artifacts = blog_generator.generate_artifacts(
+                transcript_path, ["blog_post", *self.extra_artifacts],
+                checkpoint=manifest,
+            )
+            for artifact_type in self.extra_artifacts:
+                utils.atomic_write(
+                    os.path.join(self.output_dir, f"{video_id}_{artifact_type}.md"),
+                    artifacts[artifact_type],
+                )
+            return artifacts["blog_post"]
+
+        def add_timestamp_links(blog_content):
+            if source["url"] is None:
+                return blog_content
+            if source["video_path"] is None:
+                return self.media_enhancer.add_url_timestamps_to_blog(
+                    source["url"], blog_content,
+                )
+            return self.media_enhancer.add_media_fragment_timestamps_to_blog(
+                source["url"], blog_content,
+            )
+
+        def save_blog_post(blog_content, video_path):
+            blog_post_name = os.path.splitext(os.path.basename(video_path))[0]
+            if job_id is not None:
+                blog_post_name = f"{blog_post_name}_{job_id}"
+            blog_post_path = os.path.join(self.output_dir, f"{blog_post_name}.md")
+            return utils.save_to_md_file(blog_content, blog_post_path)
+
+        def index_video_frames(video_path):
+            consumers = ["Adding Images"]
+            if self.search_index is not None:
+                consumers.append(SEARCH_INDEX_STAGE)
+            if all(stage not in redone and manifest.is_complete(stage)
+                   for stage in consumers):
+                return None
+            if (self.media_enhancer.retrieval_mode == "timestamp"
+                    and self.search_index is None):
+                # Frames are indexed per section once the timestamps are known.
+                return None
+            return self.media_enhancer.index_video_frames(video_path)
+
+        def update_search_index(transcript_path, images_text_dict, video_path):
+            if not images_text_dict:
+                images_text_dict = self.media_enhancer.index_video_frames(video_path)
+            frame_names = list(images_text_dict)
+            n_items = self.search_index.add_video(
+                video_id, "frame", frame_names, list(images_text_dict.values()),
+                start_times=[self.media_enhancer.frame_timestamp(name)
+                             for name in frame_names],
+                source=source["url"] or source["video_path"],
+            )
+            start_times, texts = self._read_transcript_chunks(transcript_path)
+            n_items += self.search_index.add_video(
+                video_id, "transcript",
+                [f"transcript_chunk_{i}" for i in range(len(texts))],
+                self.media_enhancer.embed_texts(texts),
+                texts=texts, start_times=start_times,
+                source=source["url"] or source["video_path"],
+            )
+            return n_items
+
+        if source["video_path"] is None:
+            fetch_video = Stage(
+                "Downloading Video",
+                stored("video", workspace.video_dir, self.yt_downloader.download_video),
+                args=[source["url"]], kwargs={"output_path": workspace.video_dir},
+            )
+        else:
+            # A local file is used where it is instead of being downloaded.
+            fetch_video = Stage("Downloading Video", lambda path: path,
+                                args=[source["video_path"]])
+        stages = [
+            fetch_video,
+            Stage("Extracting Audio",
+                  stored("audio", workspace.audio_dir, self.transcriber.extract_audio),
+                  inputs=["Downloading Video"],
+                  kwargs={"output_path": workspace.audio_dir}),
+            Stage("Transcribing Audio",
+                  stored("transcript", workspace.audio_dir,
+                         self.transcriber.transcribe_audio),
+                  inputs=["Extracting Audio"]),
+            Stage("Compacting Transcript", compact_transcript,
+                  inputs=["Transcribing Audio"]),
+            Stage("Generating Blog Post", generate_blog_post,
+                  inputs=["Compacting Transcript"]),
+            Stage("Adding Image Placeholders", blog_generator.add_image_placeholder,
+                  inputs=["Generating Blog Post"]),
+            Stage("Adding URL Timestamps", add_timestamp_links,
+                  inputs=["Adding Image Placeholders"]),
+            Stage("Indexing Video Frames", index_video_frames,
+                  inputs=["Downloading Video"]),
+            Stage("Adding Images", self.media_enhancer.add_images_to_blog,
+                  inputs=["Downloading Video", "Adding URL Timestamps",
+                          "Indexing Video Frames"],
+                  kwargs={"image_subdir": workspace.image_subdir}),
+            Stage("Formatting to Markdown", utils.format_to_markdown,
+                  inputs=["Adding Images"]),
+            Stage("Saving to File", save_blog_post,
+                  inputs=["Formatting to Markdown", "Downloading Video"]),
+        ]
+        if self.search_index is not None:
+            stages.append(Stage(
+                SEARCH_INDEX_STAGE, update_search_index,
+                inputs=["Transcribing Audio", "Indexing Video Frames",
+                        "Downloading Video"],
+            ))
+        return stages
+
+    def run(self, youtube_video_url, on_stage_done=None, is_cancelled=None, resume=True,
+            job_id=None):
+        """Download, transcribe, and generate blog post of a YouTube video.
+
+        The artifact of every stage is recorded in a run manifest, so a run
+        that was interrupted resumes after its completed stages. Once a stage
+        has to be redone, all stages depending on it are redone as well.
+
+        Args:
+            youtube_video_url (str): The URL of the YouTube video.
+            on_stage_done (Callable, optional): Called with the name and the
+                duration in seconds of each finished stage.
+            is_cancelled (Callable, optional): Returns True if the run should
+                stop. It is checked before each stage.
+            resume (bool, optional): Whether to resume an interrupted run of
+                the same job. Defaults to True.
+            job_id (str, optional): The id of the job, which names its
+                workspace and is part of the name of its blog post. Defaults
+                to the id of the video, and a post named after the video.
+
+        Returns:
+            dict: The path to the blog post, the cost of the run, the
+            duration of each stage and of the whole run in seconds, the CPU
+            usage of each stage, the tokens compaction removed from the
+            transcript, and the tokens sent to and generated by the language
+            model.
+
+        Raises:
+            JobCancelledError: If the run was cancelled.
+        """
+        youtube_url = YouTubeURL(url=youtube_video_url)
+        source = {"video_id": youtube_url.video_id, "url": str(youtube_url.url),
+                  "video_path": None}
+        return self._run(source, on_stage_done, is_cancelled, resume, job_id)
+
+    def run_file(self, video_path, on_stage_done=None, is_cancelled=None, resume=True,
+                 job_id=None):
+        """Transcribe a local video file and generate its blog post.
+
+        The file is used where it is, without the YouTube downloader. Its
+        timestamps link to the file under ``timestamp_base_url``, or stay
+        plain text if it is not set.
+
+        Args:
+            video_path (str): The path to the video file.
+            on_stage_done (Callable, optional): Called with the name and the
+                duration in seconds of each finished stage.
+            is_cancelled (Callable, optional): Returns True if the run should
+                stop. It is checked before each stage.
+            resume (bool, optional): Whether to resume an interrupted run of
+                the same job. Defaults to True.
+            job_id (str, optional): The id of the job, which names its
+                workspace and is part of the name of its blog post. Defaults
+                to the id of the video file, and a post named after the file.
+
+        Returns:
+            dict: The same result as ``run``.
+
+        Raises:
+            FileNotFoundError: If the video file does not exist.
+            JobCancelledError: If the run was cancelled.
+        """
+        if not os.path.isfile(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
+        video_path = os.path.abspath(video_path)
+        url = None
+        if self.timestamp_base_url:
+            url = (f"{self.timestamp_base_url.rstrip('/')}/"
+                   f"{urllib.parse.quote(os.path.basename(video_path))}")
+        source = {"video_id": local_video_id(video_path), "url": url,
+                  "video_path": video_path}
+        return self._run(source, on_stage_done, is_cancelled, resume, job_id)
+
+    def _run(self, source, on_stage_done, is_cancelled, resume, job_id):
+        """Run all stages for a video. See ``run``."""
+        run_start_time = time.perf_counter()
+        cost_manager = CostManager(model_name=self.model_name)
+        # Worker threads share the pipeline, so every run counts its costs on
+        # its own copy of the blog generator, which shares the client.
+        blog_generator = copy.copy(self.blog_generator)
+        blog_generator.cost_manager = cost_manager
+        workspace = JobWorkspace(self.output_dir, job_id or source["video_id"]).create()
+        manifest = self._create_manifest(workspace)
+        if not resume:
+            manifest.discard()
+
+        redone = set()
+        stages = self._build_stages(
+            source, manifest, redone, workspace, blog_generator, job_id,
+        )
+        stage_timings = {}
+        stage_resources = {}
+
+        def run_stage(stage, *args):
+            if is_cancelled is not None and is_cancelled():
+                raise utils.JobCancelledError(f"Run cancelled before: {stage.name}")
+            start_time = time.perf_counter()
+            with self.resource_manager.stage(stage.name) as usage:
+                if stage.name in TRANSIENT_STAGES:
+                    result = stage.func(*args, **stage.kwargs)
+                elif stage.name in redone or not manifest.is_complete(stage.name):
+                    dependent_stages = descendants(stages, stage.name)
+                    redone.update(dependent_stages)
+                    manifest.discard(
+                        dependent_stages,
+                        refine_state="Generating Blog Post" in dependent_stages,
+                    )
+                    result = stage.func(*args, **stage.kwargs)
+                    manifest.complete(
+                        stage.name, result, is_path=stage.name in PATH_STAGES,
+                    )
+                else:
+                    utils.logging.info(f"Resuming after completed stage: {stage.name}")
+                    result = manifest.get(stage.name)
+            stage_timings[stage.name] = time.perf_counter() - start_time
+            stage_resources[stage.name] = usage
+            STAGE_SECONDS.observe(stage_timings[stage.name], stage=stage.name)
+            utils.logging.info(
+                f"{stage.name} done in {stage_timings[stage.name]:.1f}s "
+                f"({usage['average_threads']:.1f} threads, "
+                f"{usage['utilization']:.0%} CPU utilization)",
+            )
+            if on_stage_done is not None:
+                on_stage_done(stage.name, stage_timings[stage.name])
+            return result
+
+        results = self.scheduler.run(stages, run_stage)
+        if self.artifact_store is not None:
+            artifact_stats = self.artifact_store.stats()
+            utils.logging.info(
+                f"Artifact store: {artifact_stats['hits']} hits, "
+                f"{artifact_stats['misses']} misses, "
+                f"{artifact_stats['corrupted']} corrupted, "
+                f"{artifact_stats['evictions']} evictions, "
+                f"{artifact_stats['bytes'] / 1024 ** 2:.0f} MB in "
+                f"{artifact_stats['artifacts']} artifacts",
+            )
+        transcript_tokens = None
+        if self.transcript_compactor is not None:
+            transcript_tokens = self.transcript_compactor.token_savings(
+                results["Transcribing Audio"], results["Compacting Transcript"],
+            )
+            utils.logging.info(
+                f"Compacted the transcript from {transcript_tokens['tokens_before']} "
+                f"to {transcript_tokens['tokens_after']} tokens "
+                f"({transcript_tokens['saved_ratio']:.1%} saved)",
+            )
+        if self.cleanup_workspace:
+            workspace.cleanup()
+
+        return {
+            "blog_post_path": results["Saving to File"],
+            "cost": cost_manager.get_total_cost(),
+            "stage_timings": stage_timings,
+            "stage_resources": stage_resources,
+            "transcript_tokens": transcript_tokens,
+            "llm_tokens": cost_manager.get_token_usage(),
+            "total_seconds": time.perf_counter() - run_start_time,
+        }
@@ -0,0 +1,173 @@
+"""Runs queued jobs on forked worker processes that share the loaded models."""
+
+import gc
+import multiprocessing
+import os
+import select
+import signal
+
+from essence_extractor.src import utils
+from essence_extractor.src.job_queue import JobWorkerPool
+
+SMAPS_ROLLUP_FIELDS = {
+    "Rss": "rss", "Pss": "pss", "Private_Clean": "uss", "Private_Dirty": "uss",
+}
+
+
+def process_memory(pid):
+    """Read how much memory a process uses.
+
+    Args:
+        pid (int): The id of the process.
+
+    Returns:
+        dict: The resident memory ("rss"), the resident memory with shared
+        pages split between the processes that share them ("pss") and the
+        memory no other process shares ("uss"), in bytes, or None if the
+        system does not report them.
+    """
+    memory = {"rss": 0, "pss": 0, "uss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in SMAPS_ROLLUP_FIELDS:
+                    memory[SMAPS_ROLLUP_FIELDS[field]] += int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return memory
+
+
+class PreforkWorkerPool(JobWorkerPool):
+    """Runs queued jobs on worker processes forked from one loaded pipeline.
+
+    Worker threads share one interpreter, so jobs compete for the GIL in the
+    Python parts of the stages. Worker processes do not, but each would load
+    Whisper, the embedding model and the heavy modules of the stages again.
+    Instead, the pool creates a single pipeline, loads its models and forks
+    the workers from it, so all workers share the pages of the weights with
+    the parent until one of them writes to them.
+
+    Reference counting and the garbage collector write to every Python object
+    they touch, which copies the pages the objects live on into the worker.
+    As recommended for forking servers, the garbage collector is disabled
+    while the models are loaded, so no holes are freed that later objects
+    would fill, and every object is moved into the permanent generation with
+    ``gc.freeze`` before forking, so the collectors of the workers never
+    touch them.
+
+    The pool needs the "fork" start method, which is not available on
+    Windows. Metrics recorded by a job stay in the process of its worker.
+
+    Attributes:
+        job_store (JobStore): The store to take jobs from.
+        pipeline_factory (Callable): Creates the pipeline shared by all workers.
+        n_workers (int): The number of worker processes.
+        poll_interval (float): How long an idle worker waits before looking
+            for new jobs, in seconds.
+    """
+
+    def __init__(self, job_store, pipeline_factory, n_workers=1, poll_interval=1.0):
+        super().__init__(job_store, pipeline_factory, n_workers=n_workers,
+                         poll_interval=poll_interval)
+        self._context = multiprocessing.get_context("fork")
+        self._processes = []
+        # The workers stop when the write end of this pipe is closed. Unlike a
+        # multiprocessing.Event, a pipe keeps working when a worker is killed
+        # while it waits, and it also closes when the parent dies.
+        self._stop_reader = None
+        self._stop_writer = None
+
+    def start(self):
+        """Load the pipeline and fork the worker processes."""
+        self.job_store.requeue_running()
+        self._stop_reader, self._stop_writer = os.pipe()
+        gc.disable()
+        try:
+            self._pipeline = self.pipeline_factory()
+            self._pipeline.load_models()
+            self._processes = [self._fork_worker(i) for i in range(self.n_workers)]
+        finally:
+            gc.enable()
+
+    def _fork_worker(self, index):
+        gc.freeze()
+        process = self._context.Process(
+            target=self._work_in_child, name=f"essence-worker-{index}",
+        )
+        process.start()
+        utils.logging.info(f"Started worker {process.name} with pid {process.pid}")
+        return process
+
+    def _wait_for_stop(self, timeout):
+        """Wait until the pool is stopped, and return whether it was."""
+        return bool(select.select([self._stop_reader], [], [], timeout)[0])
+
+    def _work_in_child(self):
+        gc.enable()
+        os.close(self._stop_writer)
+        # Ctrl+C reaches the whole process group. The parent stops the
+        # workers after their current job instead.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        while not self._wait_for_stop(0):
+            job = self.job_store.claim_next()
+            if job is None:
+                self._wait_for_stop(self.poll_interval)
+                continue
+            self.run_job(self._pipeline, job)
+        self._pipeline.close()
+
+    def respawn_dead_workers(self):
+        """Replace the workers that died, for example because they ran out of memory.
+
+        The job a dead worker was running is marked as failed, with the exit
+        code of the worker as its error.
+
+        Returns:
+            int: The number of replaced workers.
+        """
+        if self._stop_writer is None:
+            return 0
+        n_respawned = 0
+        for i, process in enumerate(self._processes):
+            if not process.is_alive():
+                process.join()
+                error = f"Worker {process.name} exited with code {process.exitcode}"
+                utils.logging.warning(error)
+                self.job_store.fail_running(process.pid, error)
+                self._processes[i] = self._fork_worker(i)
+                n_respawned += 1
+        return n_respawned
+
+    def worker_memory(self):
+        """Read how much memory every running worker uses.
+
+        Returns:
+            Dict[int, dict]: The memory of each worker by its pid, as returned
+            by ``process_memory``.
+        """
+        return {process.pid: process_memory(process.pid)
+                for process in self._processes if process.is_alive()}
+
+    def stop(self, timeout=None):
+        """Stop the workers after their current job.
+
+        Workers that are still running after the timeout are terminated.
+
+        Args:
+            timeout (float, optional): How long to wait for each worker.
+        """
+        if self._stop_writer is not None:
+            os.close(self._stop_writer)
+            self._stop_writer = None
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                utils.logging.warning(f"Terminating worker {process.name}")
+                process.terminate()
+                process.join()
+        self._processes = []
+        self._pipeline = None
+        if self._stop_reader is not None:
+            os.close(self._stop_reader)
+            self._stop_reader = None
@@ -0,0 +1,240 @@
+"""Shares the CPU cores of the host between the stages that run at once."""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+
+from essence_extractor.src import utils
+
+# The share of the cores a stage gets relative to the other running stages.
+DEFAULT_STAGE_WEIGHTS = {
+    "Transcribing Audio": 4,
+    "Indexing Video Frames": 2,
+    "Adding Images": 2,
+    "Updating Search Index": 2,
+}
+# Stages whose work runs on the intra-op thread pool of torch.
+TORCH_STAGES = frozenset({
+    "Transcribing Audio", "Indexing Video Frames", "Adding Images",
+    "Updating Search Index",
+})
+
+
+def process_cpu_seconds():
+    """Measure the CPU time of this process and its finished child processes.
+
+    Returns:
+        float: The user and system CPU time in seconds. Child processes such
+        as Tesseract count once they have exited.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class ResourceManager:
+    """Shares the CPU cores of the host between the stages that run at once.
+
+    Each running stage gets a thread budget: the cores split by the weights
+    of all running stages, so a stage alone gets every core and concurrent
+    stages never ask for more threads together than there are. The budgets
+    are recomputed whenever a stage starts or ends. Stages read their budget
+    through ``threads`` and ``pool_size`` to size their thread pools, and the
+    intra-op threads of torch follow the smallest budget of the running
+    torch stages.
+
+    The CPU time used while several stages run is attributed to them in
+    proportion to their budgets, which gives the CPU utilization of each
+    stage: its CPU time divided by the thread seconds it was given.
+
+    Attributes:
+        total_threads (int): The number of threads shared between the stages.
+        stage_weights (dict): Maps stage names to their weight. Stages that
+            are not listed have ``default_weight``.
+        default_weight (int): The weight of stages not in ``stage_weights``.
+        torch_stages (Set[str]): The stages that run torch models.
+        usage (dict): Maps stage names to their cumulative CPU usage.
+    """
+
+    def __init__(self, total_threads=None, stage_weights=None, default_weight=1,
+                 torch_stages=TORCH_STAGES):
+        if total_threads is not None and total_threads < 1:
+            raise ValueError("The number of threads must be at least 1")
+        self.total_threads = total_threads or os.cpu_count() or 1
+        self.stage_weights = dict(
+            DEFAULT_STAGE_WEIGHTS if stage_weights is None else stage_weights,
+        )
+        self.default_weight = default_weight
+        self.torch_stages = set(torch_stages)
+        self.usage = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._active = []
+        self._last_wall_time = time.perf_counter()
+        self._last_cpu_time = process_cpu_seconds()
+
+    def configure_environment(self):
+        """Limit the threads of native libraries before they are imported.
+
+        OpenMP and MKL are capped to the total budget and the Hugging Face
+        tokenizers do not start their own pool. Variables that are already set
+        are kept.
+        """
+        for name, value in [("OMP_NUM_THREADS", str(self.total_threads)),
+                            ("MKL_NUM_THREADS", str(self.total_threads)),
+                            ("TOKENIZERS_PARALLELISM", "false")]:
+            os.environ.setdefault(name, value)
+
+    def weight(self, stage_name):
+        """Get the weight of a stage.
+
+        Args:
+            stage_name (str): The name of the stage.
+
+        Returns:
+            int: The weight of the stage.
+        """
+        return self.stage_weights.get(stage_name, self.default_weight)
+
+    def _account(self):
+        """Attribute the time since the last change to the running stages."""
+        wall_time = time.perf_counter()
+        cpu_time = process_cpu_seconds()
+        wall_delta = wall_time - self._last_wall_time
+        cpu_delta = cpu_time - self._last_cpu_time
+        self._last_wall_time, self._last_cpu_time = wall_time, cpu_time
+
+        total_budget = sum(entry["threads"] for entry in self._active)
+        for entry in self._active:
+            entry["cpu_seconds"] += cpu_delta * entry["threads"] / total_budget
+            entry["thread_seconds"] += wall_delta * entry["threads"]
+
+    def _rebalance(self):
+        """Split the threads between the running stages by their weights."""
+        total_weight = sum(self.weight(entry["name"]) for entry in self._active)
+        for entry in self._active:
+            share = self.total_threads * self.weight(entry["name"]) / total_weight
+            entry["threads"] = max(1, int(share))
+
+        torch_budgets = [entry["threads"] for entry in self._active
+                         if entry["name"] in self.torch_stages]
+        torch = sys.modules.get("torch")
+        if torch_budgets and torch is not None:
+            torch.set_num_threads(min(torch_budgets))
+
+    @contextlib.contextmanager
+    def stage(self, stage_name):
+        """Run a stage within its thread budget.
+
+        Args:
+            stage_name (str): The name of the stage.
+
+        Yields:
+            dict: The usage of this run of the stage. Once the stage is done
+            it holds its wall time, CPU time, average threads and CPU
+            utilization.
+        """
+        entry = {"name": stage_name, "threads": 1, "cpu_seconds": 0.0,
+                 "thread_seconds": 0.0}
+        with self._lock:
+            self._account()
+            start_time = self._last_wall_time
+            self._active.append(entry)
+            self._rebalance()
+        previous_entry = getattr(self._local, "entry", None)
+        self._local.entry = entry
+        try:
+            yield entry
+        finally:
+            self._local.entry = previous_entry
+            with self._lock:
+                self._account()
+                self._active.remove(entry)
+                if self._active:
+                    self._rebalance()
+                wall_seconds = self._last_wall_time - start_time
+                entry.update(self._summarize(
+                    wall_seconds, entry["cpu_seconds"], entry["thread_seconds"],
+                ))
+                self._add_usage(stage_name, entry)
+
+    @staticmethod
+    def _summarize(wall_seconds, cpu_seconds, thread_seconds):
+        """Derive the average threads and utilization of a stage.
+
+        Args:
+            wall_seconds (float): The wall time of the stage.
+            cpu_seconds (float): The CPU time attributed to the stage.
+            thread_seconds (float): The thread budget integrated over time.
+
+        Returns:
+            dict: The usage of the stage.
+        """
+        return {
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": cpu_seconds,
+            "thread_seconds": thread_seconds,
+            "average_threads": thread_seconds / wall_seconds if wall_seconds else 0.0,
+            "utilization": cpu_seconds / thread_seconds if thread_seconds else 0.0,
+        }
+
+    def _add_usage(self, stage_name, entry):
+        """Add a run of a stage to the cumulative usage of the stage."""
+        usage = self.usage.get(stage_name, {"runs": 0, "wall_seconds": 0.0,
+                                            "cpu_seconds": 0.0, "thread_seconds": 0.0})
+        usage = {
+            "runs": usage["runs"] + 1,
+            **{key: usage[key] + entry[key]
+               for key in ["wall_seconds", "cpu_seconds", "thread_seconds"]},
+        }
+        usage.update(self._summarize(
+            usage["wall_seconds"], usage["cpu_seconds"], usage["thread_seconds"],
+        ))
+        self.usage[stage_name] = usage
+
+    def threads(self, default=None):
+        """Get the thread budget of the stage running on this thread.
+
+        Args:
+            default (int, optional): The budget outside of a stage. Defaults
+                to all threads.
+
+        Returns:
+            int: The number of threads the stage may use.
+        """
+        entry = getattr(self._local, "entry", None)
+        if entry is None:
+            return default or self.total_threads
+        with self._lock:
+            return entry["threads"]
+
+    def pool_size(self, n_tasks, default=None):
+        """Get the number of workers of a pool within the thread budget.
+
+        Args:
+            n_tasks (int): The number of tasks of the pool.
+            default (int, optional): The budget outside of a stage. Defaults
+                to all threads.
+
+        Returns:
+            int: The number of workers, at least 1.
+        """
+        return max(1, min(n_tasks, self.threads(default)))
+
+    def report(self):
+        """Log the CPU utilization of every stage.
+
+        Returns:
+            dict: Maps stage names to their cumulative usage.
+        """
+        with self._lock:
+            usage = {name: dict(stage_usage) for name, stage_usage in self.usage.items()}
+        for name, stage_usage in usage.items():
+            utils.logging.info(
+                f"{name}: {stage_usage['cpu_seconds']:.1f} CPU s over "
+                f"{stage_usage['wall_seconds']:.1f}s with "
+                f"{stage_usage['average_threads']:.1f} threads "
+                f"({stage_usage['utilization']:.0%} utilization)",
+            )
+        return usage
@@ -0,0 +1,115 @@
+"""Runs pipeline stages as a dependency graph."""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Stage:
+    """A stage of a pipeline and the stages it depends on.
+
+    Attributes:
+        name (str): The name of the stage.
+        func (Callable): Produces the result of the stage. It is called with
+            the results of the input stages, in the order of ``inputs``,
+            followed by ``args``.
+        inputs (List[str]): The names of the stages whose results are needed.
+        args (tuple): Additional positional arguments of ``func``.
+        kwargs (dict): Keyword arguments of ``func``.
+    """
+
+    def __init__(self, name, func, inputs=(), args=(), kwargs=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+
+
+def descendants(stages, name):
+    """Find all stages that directly or indirectly depend on a stage.
+
+    Args:
+        stages (List[Stage]): The stages of the graph.
+        name (str): The name of the stage.
+
+    Returns:
+        Set[str]: The names of the dependent stages.
+    """
+    found = set()
+    frontier = [name]
+    while frontier:
+        current = frontier.pop()
+        for stage in stages:
+            if current in stage.inputs and stage.name not in found:
+                found.add(stage.name)
+                frontier.append(stage.name)
+    return found
+
+
+class StageScheduler:
+    """Runs each stage as soon as the stages it depends on are done.
+
+    Independent stages run at the same time on a thread pool, so network
+    bound work such as LLM calls overlaps with media processing.
+
+    Attributes:
+        max_workers (int): The maximum number of stages running at once.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _validate(stages):
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            unknown = set(stage.inputs) - set(names)
+            if unknown:
+                raise ValueError(f"Stage {stage.name} has unknown inputs: {unknown}")
+
+    def run(self, stages, run_stage=None):
+        """Run all stages.
+
+        Args:
+            stages (List[Stage]): The stages to run.
+            run_stage (Callable, optional): Runs a stage given the stage and
+                the arguments for its function. Defaults to calling the
+                function of the stage.
+
+        Returns:
+            dict: Maps the name of each stage to its result.
+
+        Raises:
+            ValueError: If the stages do not form a valid dependency graph.
+        """
+        self._validate(stages)
+        if run_stage is None:
+            def run_stage(stage, *args):
+                return stage.func(*args, **stage.kwargs)
+
+        results = {}
+        pending = list(stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for stage in list(pending):
+                    if all(name in results for name in stage.inputs):
+                        args = [results[name] for name in stage.inputs] + list(stage.args)
+                        running[executor.submit(run_stage, stage, *args)] = stage
+                        pending.remove(stage)
+
+                if not running:
+                    names = [stage.name for stage in pending]
+                    raise ValueError(f"Stages depend on each other in a cycle: {names}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        results[stage.name] = future.result()
+                    except BaseException:
+                        for other_future in running:
+                            other_future.cancel()
+                        raise
+        return results
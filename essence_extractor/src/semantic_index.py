@@ -0,0 +1,559 @@
+"""A persistent semantic index of frames and transcript chunks of many videos."""
+
+import contextlib
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from essence_extractor.src import utils
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+faiss = utils.lazy_import("faiss")
+
+STORAGE_TYPES = ("fp16", "pq")
+# The number of search filters whose Faiss selectors are kept.
+SELECTOR_CACHE_SIZE = 128
+
+
+class SemanticIndex:
+    """Searches the frames and transcript chunks of all processed videos.
+
+    Items are stored in a SQLite database together with their normalized
+    embedding, which stays the source of truth. A Faiss index over these
+    embeddings is kept in memory and updated incrementally, so similarities
+    are cosine similarities computed as inner products.
+
+    Writing the whole Faiss index takes time proportional to its size, so it
+    is only written to disk every ``save_interval`` changes and on close.
+    The database records which items were added and removed since, and an
+    index read from disk, or held by another process, catches up by
+    replaying them.
+
+    Small indexes are searched exactly. Once the index holds more than
+    ``ann_threshold`` items it is rebuilt as an inverted file index whose
+    vectors are stored as float16 or product quantization codes, which
+    keeps memory and query time low for thousands of videos. Inverted file
+    indexes, unlike HNSW graphs, support deleting the items of a video.
+
+    Attributes:
+        index_dir (str): The directory the index is stored in.
+        model_key (str): Identifies the model of the embeddings. Adding
+            embeddings of another model raises a ValueError.
+        ann_threshold (int): The number of items above which the index is
+            approximate.
+        storage (str): How vectors of the approximate index are stored,
+            "fp16" or "pq".
+        nprobe (int): The number of inverted lists searched per query.
+        save_interval (int): The number of added or deleted videos after
+            which the Faiss index is written to disk.
+    """
+
+    INDEX_FILE_NAME = "index.faiss"
+    DB_FILE_NAME = "metadata.sqlite3"
+    LOCK_FILE_NAME = "index.lock"
+
+    def __init__(
+            self,
+            index_dir,
+            model_key=None,
+            ann_threshold=100000,
+            storage="fp16",
+            nprobe=16,
+            save_interval=20,
+    ):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Storage must be one of {list(STORAGE_TYPES)}")
+        self.index_dir = index_dir
+        self.model_key = model_key
+        self.ann_threshold = ann_threshold
+        self.storage = storage
+        self.nprobe = nprobe
+        self.save_interval = save_interval
+        self._index = None
+        # The version of the database the index reflects, and its largest id.
+        self._loaded_version = None
+        self._loaded_max_id = 0
+        self._unsaved_changes = 0
+        self._selectors = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(index_dir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    video_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    text TEXT,
+                    start_time REAL,
+                    source TEXT,
+                    vector BLOB NOT NULL
+                )
+                """,
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS items_video_id ON items (video_id, kind)",
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)",
+            )
+            # The ids of items that were removed after the index on disk was
+            # written, and the version of the database that removed them.
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS removed_items "
+                "(id INTEGER PRIMARY KEY, version INTEGER NOT NULL)",
+            )
+        stored_model_key = self._get_setting("model_key")
+        if model_key is not None and stored_model_key not in (None, model_key):
+            raise ValueError(
+                f"Index was built with {stored_model_key}, not {model_key}",
+            )
+
+    def _path(self, file_name):
+        return os.path.join(self.index_dir, file_name)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(
+            self._path(self.DB_FILE_NAME), timeout=30, isolation_level=None,
+        )
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Locks the index against other threads and processes."""
+        with self._lock, open(self._path(self.LOCK_FILE_NAME), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_setting(self, key, connection=None):
+        with contextlib.ExitStack() as stack:
+            if connection is None:
+                connection = stack.enter_context(self._connect())
+            row = connection.execute(
+                "SELECT value FROM settings WHERE key = ?", (key,),
+            ).fetchone()
+        return row["value"] if row else None
+
+    @staticmethod
+    def _set_setting(connection, key, value):
+        connection.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            (key, str(value)),
+        )
+
+    @staticmethod
+    def _normalize(embeddings):
+        embeddings = np.array(embeddings, dtype=np.float32, ndmin=2)
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def _is_approximate(self, index):
+        return faiss.try_extract_index_ivf(index) is not None
+
+    def _new_index(self, dimension, n_items):
+        """Creates an empty index suited to the number of items.
+
+        Args:
+            dimension (int): The dimension of the embeddings.
+            n_items (int): The number of items the index will hold.
+
+        Returns:
+            faiss.Index: The index. Approximate indexes still need training.
+        """
+        if n_items <= self.ann_threshold:
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        nlist = max(1, int(4 * math.sqrt(n_items)))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if self.storage == "pq" and dimension % 8 == 0:
+            index = faiss.IndexIVFPQ(
+                quantizer, dimension, nlist, dimension // 8, 8,
+                faiss.METRIC_INNER_PRODUCT,
+            )
+        else:
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_fp16,
+                faiss.METRIC_INNER_PRODUCT,
+            )
+        index.nprobe = self.nprobe
+        return index
+
+    def _get_version(self, connection):
+        return int(self._get_setting("version", connection) or 0)
+
+    def _iter_vectors(self, connection, batch_size=10000, order="id", min_id=0):
+        """Reads the stored items with an id larger than ``min_id`` in batches.
+
+        Yields:
+            Tuple[np.ndarray, np.ndarray]: The ids and vectors of a batch.
+        """
+        dimension = int(self._get_setting("dimension", connection))
+        cursor = connection.execute(
+            f"SELECT id, vector FROM items WHERE id > ? ORDER BY {order}", (min_id,),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            ids = np.array([row["id"] for row in rows], dtype=np.int64)
+            vectors = np.frombuffer(
+                b"".join(row["vector"] for row in rows), dtype=np.float32,
+            ).reshape(len(rows), dimension)
+            yield ids, vectors
+
+    def _rebuild(self, connection):
+        """Rebuilds the Faiss index from the stored items."""
+        n_items = connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        self._loaded_version = self._get_version(connection)
+        self._loaded_max_id = connection.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM items",
+        ).fetchone()[0]
+        dimension = self._get_setting("dimension", connection)
+        if dimension is None:
+            self._index = None
+            return
+        index = self._new_index(int(dimension), n_items)
+        if not index.is_trained:
+            utils.logging.info(f"Training approximate index on {n_items} items")
+            ivf = faiss.extract_index_ivf(index)
+            n_train = min(n_items, ivf.nlist * 64)
+            _, train_vectors = next(
+                self._iter_vectors(connection, batch_size=n_train, order="RANDOM()"),
+            )
+            index.train(train_vectors)
+        for ids, vectors in self._iter_vectors(connection):
+            index.add_with_ids(vectors, ids)
+        self._index = index
+
+    def _save(self, connection):
+        """Writes the Faiss index and records which version it reflects."""
+        index_path = self._path(self.INDEX_FILE_NAME)
+        if self._index is None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(index_path)
+        else:
+            part_path = f"{index_path}.part"
+            faiss.write_index(self._index, part_path)
+            os.replace(part_path, index_path)
+        self._set_setting(connection, "index_version", self._loaded_version)
+        self._set_setting(connection, "index_max_id", self._loaded_max_id)
+        connection.execute(
+            "DELETE FROM removed_items WHERE version <= ?", (self._loaded_version,),
+        )
+        self._unsaved_changes = 0
+
+    def _catch_up(self, connection):
+        """Replays the items added and removed since the loaded version."""
+        removed_ids = np.array([row["id"] for row in connection.execute(
+            "SELECT id FROM removed_items WHERE version > ?", (self._loaded_version,),
+        )], dtype=np.int64)
+        if len(removed_ids):
+            self._index.remove_ids(faiss.IDSelectorBatch(removed_ids))
+        for ids, vectors in self._iter_vectors(connection, min_id=self._loaded_max_id):
+            self._index.add_with_ids(vectors, ids)
+            self._loaded_max_id = int(ids[-1])
+        self._loaded_version = self._get_version(connection)
+
+    def _ensure_loaded(self, connection):
+        """Loads the Faiss index and brings it up to date with the database.
+
+        The index is read from disk if it was not loaded yet or the index on
+        disk is newer, and rebuilt from the database if there is none.
+        """
+        version = self._get_version(connection)
+        if self._index is not None and version == self._loaded_version:
+            return
+        self._selectors.clear()
+        index_version = self._get_setting("index_version", connection)
+        index_max_id = self._get_setting("index_max_id", connection)
+        index_path = self._path(self.INDEX_FILE_NAME)
+        if self._index is None or int(index_version or 0) > self._loaded_version:
+            if index_max_id is not None and os.path.exists(index_path):
+                self._index = faiss.read_index(index_path)
+                self._loaded_version = int(index_version)
+                self._loaded_max_id = int(index_max_id)
+                # Items written to the file just before a crash kept the
+                # settings from recording them are replayed, not added twice.
+                self._index.remove_ids(
+                    faiss.IDSelectorRange(self._loaded_max_id + 1, 2 ** 62),
+                )
+            else:
+                if version:
+                    utils.logging.info("Semantic index is missing, rebuilding it")
+                self._rebuild(connection)
+                self._save(connection)
+        if self._index is not None and self._loaded_version != version:
+            self._catch_up(connection)
+        if self._index is not None and self._is_approximate(self._index):
+            faiss.extract_index_ivf(self._index).nprobe = self.nprobe
+
+    def _load(self):
+        """Loads the Faiss index while holding the lock of the index."""
+        with self._exclusive(), self._connect() as connection:
+            self._ensure_loaded(connection)
+
+    def _bump_version(self, connection):
+        self._set_setting(connection, "version", self._get_version(connection) + 1)
+
+    def _remove(self, connection, video_id, kind=None):
+        """Removes the items of a video from the database.
+
+        The removed ids are recorded for the version the change is committed
+        with, so the index can catch up with the removal.
+
+        Returns:
+            int: The number of removed items.
+        """
+        query = "SELECT id FROM items WHERE video_id = ?"
+        params = (video_id,)
+        if kind is not None:
+            query += " AND kind = ?"
+            params += (kind,)
+        ids = [row["id"] for row in connection.execute(query, params)]
+        if not ids:
+            return 0
+        connection.execute(
+            f"DELETE FROM items WHERE id IN ({','.join('?' * len(ids))})", ids,
+        )
+        version = self._get_version(connection) + 1
+        connection.executemany(
+            "INSERT OR REPLACE INTO removed_items (id, version) VALUES (?, ?)",
+            [(item_id, version) for item_id in ids],
+        )
+        return len(ids)
+
+    def _changed(self, connection):
+        """Counts a committed change and writes the index once enough piled up."""
+        self._unsaved_changes += 1
+        if self._unsaved_changes >= self.save_interval:
+            self._save(connection)
+
+    def add_video(self, video_id, kind, names, embeddings, texts=None, start_times=None,
+                  source=None):
+        """Adds the items of a video, replacing its previous items of this kind.
+
+        Args:
+            video_id (str): The id of the video.
+            kind (str): The kind of the items, for example "frame" or
+                "transcript".
+            names (List[str]): The name of each item, such as an image name.
+            embeddings (np.ndarray): The embedding of each item.
+            texts (List[str], optional): The text of each item.
+            start_times (List[float], optional): Where each item starts in
+                the video, in seconds.
+            source (str, optional): The URL or the path of the video, which
+                search results link to.
+
+        Returns:
+            int: The number of added items.
+
+        Raises:
+            ValueError: If the embeddings do not match the index.
+        """
+        vectors = self._normalize(embeddings)
+        if len(names) == 0:
+            vectors = vectors.reshape(0, -1)
+        if len(vectors) != len(names):
+            raise ValueError("Expected one embedding per item")
+        texts = texts if texts is not None else [None] * len(names)
+        start_times = start_times if start_times is not None else [None] * len(names)
+
+        with self._exclusive(), self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._ensure_loaded(connection)
+                dimension = self._get_setting("dimension", connection)
+                if len(names) > 0 and dimension is None:
+                    self._set_setting(connection, "dimension", vectors.shape[1])
+                    if self.model_key is not None:
+                        self._set_setting(connection, "model_key", self.model_key)
+                elif len(names) > 0 and int(dimension) != vectors.shape[1]:
+                    raise ValueError(
+                        f"Embedding dimension {vectors.shape[1]} does not match "
+                        f"the index dimension {dimension}",
+                    )
+
+                self._remove(connection, video_id, kind)
+                n_added = 0
+                for name, text, start_time, vector in zip(
+                        names, texts, start_times, vectors):
+                    connection.execute(
+                        "INSERT INTO items "
+                        "(video_id, kind, name, text, start_time, source, vector) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (video_id, kind, name, text, start_time, source,
+                         vector.tobytes()),
+                    )
+                    n_added += 1
+                self._bump_version(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+            n_items = connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            if (self._index is None or self._is_approximate(self._index)
+                    != (n_items > self.ann_threshold)):
+                self._rebuild(connection)
+                self._save(connection)
+            else:
+                self._selectors.clear()
+                self._catch_up(connection)
+                self._changed(connection)
+        return n_added
+
+    def delete_video(self, video_id):
+        """Deletes all items of a video.
+
+        Args:
+            video_id (str): The id of the video.
+
+        Returns:
+            int: The number of deleted items.
+        """
+        with self._exclusive(), self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._ensure_loaded(connection)
+                n_removed = self._remove(connection, video_id)
+                if n_removed:
+                    self._bump_version(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            if n_removed:
+                self._selectors.clear()
+                self._catch_up(connection)
+                self._changed(connection)
+        return n_removed
+
+    def flush(self):
+        """Writes the Faiss index to disk if it changed since it was last written."""
+        with self._exclusive(), self._connect() as connection:
+            if self._unsaved_changes:
+                self._ensure_loaded(connection)
+                self._save(connection)
+
+    def close(self):
+        """Writes the changes of the Faiss index to disk. See ``flush``."""
+        self.flush()
+
+    def _selector(self, connection, kind, video_id):
+        """Gets the Faiss selector of the items of a kind or a video.
+
+        Selectors are kept until the index changes, so repeated searches with
+        the same filter do not read the ids of its items again.
+
+        Returns:
+            faiss.IDSelector: The selector, or None if no item matches.
+        """
+        key = (kind, video_id)
+        if key in self._selectors:
+            self._selectors.move_to_end(key)
+            return self._selectors[key][0]
+        conditions, values = [], []
+        if kind is not None:
+            conditions.append("kind = ?")
+            values.append(kind)
+        if video_id is not None:
+            conditions.append("video_id = ?")
+            values.append(video_id)
+        ids = np.array([row["id"] for row in connection.execute(
+            f"SELECT id FROM items WHERE {' AND '.join(conditions)}", values,
+        )], dtype=np.int64)
+        selector = faiss.IDSelectorBatch(ids) if len(ids) else None
+        # The ids are kept alive with the selector that was built from them.
+        self._selectors[key] = (selector, ids)
+        while len(self._selectors) > SELECTOR_CACHE_SIZE:
+            self._selectors.popitem(last=False)
+        return selector
+
+    def search(self, query_embedding, k=10, kind=None, video_id=None):
+        """Finds the items most similar to a query.
+
+        Args:
+            query_embedding (np.ndarray): The embedding of the query.
+            k (int, optional): The number of items to return. Defaults to 10.
+            kind (str, optional): Only return items of this kind.
+            video_id (str, optional): Only return items of this video.
+
+        Returns:
+            List[dict]: The items, most similar first, with their video id,
+            kind, name, text, start time, source and cosine similarity as
+            "score".
+        """
+        query = self._normalize(query_embedding)
+        with self._lock, self._connect() as connection:
+            self._load()
+            if self._index is None or self._index.ntotal == 0:
+                return []
+
+            params = None
+            if kind is not None or video_id is not None:
+                selector = self._selector(connection, kind, video_id)
+                if selector is None:
+                    return []
+                if self._is_approximate(self._index):
+                    params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+                else:
+                    params = faiss.SearchParameters(sel=selector)
+            scores, ids = self._index.search(query, k, params=params)
+
+            results = []
+            for score, item_id in zip(scores[0], ids[0]):
+                if item_id < 0:
+                    continue
+                row = connection.execute(
+                    "SELECT video_id, kind, name, text, start_time, source "
+                    "FROM items WHERE id = ?",
+                    (int(item_id),),
+                ).fetchone()
+                if row is not None:
+                    results.append({**dict(row), "score": float(score)})
+        return results
+
+    def stats(self):
+        """Describes the contents of the index.
+
+        Returns:
+            dict: The number of items and videos, the number of items of each
+            kind and the type of the Faiss index.
+        """
+        with self._lock, self._connect() as connection:
+            self._load()
+            kinds = dict(connection.execute(
+                "SELECT kind, COUNT(*) FROM items GROUP BY kind",
+            ).fetchall())
+            n_videos = connection.execute(
+                "SELECT COUNT(DISTINCT video_id) FROM items",
+            ).fetchone()[0]
+        return {
+            "items": sum(kinds.values()),
+            "videos": n_videos,
+            "kinds": kinds,
+            "index_type": type(self._index).__name__ if self._index else None,
+        }
+
+    def __len__(self):
+        """Returns the number of items in the index."""
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
@@ -0,0 +1,177 @@
+"""Detects frames likely to contain text so OCR can skip the others."""
+
+import numpy as np
+
+
+class TextPresenceDetector:
+    """Detects text regions in video frames using edge density.
+
+    Frames are converted to grayscale and downscaled, then split into small
+    cells. Printed text produces many sharp, high contrast strokes, so cells
+    whose share of strong edges lies in a text-like range are marked as text.
+    Neighbouring text cells are merged into regions. Uniform backgrounds and
+    smooth footage have too few edges, noisy textures too many, so speaker
+    shots and B-roll are rejected without running OCR. The detector keeps no
+    state between frames, so jobs running at the same time can share it.
+
+    Attributes:
+        analysis_width (int): The width frames are downscaled to, in pixels.
+        edge_threshold (float): The minimum brightness difference between
+            neighbouring pixels that counts as an edge, from 0 to 255.
+        cell_size (int): The size of a cell of the downscaled frame, in pixels.
+        min_cell_edge_density (float): The minimum share of edge pixels in a
+            text cell.
+        max_cell_edge_density (float): The maximum share of edge pixels in a
+            text cell.
+        min_region_cells (int): Regions with fewer text cells are ignored.
+        padding (int): Margin added around each region, in pixels of the
+            original frame.
+    """
+
+    def __init__(
+            self,
+            analysis_width=320,
+            edge_threshold=60.0,
+            cell_size=4,
+            min_cell_edge_density=0.05,
+            max_cell_edge_density=0.5,
+            min_region_cells=2,
+            padding=16,
+    ):
+        self.analysis_width = analysis_width
+        self.edge_threshold = edge_threshold
+        self.cell_size = cell_size
+        self.min_cell_edge_density = min_cell_edge_density
+        self.max_cell_edge_density = max_cell_edge_density
+        self.min_region_cells = min_region_cells
+        self.padding = padding
+
+    def _downscaled_grayscale(self, frame):
+        """Converts a frame to grayscale and downscales it by block averaging.
+
+        Args:
+            frame (np.ndarray): An RGB or grayscale frame.
+
+        Returns:
+            Tuple[np.ndarray, int]: The grayscale frame and the factor it was
+            downscaled by.
+        """
+        frame = np.asarray(frame, dtype=np.float32)
+        if frame.ndim == 3:
+            gray = frame[..., :3] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        else:
+            gray = frame
+        scale = max(1, gray.shape[1] // self.analysis_width)
+        height, width = gray.shape[0] // scale, gray.shape[1] // scale
+        gray = gray[:height * scale, :width * scale]
+        gray = gray.reshape(height, scale, width, scale).mean(axis=(1, 3))
+        return gray, scale
+
+    def _text_cells(self, gray):
+        """Marks the cells of a grayscale frame that look like text.
+
+        Args:
+            gray (np.ndarray): The downscaled grayscale frame.
+
+        Returns:
+            np.ndarray: A boolean grid with one entry per cell.
+        """
+        size = self.cell_size
+        rows, cols = (gray.shape[0] - 1) // size, (gray.shape[1] - 1) // size
+
+        def cell_density(edges):
+            edges = edges[:rows * size, :cols * size]
+            return edges.reshape(rows, size, cols, size).mean(axis=(1, 3))
+
+        # Strokes of characters cross a cell in both directions, while the
+        # outline of a shape only produces edges along one direction
+        horizontal = cell_density(np.abs(np.diff(gray, axis=1)) > self.edge_threshold)
+        vertical = cell_density(np.abs(np.diff(gray, axis=0)) > self.edge_threshold)
+        stroke_density = np.minimum(horizontal, vertical)
+        edge_density = np.maximum(horizontal, vertical)
+        return ((stroke_density >= self.min_cell_edge_density)
+                & (edge_density <= self.max_cell_edge_density))
+
+    def _merge_cells(self, cells):
+        """Merges neighbouring text cells into rectangular regions.
+
+        Args:
+            cells (np.ndarray): The boolean grid of text cells.
+
+        Returns:
+            List[Tuple[int, int, int, int]]: The top, left, bottom and right
+            cell of each region, with exclusive ends.
+        """
+        seen = np.zeros_like(cells)
+        regions = []
+        for start in zip(*np.nonzero(cells)):
+            if seen[start]:
+                continue
+            seen[start] = True
+            stack = [start]
+            component = []
+            while stack:
+                row, col = stack.pop()
+                component.append((row, col))
+                # Text cells of a line are often one cell apart, between words
+                for d_row in (-1, 0, 1):
+                    for d_col in (-2, -1, 0, 1, 2):
+                        neighbour = (row + d_row, col + d_col)
+                        if (0 <= neighbour[0] < cells.shape[0]
+                                and 0 <= neighbour[1] < cells.shape[1]
+                                and cells[neighbour] and not seen[neighbour]):
+                            seen[neighbour] = True
+                            stack.append(neighbour)
+            if len(component) >= self.min_region_cells:
+                rows, cols = zip(*component)
+                regions.append((min(rows), min(cols), max(rows) + 1, max(cols) + 1))
+        return regions
+
+    def detect_text_regions(self, frame):
+        """Detects the regions of a frame that are likely to contain text.
+
+        Args:
+            frame (np.ndarray): An RGB or grayscale frame.
+
+        Returns:
+            List[Tuple[int, int, int, int]]: The top, left, bottom and right
+            pixel of each region in the original frame, with exclusive ends.
+            The list is empty if the frame is unlikely to contain text.
+        """
+        gray, scale = self._downscaled_grayscale(frame)
+        cell_regions = self._merge_cells(self._text_cells(gray))
+
+        height, width = np.shape(frame)[:2]
+        pixels = self.cell_size * scale
+        return [
+            (int(max(top * pixels - self.padding, 0)),
+             int(max(left * pixels - self.padding, 0)),
+             int(min(bottom * pixels + self.padding, height)),
+             int(min(right * pixels + self.padding, width)))
+            for top, left, bottom, right in cell_regions
+        ]
+
+    def contains_text(self, frame):
+        """Checks whether a frame is likely to contain text.
+
+        Args:
+            frame (np.ndarray): An RGB or grayscale frame.
+
+        Returns:
+            bool: Whether OCR should be run on the frame.
+        """
+        return bool(self.detect_text_regions(frame))
+
+    @staticmethod
+    def bounding_box(regions):
+        """Computes the smallest box containing all regions.
+
+        Args:
+            regions (List[Tuple[int, int, int, int]]): The regions.
+
+        Returns:
+            Tuple[int, int, int, int]: The top, left, bottom and right pixel
+            of the box.
+        """
+        tops, lefts, bottoms, rights = zip(*regions)
+        return min(tops), min(lefts), max(bottoms), max(rights)
@@ -0,0 +1,232 @@
+"""Splits a transcript into topics, so requests never cut a topic in half."""
+
+import re
+
+import numpy as np
+
+TRANSCRIPT_MARKER_PATTERN = re.compile(r"(\[\d+:\d{2}\])")
+
+
+class TopicSegmenter:
+    """Splits a transcript at topic boundaries and packs topics into chunks.
+
+    The blog post is generated one chunk of the transcript at a time. Cutting
+    the transcript wherever the token budget of a request runs out splits
+    topics in half, which the model has to repair with the following chunks.
+    Instead, every timestamped chunk of the transcript is embedded, and the
+    similarity of the ``window`` chunks before and after every gap between
+    two chunks is compared, as in TextTiling. A gap is a topic boundary if
+    its similarity is much lower than the similarity of the gaps around it,
+    at the deepest point of the drop.
+    Each request then gets the most whole topics that fit into its budget.
+    When they fill less than half of the budget, the request also gets the
+    next topic up to its least similar gap that fits.
+
+    Attributes:
+        encode (Callable): Embeds a list of texts into a 2D array.
+        window (int): The number of chunks on each side of a gap that are
+            compared.
+        cutoff (float): A gap is a boundary if its depth is above the mean
+            depth minus ``cutoff`` standard deviations. Higher values find more
+            boundaries.
+    """
+
+    def __init__(self, encode, window=2, cutoff=0.5):
+        self.encode = encode
+        self.window = window
+        self.cutoff = cutoff
+
+    @staticmethod
+    def split_units(transcript):
+        """Split a transcript into its timestamped chunks.
+
+        Args:
+            transcript (str): The transcript, made of chunks that start with
+                their ``[MM:SS]`` timestamp.
+
+        Returns:
+            List[str]: The chunks with their timestamps, which add up to the
+            transcript.
+        """
+        parts = TRANSCRIPT_MARKER_PATTERN.split(transcript)
+        units = [parts[0]] if parts[0] else []
+        units += [marker + text for marker, text in zip(parts[1::2], parts[2::2])]
+        return units
+
+    def gap_similarities(self, embeddings):
+        """Compare the chunks before and after every gap between two chunks.
+
+        Args:
+            embeddings (np.ndarray): One embedding per chunk.
+
+        Returns:
+            np.ndarray: The cosine similarity of the mean embeddings of the
+            ``window`` chunks before and after each gap.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1, norms)
+        similarities = []
+        for gap in range(1, len(embeddings)):
+            before = embeddings[max(0, gap - self.window):gap].mean(axis=0)
+            after = embeddings[gap:gap + self.window].mean(axis=0)
+            norm = np.linalg.norm(before) * np.linalg.norm(after)
+            similarities.append(float(before @ after / norm) if norm else 0.0)
+        return np.array(similarities, dtype=np.float32)
+
+    @staticmethod
+    def depth_scores(similarities):
+        """Measure how far the similarity drops at every gap.
+
+        Args:
+            similarities (np.ndarray): The similarity at each gap.
+
+        Returns:
+            np.ndarray: The depth of each gap, the rise of the similarity to
+            the highest gap reached by climbing to the left plus the rise to
+            the highest gap reached by climbing to the right.
+        """
+        depths = np.zeros(len(similarities), dtype=np.float32)
+        for i, similarity in enumerate(similarities):
+            left = i
+            while left > 0 and similarities[left - 1] >= similarities[left]:
+                left -= 1
+            right = i
+            while (right < len(similarities) - 1
+                   and similarities[right + 1] >= similarities[right]):
+                right += 1
+            depths[i] = (similarities[left] - similarity
+                         + similarities[right] - similarity)
+        return depths
+
+    def segment(self, transcript):
+        """Split a transcript into topics.
+
+        Args:
+            transcript (str): The transcript, made of timestamped chunks.
+
+        Returns:
+            List[dict]: The chunks of each topic, with the similarity of every
+            gap between them, which add up to the transcript.
+        """
+        units = self.split_units(transcript)
+        if len(units) < 3:
+            return [{"units": units,
+                     "similarities": [1.0] * max(0, len(units) - 1)}] if units else []
+
+        embeddings = self.encode([TRANSCRIPT_MARKER_PATTERN.sub("", unit).strip()
+                                  for unit in units])
+        similarities = self.gap_similarities(embeddings)
+        depths = self.depth_scores(similarities)
+        threshold = depths.mean() - self.cutoff * depths.std()
+        # Only the deepest gap of each valley is a boundary, not its slopes.
+        boundaries = {
+            gap + 1 for gap, depth in enumerate(depths)
+            if depth > 0 and depth > threshold
+            and (gap == 0 or depth >= depths[gap - 1])
+            and (gap == len(depths) - 1 or depth >= depths[gap + 1])
+        }
+
+        topics = []
+        for i, unit in enumerate(units):
+            if i == 0 or i in boundaries:
+                topics.append({"units": [], "similarities": []})
+            else:
+                topics[-1]["similarities"].append(float(similarities[i - 1]))
+            topics[-1]["units"].append(unit)
+        return topics
+
+    @staticmethod
+    def _cut_words(text, max_tokens, count_tokens):
+        """Cut the first words that fit into the budget off a text."""
+        words = text.split(" ")
+        for n_words in range(1, len(words) + 1):
+            if count_tokens(" ".join(words[:n_words])) >= max_tokens:
+                break
+        chunk = " ".join(words[:n_words])
+        return chunk, text[len(chunk):]
+
+    @classmethod
+    def _cut_topic(cls, topic, max_tokens, count_tokens):
+        """Cut the first chunks of a topic that fit into the budget.
+
+        The topic is cut at the least similar gap in the second half of the
+        chunks that fit, so the cut stays large, and at the later gap when
+        several are equally weak. Token counts do not add up, so every chunk
+        may fit while the whole topic does not. The cut is then at most at
+        the last gap, and a topic of a single chunk is cut at a word.
+
+        Args:
+            topic (dict): The topic, longer than the budget.
+            max_tokens (int): The token budget.
+            count_tokens (Callable): Counts the tokens of a text.
+
+        Returns:
+            Tuple[str, dict]: The cut text, or "" if not even the first chunk
+            of the topic fits, and the rest of the topic.
+        """
+        units = topic["units"]
+        n_units = 0
+        while (n_units < len(units)
+               and count_tokens("".join(units[:n_units + 1])) <= max_tokens):
+            n_units += 1
+        if n_units == 0:
+            return "", topic
+        # Gap g lies between the chunks g and g + 1.
+        gaps = topic["similarities"]
+        if not gaps:
+            text, rest_of_unit = cls._cut_words(units[0], max_tokens, count_tokens)
+            return text, {"units": [rest_of_unit], "similarities": []}
+        n_units = min(n_units, len(gaps))
+        n_units = 1 + min(range((n_units - 1) // 2, n_units),
+                          key=lambda gap: (gaps[gap], -gap))
+        rest = {"units": units[n_units:], "similarities": gaps[n_units:]}
+        return "".join(units[:n_units]), rest
+
+    def first_chunk(self, topics, max_tokens, count_tokens):
+        """Take the most whole topics that fit into a token budget.
+
+        If the whole topics fill less than half of the budget, the chunk
+        continues into the next topic up to its least similar gap that fits.
+        A single chunk of the transcript longer than the budget is cut at a
+        word.
+
+        Args:
+            topics (List[dict]): The remaining topics, as returned by
+                ``segment``.
+            max_tokens (int): The token budget of the chunk.
+            count_tokens (Callable): Counts the tokens of a text.
+
+        Returns:
+            Tuple[str, List[dict]]: The chunk, and the topics that remain.
+
+        Raises:
+            ValueError: If the token budget is not positive, as no chunk of
+                the transcript would ever fit.
+        """
+        if max_tokens <= 0:
+            raise ValueError(f"The token budget must be positive, not {max_tokens}")
+        chunk = ""
+        n_topics = 0
+        for topic in topics:
+            text = "".join(topic["units"])
+            if count_tokens(chunk + text) > max_tokens:
+                break
+            chunk += text
+            n_topics += 1
+        topics = topics[n_topics:]
+        if not topics or count_tokens(chunk) >= max_tokens / 2:
+            return chunk, topics
+
+        text, rest = self._cut_topic(
+            topics[0], max_tokens - count_tokens(chunk), count_tokens,
+        )
+        if text:
+            return chunk + text, [rest] + topics[1:]
+        if chunk:
+            return chunk, topics
+        units = topics[0]["units"]
+        text, rest_of_unit = self._cut_words(units[0], max_tokens, count_tokens)
+        rest = {"units": [rest_of_unit] + units[1:],
+                "similarities": topics[0]["similarities"]}
+        return text, [rest] + topics[1:]
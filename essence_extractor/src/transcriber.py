@@ -1,11 +1,111 @@
 """Extracts audio from a video file and transcribes it to text."""
 
+import contextlib
 import os
+import threading
+import time
+import wave
+from concurrent.futures import Future
 
-import whisper
-from moviepy.editor import AudioFileClip
+import numpy as np
 
-from essence_extractor.src import utils
+from essence_extractor.src import metrics, utils
+from essence_extractor.src.voice_activity import VoiceActivityDetector
+
+whisper = utils.lazy_import("whisper")
+torch = utils.lazy_import("torch")
+AudioFileClip = utils.lazy_import("moviepy.editor", "AudioFileClip")
+
+SAMPLE_RATE = 16000
+# Whisper reads 30 second windows, so shorter clips fit into one forward pass.
+SHORT_CLIP_SECONDS = 30
+# The duration of one timestamp token of Whisper, in seconds.
+TIME_PRECISION = 0.02
+
+ASR_AUDIO_SECONDS = metrics.REGISTRY.counter(
+    "asr_audio_seconds", "Seconds of audio transcribed.", ["model"],
+)
+ASR_REAL_TIME_FACTOR = metrics.REGISTRY.histogram(
+    "asr_real_time_factor",
+    "Seconds spent transcribing per second of audio, below 1 is faster than real time.",
+    ["model"], buckets=metrics.RATIO_BUCKETS,
+)
+
+
+def audio_duration(audio):
+    """Gets the duration of audio without decoding it.
+
+    Args:
+        audio (Union[str, np.ndarray]): The path to a WAV file or its 16 kHz
+            samples.
+
+    Returns:
+        float: The duration in seconds, or None if it is unknown.
+    """
+    if not isinstance(audio, str):
+        return len(audio) / SAMPLE_RATE
+    try:
+        with contextlib.closing(wave.open(audio, "rb")) as f:
+            return f.getnframes() / f.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+class ClipBatcher:
+    """Collects the short clips of concurrent jobs into one batched decode.
+
+    The first clip that arrives waits up to ``max_wait`` seconds for clips of
+    other threads, or until ``batch_size`` clips are waiting, and then
+    transcribes all of them with one call. Every thread gets back the
+    segments of its own clip.
+
+    Attributes:
+        transcribe_clips (Callable): Transcribes a list of clips, see
+            Transcriber.transcribe_clips.
+        max_wait (float): How long the first clip waits for others, in seconds.
+        batch_size (int): The number of clips decoded at once.
+    """
+
+    def __init__(self, transcribe_clips, max_wait=0.5, batch_size=16):
+        self.transcribe_clips = transcribe_clips
+        self.max_wait = max_wait
+        self.batch_size = batch_size
+        self._condition = threading.Condition()
+        self._waiting = []
+
+    def transcribe(self, audio):
+        """Transcribes a clip together with the clips of other threads.
+
+        Args:
+            audio (np.ndarray): The 16 kHz samples of the clip, at most 30
+                seconds long.
+
+        Returns:
+            List[dict]: The start, end and text of the segments of the clip.
+        """
+        future = Future()
+        with self._condition:
+            self._waiting.append((audio, future))
+            leads = len(self._waiting) == 1
+            if len(self._waiting) >= self.batch_size:
+                self._condition.notify_all()
+            if leads:
+                self._condition.wait_for(
+                    lambda: len(self._waiting) >= self.batch_size, timeout=self.max_wait,
+                )
+                batch, self._waiting = self._waiting, []
+        if leads:
+            try:
+                clip_segments = self.transcribe_clips(
+                    [clip for clip, _ in batch], batch_size=self.batch_size,
+                )
+            except Exception as e:
+                for _, waiting in batch:
+                    waiting.set_exception(e)
+            else:
+                for (_, waiting), segments in zip(batch, clip_segments):
+                    waiting.set_result(segments)
+        return future.result()
 
 
 class Transcriber:
@@ -13,33 +113,58 @@ class Transcriber:
 
     Attributes:
         output_path (str): The path to the output directory.
+        use_vad (bool): Whether to skip silence before transcribing.
+        model_name (str): The name of the Whisper model.
+        chunk_size (int): The number of tokens of a transcript chunk.
+        clip_batch_wait (float): How long a short clip waits for the clips of
+            other threads sharing the transcriber, so they are decoded in one
+            batch, in seconds, or None to transcribe every clip on its own.
     """
 
-    def __init__(self, output_path="audios"):
+    def __init__(self, output_path="audios", use_vad=True, model_name="base",
+                 chunk_size=200, clip_batch_wait=None):
         self.output_path = output_path
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
 
-        self.transcribe_model = whisper.load_model("base")
+        self.use_vad = use_vad
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.transcribe_model = whisper.load_model(model_name)
+        # Whisper installs its key-value cache hooks on the model while it
+        # decodes, so threads sharing the model take turns.
+        self._model_lock = threading.Lock()
         self.token_counter = utils.TokenCounter()
+        self.vad = VoiceActivityDetector() if use_vad else None
+        self.clip_batch_wait = clip_batch_wait
+        self._clip_batcher = None
+        if clip_batch_wait is not None:
+            self._clip_batcher = ClipBatcher(self.transcribe_clips,
+                                             max_wait=clip_batch_wait)
 
-    def extract_audio(self, video_file_path):
+    def extract_audio(self, video_file_path, output_path=None):
         """Extracts audio from a video file.
 
         Args:
             video_file_path (str): The path to the video file.
+            output_path (str, optional): The directory to save the audio to.
+                Defaults to the output directory of the transcriber.
 
         Returns:
             str: The path to the extracted audio file.
         """
+        output_path = output_path or self.output_path
         try:
             video_clip = AudioFileClip(video_file_path)
 
-            audio_file_path = os.path.join(
-                self.output_path, os.path.basename(video_file_path).replace("mp4", "wav"),
-            )
+            video_name = os.path.splitext(os.path.basename(video_file_path))[0]
+            audio_file_path = os.path.join(output_path, f"{video_name}.wav")
 
-            video_clip.write_audiofile(audio_file_path)
+            partial_file_path = os.path.join(
+                output_path, f".part-{os.path.basename(audio_file_path)}",
+            )
+            video_clip.write_audiofile(partial_file_path)
+            os.replace(partial_file_path, audio_file_path)
             return audio_file_path
 
         except Exception as e:
@@ -88,24 +213,261 @@ class Transcriber:
 
         return assemble_text
 
-    def transcribe_audio(self, audio_file_path):
-        """Transcribes audio to text.
+    def _transcribe_speech_regions(self, audio):
+        """Transcribes only the speech regions of the audio.
+
+        Silence is cut out before transcription and the segment timestamps are
+        mapped back to the original audio afterwards.
+
+        Args:
+            audio (Union[str, np.ndarray]): The path to the audio file or its
+                16 kHz samples.
+
+        Returns:
+            dict: The transcript result with timestamps of the original audio.
+        """
+        if isinstance(audio, str):
+            audio = whisper.load_audio(audio)
+        regions = self.vad.detect_speech_regions(audio)
+        if not regions:
+            utils.logging.info("No speech detected, transcribing the whole audio")
+            with self._model_lock:
+                return self.transcribe_model.transcribe(audio)
+
+        speech_audio = self.vad.extract_speech(audio, regions)
+        skipped_ratio = 1 - len(speech_audio) / len(audio)
+        utils.logging.info(
+            f"Skipped {skipped_ratio:.1%} of the audio as silence "
+            f"({len(regions)} speech regions)",
+        )
+
+        with self._model_lock:
+            transcript_result = self.transcribe_model.transcribe(speech_audio)
+        transcript_result["segments"] = self.vad.restore_timestamps(
+            transcript_result["segments"], regions,
+        )
+        return transcript_result
+
+    def _observe_speed(self, audio_seconds, seconds):
+        """Records the real-time factor of a transcription.
 
         Args:
+            audio_seconds (float): The duration of the audio, or None.
+            seconds (float): The time it took to transcribe it.
+        """
+        if not audio_seconds:
+            return
+        ASR_AUDIO_SECONDS.inc(audio_seconds, model=self.model_name)
+        ASR_REAL_TIME_FACTOR.observe(seconds / audio_seconds, model=self.model_name)
+
+    def _transcribe(self, audio):
+        """Transcribes audio, skipping silence if voice activity detection is on.
+
+        Args:
+            audio (Union[str, np.ndarray]): The path to the audio file or its
+                16 kHz samples.
+
+        Returns:
+            dict: The transcript result.
+        """
+        start_time = time.perf_counter()
+        if self.vad is None:
+            with self._model_lock:
+                transcript_result = self.transcribe_model.transcribe(audio)
+        else:
+            transcript_result = self._transcribe_speech_regions(audio)
+        self._observe_speed(audio_duration(audio), time.perf_counter() - start_time)
+        return transcript_result
+
+    def _write_transcript(self, transcript_result, audio_file_path):
+        """Writes the timestamped chunks of a transcript next to its audio.
+
+        Args:
+            transcript_result (dict): The transcript result with segments.
             audio_file_path (str): The path to the audio file.
 
         Returns:
             str: The path to the transcription file.
         """
-        transcript_result = self.transcribe_model.transcribe(audio_file_path)
-        token_chunks = self.split_audio_into_token_chunks(transcript_result)
+        token_chunks = self.split_audio_into_token_chunks(
+            transcript_result, chunk_size=self.chunk_size,
+        )
         assemble_text = self._assemble_transcript(token_chunks)
 
         transcription_file_path = audio_file_path.replace(".wav", ".txt")
 
-        with open(transcription_file_path, "w") as f:
-            f.write(assemble_text)
+        utils.atomic_write(transcription_file_path, assemble_text)
 
         return transcription_file_path
 
+    def _write_clip_transcript(self, segments, audio_file_path):
+        """Writes the transcript of a batched clip next to its audio.
 
+        Args:
+            segments (List[dict]): The segments of the clip.
+            audio_file_path (str): The path to the audio file.
+
+        Returns:
+            str: The path to the transcription file.
+        """
+        if segments:
+            return self._write_transcript({"segments": segments}, audio_file_path)
+        # A clip without speech gets an empty transcript instead of failing
+        # the whole batch.
+        transcription_file_path = audio_file_path.replace(".wav", ".txt")
+        utils.atomic_write(transcription_file_path, "")
+        return transcription_file_path
+
+    def transcribe_audio(self, audio_file_path):
+        """Transcribes audio to text.
+
+        If clip batching is on, audio of at most 30 seconds is decoded in one
+        batch with the short clips other threads transcribe at the same time.
+
+        Args:
+            audio_file_path (str): The path to the audio file.
+
+        Returns:
+            str: The path to the transcription file.
+        """
+        if self._clip_batcher is not None:
+            duration = audio_duration(audio_file_path)
+            if duration is not None and duration <= SHORT_CLIP_SECONDS:
+                segments = self._clip_batcher.transcribe(
+                    whisper.load_audio(audio_file_path),
+                )
+                return self._write_clip_transcript(segments, audio_file_path)
+        transcript_result = self._transcribe(audio_file_path)
+        return self._write_transcript(transcript_result, audio_file_path)
+
+    @staticmethod
+    def _segments_from_tokens(tokens, tokenizer, duration):
+        """Splits the tokens decoded for a clip into timestamped segments.
+
+        Whisper predicts a timestamp token before and after every segment.
+        Text after the last timestamp ends with the clip.
+
+        Args:
+            tokens (List[int]): The decoded tokens, without the start tokens.
+            tokenizer: The tokenizer of the model.
+            duration (float): The duration of the clip, in seconds.
+
+        Returns:
+            List[dict]: The start, end and text of each segment.
+        """
+        segments = []
+        start, text_tokens = 0.0, []
+        for token in tokens:
+            if token < tokenizer.timestamp_begin:
+                if token < tokenizer.eot:
+                    text_tokens.append(token)
+                continue
+            timestamp = min((token - tokenizer.timestamp_begin) * TIME_PRECISION,
+                            duration)
+            if text_tokens:
+                segments.append({"start": start, "end": timestamp,
+                                 "text": tokenizer.decode(text_tokens).strip()})
+                text_tokens = []
+            start = timestamp
+        if text_tokens:
+            segments.append({"start": start, "end": duration,
+                             "text": tokenizer.decode(text_tokens).strip()})
+        return [segment for segment in segments if segment["text"]]
+
+    def transcribe_clips(self, audios, batch_size=16, language=None):
+        """Transcribes many short clips in batched forward passes.
+
+        Every clip is padded to one 30 second window of Whisper, and the log
+        Mel spectrograms of a batch of clips are decoded together, so the
+        model is invoked once per batch instead of once per clip.
+
+        Args:
+            audios (List[np.ndarray]): The 16 kHz samples of each clip, each
+                at most 30 seconds long.
+            batch_size (int, optional): The number of clips decoded at once.
+                Defaults to 16.
+            language (str, optional): The language of the clips. Defaults to
+                detecting the language of every clip.
+
+        Returns:
+            List[List[dict]]: The start, end and text of the segments of each
+            clip, in seconds from the start of the clip.
+
+        Raises:
+            ValueError: If a clip is longer than 30 seconds.
+        """
+        if any(len(audio) > SHORT_CLIP_SECONDS * SAMPLE_RATE for audio in audios):
+            raise ValueError(f"Clips must be at most {SHORT_CLIP_SECONDS} seconds long")
+        model = self.transcribe_model
+        tokenizer = whisper.tokenizer.get_tokenizer(
+            model.is_multilingual, num_languages=model.num_languages,
+            language=language, task="transcribe",
+        )
+        options = whisper.DecodingOptions(
+            language=language, without_timestamps=False,
+            fp16=model.device.type == "cuda",
+        )
+
+        clip_segments = []
+        for batch_start in range(0, len(audios), batch_size):
+            start_time = time.perf_counter()
+            batch = audios[batch_start:batch_start + batch_size]
+            mel = torch.stack([
+                whisper.log_mel_spectrogram(
+                    whisper.pad_or_trim(np.asarray(audio, dtype=np.float32)),
+                    n_mels=model.dims.n_mels,
+                )
+                for audio in batch
+            ]).to(model.device)
+            with self._model_lock:
+                results = whisper.decode(model, mel, options)
+            for audio, result in zip(batch, results):
+                clip_segments.append(self._segments_from_tokens(
+                    result.tokens, tokenizer, len(audio) / SAMPLE_RATE,
+                ))
+            self._observe_speed(sum(len(audio) for audio in batch) / SAMPLE_RATE,
+                                time.perf_counter() - start_time)
+        return clip_segments
+
+    def transcribe_audio_batch(
+            self, audio_file_paths, short_clip_seconds=SHORT_CLIP_SECONDS, batch_size=16,
+    ):
+        """Transcribes many audio files, batching the short ones.
+
+        Clips up to ``short_clip_seconds`` long are transcribed together with
+        transcribe_clips. Longer audio is transcribed one file at a time.
+
+        Args:
+            audio_file_paths (List[str]): The paths to the audio files.
+            short_clip_seconds (float, optional): The longest clip that is
+                batched, in seconds. At most 30. Defaults to 30.
+            batch_size (int, optional): The number of clips decoded at once.
+                Defaults to 16.
+
+        Returns:
+            List[str]: The path to the transcription file of each audio file.
+        """
+        short_clip_seconds = min(short_clip_seconds, SHORT_CLIP_SECONDS)
+        transcription_file_paths = [None] * len(audio_file_paths)
+        short_clips = []
+        for i, audio_file_path in enumerate(audio_file_paths):
+            audio = whisper.load_audio(audio_file_path)
+            if len(audio) <= short_clip_seconds * SAMPLE_RATE:
+                short_clips.append((i, audio))
+            else:
+                transcription_file_paths[i] = self._write_transcript(
+                    self._transcribe(audio), audio_file_path,
+                )
+
+        utils.logging.info(
+            f"Transcribing {len(short_clips)}/{len(audio_file_paths)} short clips "
+            f"in batches of {batch_size}",
+        )
+        clip_segments = self.transcribe_clips(
+            [audio for _, audio in short_clips], batch_size=batch_size,
+        )
+        for (i, _), segments in zip(short_clips, clip_segments):
+            transcription_file_paths[i] = self._write_clip_transcript(
+                segments, audio_file_paths[i],
+            )
+        return transcription_file_paths
@@ -0,0 +1,244 @@
+"""Removes filler and repetition from a transcript before it is summarized."""
+
+import re
+
+from essence_extractor.src import utils
+
+TRANSCRIPT_MARKER_PATTERN = re.compile(r"(\[\d+:\d{2}\])")
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+WORD_PATTERN = re.compile(r"[\w']+")
+
+DEFAULT_FILLER_WORDS = ("um", "umm", "uh", "uhm", "uh-huh", "erm", "er", "ah",
+                        "hmm", "mm", "mhm")
+# Phrases that are only filler when set off by a comma, as in "so, you know, it".
+DEFAULT_FILLER_PHRASES = ("you know", "i mean")
+# Words that are never said twice in a row on purpose, unlike "that that" or
+# "had had", so a repeated one is a stutter.
+DEFAULT_STUTTER_WORDS = ("a", "an", "the", "i", "and", "of", "to")
+
+
+class TranscriptCompactor:
+    """Removes filler and repetition from a transcript before it is summarized.
+
+    Every chunk of the transcript is sent to the language model, so filler
+    words, stutters such as "the the" or "gr- gradient", false starts such as
+    "I think I think", and the
+    loops Whisper hallucinates on silence or music, where one sentence is
+    repeated many times, cost input tokens without adding content. The
+    compactor removes them deterministically:
+
+    1. Filler words, and filler phrases set off by commas, are removed.
+    2. A run of 2 to ``max_repeat_words`` words that repeats the words just
+       before it is dropped. A single repeated word is only dropped if it is
+       a stutter word, so "that that" and "had had" are kept, and a word cut
+       off with a hyphen is dropped if the next word completes it.
+    3. A sentence that repeats one of the last ``repeat_window`` sentences
+       is dropped, also across chunks.
+    4. A chunk left with fewer than ``min_chunk_words`` words is merged into
+       the chunk before it, and a chunk left empty is dropped.
+
+    The ``[MM:SS]`` marker of every remaining chunk is kept as it is.
+
+    Attributes:
+        filler_words (Set[str]): The lowercase words that are removed.
+        filler_phrases (Tuple[str, ...]): The lowercase phrases that are
+            removed when set off by commas.
+        stutter_words (Set[str]): The lowercase words that are collapsed when
+            repeated on their own.
+        max_repeat_words (int): The longest repeated run of words that is
+            collapsed, or 0 to keep repeated words.
+        repeat_window (int): The number of previous sentences a sentence is
+            compared to, or 0 to keep repeated sentences.
+        min_chunk_words (int): The number of words a chunk needs to keep its
+            own timestamp.
+        token_counter (utils.TokenCounter): Counts the tokens saved.
+    """
+
+    def __init__(self, filler_words=DEFAULT_FILLER_WORDS,
+                 filler_phrases=DEFAULT_FILLER_PHRASES, max_repeat_words=4,
+                 repeat_window=3, min_chunk_words=8,
+                 model_name=utils.DEFAULT_MODEL_NAME,
+                 stutter_words=DEFAULT_STUTTER_WORDS):
+        self.filler_words = {word.lower() for word in filler_words}
+        self.filler_phrases = tuple(phrase.lower() for phrase in filler_phrases)
+        self.stutter_words = {word.lower() for word in stutter_words}
+        self.max_repeat_words = max_repeat_words
+        self.repeat_window = repeat_window
+        self.min_chunk_words = min_chunk_words
+        self.token_counter = utils.TokenCounter(model_name)
+        self._filler_phrase_pattern = None
+        if self.filler_phrases:
+            phrases = "|".join(re.escape(phrase) for phrase in self.filler_phrases)
+            self._filler_phrase_pattern = re.compile(
+                rf",\s*(?:{phrases}),", re.IGNORECASE,
+            )
+
+    @staticmethod
+    def _normalize(text):
+        """Reduce text to its lowercase words, to compare it."""
+        return " ".join(WORD_PATTERN.findall(text.lower()))
+
+    def _remove_filler(self, text):
+        """Remove filler phrases and filler words.
+
+        Args:
+            text (str): The text of a chunk.
+
+        Returns:
+            List[str]: The remaining words.
+        """
+        if self._filler_phrase_pattern is not None:
+            text = self._filler_phrase_pattern.sub("", text)
+        words = []
+        for word in text.split():
+            if self._normalize(word) in self.filler_words:
+                if words and word[-1] in ".!?" and words[-1][-1] not in ".!?":
+                    # Keep the punctuation that ended the sentence at the filler.
+                    words[-1] = words[-1].rstrip(",;:") + word[-1]
+                elif words and word[-1] == "," and words[-1][-1] == ",":
+                    # Drop the commas that set off the filler, as in "about, uh,".
+                    words[-1] = words[-1][:-1]
+                continue
+            words.append(word)
+        return words
+
+    def _collapse_repeated_words(self, words):
+        """Drop runs of words that repeat the words just before them, and stutters.
+
+        Args:
+            words (List[str]): The words of a chunk.
+
+        Returns:
+            List[str]: The words without repeated runs.
+        """
+        normalized = [self._normalize(word) for word in words]
+        kept, kept_normalized = [], []
+        i = 0
+        while i < len(words):
+            if (words[i].endswith("-") and normalized[i] and i + 1 < len(words)
+                    and normalized[i + 1].startswith(normalized[i])):
+                i += 1
+                continue
+            for n in range(min(self.max_repeat_words, len(kept), len(words) - i), 0, -1):
+                if n == 1 and normalized[i] not in self.stutter_words:
+                    continue
+                if normalized[i:i + n] == kept_normalized[-n:]:
+                    i += n
+                    break
+            else:
+                kept.append(words[i])
+                kept_normalized.append(normalized[i])
+                i += 1
+        return kept
+
+    def _drop_repeated_sentences(self, text, recent_sentences):
+        """Drop sentences that repeat one of the recent sentences.
+
+        Args:
+            text (str): The text of a chunk.
+            recent_sentences (List[str]): The last normalized sentences,
+                updated in place.
+
+        Returns:
+            str: The text without repeated sentences.
+        """
+        sentences = []
+        for sentence in SENTENCE_END_PATTERN.split(text):
+            normalized = self._normalize(sentence)
+            if not normalized:
+                continue
+            if normalized in recent_sentences:
+                continue
+            sentences.append(sentence)
+            recent_sentences.append(normalized)
+            del recent_sentences[:-self.repeat_window]
+        return " ".join(sentences)
+
+    def compact_chunk(self, text, recent_sentences=None):
+        """Remove filler and repetition from the text of one chunk.
+
+        Args:
+            text (str): The text of the chunk.
+            recent_sentences (List[str], optional): The last sentences of the
+                previous chunks, updated in place.
+
+        Returns:
+            str: The compacted text.
+        """
+        words = self._remove_filler(text)
+        if self.max_repeat_words:
+            words = self._collapse_repeated_words(words)
+        text = " ".join(words)
+        if self.repeat_window:
+            text = self._drop_repeated_sentences(
+                text, [] if recent_sentences is None else recent_sentences,
+            )
+        return text
+
+    def compact(self, transcript):
+        """Remove filler and repetition from a transcript.
+
+        Args:
+            transcript (str): The transcript, made of chunks that start with
+                their ``[MM:SS]`` timestamp.
+
+        Returns:
+            str: The compacted transcript, in the same format.
+        """
+        parts = TRANSCRIPT_MARKER_PATTERN.split(transcript)
+        recent_sentences = []
+        chunks = []
+        if parts[0].strip():
+            chunks.append(["", self.compact_chunk(parts[0], recent_sentences)])
+        for marker, text in zip(parts[1::2], parts[2::2]):
+            text = self.compact_chunk(text, recent_sentences)
+            if not text:
+                continue
+            if chunks and len(text.split()) < self.min_chunk_words:
+                chunks[-1][1] = f"{chunks[-1][1]} {text}".strip()
+            else:
+                chunks.append([marker, text])
+        return "".join(f"{marker} {text} " for marker, text in chunks).lstrip()
+
+    def compact_file(self, transcript_path, output_path=None):
+        """Compact a transcript file.
+
+        Args:
+            transcript_path (str): The path to the transcript.
+            output_path (str, optional): The path to save the compacted
+                transcript to. Defaults to the transcript path with a
+                ".compact.txt" extension.
+
+        Returns:
+            str: The path to the compacted transcript.
+        """
+        if output_path is None:
+            output_path = f"{transcript_path.removesuffix('.txt')}.compact.txt"
+        with open(transcript_path, "r") as f:
+            transcript = f.read()
+        utils.atomic_write(output_path, self.compact(transcript))
+        return output_path
+
+    def token_savings(self, transcript_path, compacted_path):
+        """Count the tokens compaction removed from a transcript.
+
+        Args:
+            transcript_path (str): The path to the transcript.
+            compacted_path (str): The path to the compacted transcript.
+
+        Returns:
+            dict: The tokens of the transcript before and after compaction,
+            the tokens saved and the saved share of the tokens.
+        """
+        token_counts = []
+        for file_path in [transcript_path, compacted_path]:
+            with open(file_path, "r") as f:
+                token_counts.append(self.token_counter.count_tokens(f.read()))
+        tokens_before, tokens_after = token_counts
+        tokens_saved = tokens_before - tokens_after
+        return {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_saved,
+            "saved_ratio": tokens_saved / tokens_before if tokens_before else 0.0,
+        }
@@ -1,4 +1,4 @@
 # noqa: D104
 
-from .custom_exceptions import YouTubeDownloadError
+from .custom_exceptions import JobCancelledError, YouTubeDownloadError
 from .utils import *
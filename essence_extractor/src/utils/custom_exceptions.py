@@ -1,4 +1,4 @@
-"""Custom exceptions for the YouTube Downloader."""
+"""Custom exceptions of Essence Extractor."""
 
 class YouTubeDownloadError(Exception):
     """Exception raised when a YouTube video download fails."""
@@ -6,3 +6,11 @@ class YouTubeDownloadError(Exception):
     def __init__(self, message="Failed to download YouTube video"):
         self.message = message
         super().__init__(self.message)
+
+
+class JobCancelledError(Exception):
+    """Exception raised when a pipeline run is cancelled."""
+
+    def __init__(self, message="The job was cancelled"):
+        self.message = message
+        super().__init__(self.message)
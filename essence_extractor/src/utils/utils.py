@@ -1,6 +1,12 @@
 """This module provides utility functions."""
 
+import functools
+import importlib
 import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
 
 import tiktoken
 
@@ -29,10 +35,118 @@ MODEL_TOKEN_LENGTH_MAPPING = {
         "input_token_cost": 0.06,
         "output_token_cost": 0.12,
     },
+    # Models with prompt caching bill input tokens served from the cache at
+    # "cached_input_token_cost". Other models bill them as regular input.
+    "gpt-4o": {
+        "token_length": 128000,
+        "input_token_cost": 0.0025,
+        "cached_input_token_cost": 0.00125,
+        "output_token_cost": 0.01,
+    },
+    "gpt-4o-mini": {
+        "token_length": 128000,
+        "input_token_cost": 0.00015,
+        "cached_input_token_cost": 0.000075,
+        "output_token_cost": 0.0006,
+    },
 }
 
 DEFAULT_MODEL_NAME = "gpt-3.5-turbo-1106"
 
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ESSENCE_EXTRACTOR_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "essence_extractor"),
+)
+
+
+class LazyImport:
+    """Imports a module, or an attribute of a module, when it is first used.
+
+    Heavy dependencies such as whisper, torch and moviepy take seconds to
+    import. Modules bind them to a LazyImport instead, so they are only
+    imported once the stage that needs them runs.
+
+    Attributes:
+        module_name (str): The name of the module to import.
+        attribute (str): The attribute of the module to load, or None to load
+            the module itself.
+    """
+
+    def __init__(self, module_name, attribute=None):
+        self.module_name = module_name
+        self.attribute = attribute
+        self._target = None
+
+    def _load(self):
+        """Imports the target.
+
+        Returns:
+            The module or its attribute.
+        """
+        if self._target is None:
+            target = importlib.import_module(self.module_name)
+            if self.attribute is not None:
+                target = getattr(target, self.attribute)
+            self._target = target
+        return self._target
+
+    def __getattr__(self, name):
+        """Gets an attribute of the target, importing it if needed."""
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        """Calls the target, importing it if needed."""
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        """Describes the target without importing it."""
+        name = self.module_name
+        if self.attribute is not None:
+            name += f".{self.attribute}"
+        return f"<LazyImport {name}>"
+
+
+def lazy_import(module_name, attribute=None):
+    """Bind a module or an attribute of a module without importing it yet.
+
+    Args:
+        module_name (str): The name of the module.
+        attribute (str, optional): The attribute of the module to bind.
+
+    Returns:
+        LazyImport: Imports the target when it is first used.
+    """
+    return LazyImport(module_name, attribute)
+
+
+def atomic_write(file_path, content, mode="w"):
+    """Write content to a file so readers never see a partial file.
+
+    The content is written to a temporary file in the same directory, which
+    then replaces the target file in a single rename.
+
+    Args:
+        file_path (str): The path to the file to write to.
+        content (str or bytes): The content to write.
+        mode (str, optional): The file mode, "w" or "wb". Defaults to "w".
+
+    Returns:
+        str: The path to the written file.
+    """
+    directory = os.path.dirname(file_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return file_path
+
 
 def save_to_md_file(content, file_path):
     """Save content to a markdown file.
@@ -44,8 +158,7 @@ def save_to_md_file(content, file_path):
     Returns:
         str: The path to the saved file.
     """
-    with open(file_path, "w") as f:
-        f.write(content)
+    atomic_write(file_path, content)
     logging.info(f"Blog post saved to: {file_path}")
     return file_path
 
@@ -74,12 +187,152 @@ def format_to_markdown(text):
     return formatted_text
 
 
+TOKEN_COUNT_CACHE_SIZE = 4096
+MAX_CACHED_TEXT_LENGTH = 20000
+
+
+# Models that older tiktoken releases cannot resolve by name.
+MODEL_ENCODINGS = {
+    "gpt-4o": "o200k_base",
+    "gpt-4o-mini": "o200k_base",
+}
+
+FALLBACK_ENCODING = "cl100k_base"
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name):
+    """Get the tiktoken encoding of a model, resolving it once per process.
+
+    Falls back to the ``cl100k_base`` encoding when the installed tiktoken does not
+    know the model or its encoding, so token counts stay close instead of failing.
+
+    Args:
+        model_name (str): The name of the model.
+
+    Returns:
+        tiktoken.Encoding: The encoding used by the model.
+    """
+    try:
+        if model_name in MODEL_ENCODINGS:
+            return tiktoken.get_encoding(MODEL_ENCODINGS[model_name])
+        return tiktoken.encoding_for_model(model_name)
+    except (KeyError, ValueError):
+        logging.warning(
+            f"tiktoken has no encoding for {model_name}, counting tokens with "
+            f"{FALLBACK_ENCODING}",
+        )
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+
+
+class TokenCountCache:
+    """A bounded, thread-safe LRU cache of token counts.
+
+    Attributes:
+        maxsize (int): The maximum number of cached counts.
+        hits (int): The number of counts served from the cache.
+        misses (int): The number of counts that had to be computed.
+    """
+
+    def __init__(self, maxsize=TOKEN_COUNT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        """Get the cached token count of a text.
+
+        Args:
+            text (str): The text to look up.
+
+        Returns:
+            int: The token count, or None if the text is not cached.
+        """
+        with self._lock:
+            count = self._counts.get(text)
+            if count is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._counts.move_to_end(text)
+            return count
+
+    def put(self, text, count):
+        """Cache the token count of a text.
+
+        Texts longer than MAX_CACHED_TEXT_LENGTH are not cached, since they
+        are rarely counted twice and would dominate the cache's memory.
+
+        Args:
+            text (str): The text that was counted.
+            count (int): The number of tokens in the text.
+        """
+        if len(text) > MAX_CACHED_TEXT_LENGTH:
+            return
+        with self._lock:
+            self._counts[text] = count
+            self._counts.move_to_end(text)
+            while len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+
+    def info(self):
+        """Get statistics about the cache.
+
+        Returns:
+            dict: The hits, misses, hit rate and current size of the cache.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._counts),
+            }
+
+
+_token_count_caches = {}
+_token_count_caches_lock = threading.Lock()
+
+
+def get_token_count_cache(encoding_name):
+    """Get the process-wide token count cache of an encoding.
+
+    Args:
+        encoding_name (str): The name of the encoding.
+
+    Returns:
+        TokenCountCache: The cache shared by all counters of the encoding.
+    """
+    with _token_count_caches_lock:
+        if encoding_name not in _token_count_caches:
+            _token_count_caches[encoding_name] = TokenCountCache()
+        return _token_count_caches[encoding_name]
+
+
+def get_token_count_caches():
+    """Get the token count caches of all encodings used in the process.
+
+    Returns:
+        dict: A dict mapping encoding names to their TokenCountCache.
+    """
+    with _token_count_caches_lock:
+        return dict(_token_count_caches)
+
+
 class TokenCounter:
-    """A class for counting tokens."""
+    """A class for counting tokens.
+
+    Counters share their encoding and a bounded LRU cache of counts with all
+    other counters of the same encoding in the process.
+    """
 
     def __init__(self, model_name=DEFAULT_MODEL_NAME):
-        self.encoding = tiktoken.encoding_for_model(model_name)
+        self.encoding = get_encoding(model_name)
         self.model_token_length = MODEL_TOKEN_LENGTH_MAPPING[model_name]["token_length"]
+        self.cache = get_token_count_cache(self.encoding.name)
 
     def count_tokens(self, text):
         """Count the number of tokens in a text.
@@ -90,5 +343,44 @@ class TokenCounter:
         Returns:
             int: The number of tokens in the text.
         """
-        token_count = len(self.encoding.encode(text))
+        token_count = self.cache.get(text)
+        if token_count is None:
+            token_count = len(self.encoding.encode(text))
+            self.cache.put(text, token_count)
         return token_count
+
+    def count_tokens_many(self, texts, num_threads=8):
+        """Count the number of tokens in several texts.
+
+        Texts that are not cached are encoded in one threaded batch.
+
+        Args:
+            texts (List[str]): The texts to count the tokens of.
+            num_threads (int, optional): The number of encoder threads.
+                Defaults to 8.
+
+        Returns:
+            List[int]: The number of tokens in each text.
+        """
+        token_counts = [self.cache.get(text) for text in texts]
+        missing = list({
+            text: None for text, count in zip(texts, token_counts) if count is None
+        })
+        if missing:
+            encoded = self.encoding.encode_batch(missing, num_threads=num_threads)
+            missing_counts = {text: len(tokens) for text, tokens in zip(missing, encoded)}
+            for text, count in missing_counts.items():
+                self.cache.put(text, count)
+            token_counts = [
+                missing_counts[text] if count is None else count
+                for text, count in zip(texts, token_counts)
+            ]
+        return token_counts
+
+    def cache_info(self):
+        """Get statistics about the shared token count cache.
+
+        Returns:
+            dict: The hits, misses, hit rate and current size of the cache.
+        """
+        return self.cache.info()
@@ -0,0 +1,177 @@
+"""Detects speech regions in audio so silence can be skipped before transcription."""
+
+import bisect
+
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """Detects speech regions in audio using short-time energy.
+
+    Frames are classified as speech when their energy rises far enough above
+    the estimated noise floor of the recording and most of it lies in the
+    voice frequency band. Speech frames are then merged into regions, so only
+    long silences and pauses are cut out of the audio.
+
+    Attributes:
+        sample_rate (int): The sample rate of the audio, in Hz.
+        frame_duration (float): The length of an analysis frame, in seconds.
+        threshold_db (float): How far above the noise floor a frame must be
+            to count as speech, in decibels.
+        min_voice_band_ratio (float): The minimum share of a frame's energy
+            that must lie in the voice frequency band.
+        min_silence_duration (float): Pauses shorter than this are kept, in
+            seconds.
+        min_speech_duration (float): Regions shorter than this are dropped,
+            in seconds.
+        padding (float): Audio kept before and after each region, in seconds.
+    """
+
+    VOICE_BAND_HZ = (250, 4000)
+
+    def __init__(
+            self,
+            sample_rate=16000,
+            frame_duration=0.03,
+            threshold_db=12.0,
+            min_voice_band_ratio=0.4,
+            min_silence_duration=1.0,
+            min_speech_duration=0.25,
+            padding=0.2,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_duration = frame_duration
+        self.threshold_db = threshold_db
+        self.min_voice_band_ratio = min_voice_band_ratio
+        self.min_silence_duration = min_silence_duration
+        self.min_speech_duration = min_speech_duration
+        self.padding = padding
+
+    def _frame_features(self, audio):
+        """Computes the energy and voice band ratio of each frame.
+
+        Args:
+            audio (np.ndarray): Mono audio samples.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The energy of each frame in
+            decibels and the share of its energy in the voice band.
+        """
+        frame_length = max(int(self.sample_rate * self.frame_duration), 1)
+        n_frames = len(audio) // frame_length
+        frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+
+        spectrum = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+        freqs = np.fft.rfftfreq(frame_length, d=1 / self.sample_rate)
+        low, high = self.VOICE_BAND_HZ
+        voice_band = (freqs >= low) & (freqs <= high)
+
+        total_energy = spectrum.sum(axis=1) + 1e-10
+        voice_ratio = spectrum[:, voice_band].sum(axis=1) / total_energy
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        return energy_db, voice_ratio
+
+    def detect_speech_regions(self, audio):
+        """Detects the regions of the audio that contain speech.
+
+        Args:
+            audio (np.ndarray): Mono audio samples.
+
+        Returns:
+            List[Tuple[float, float]]: The start and end of each speech
+            region, in seconds.
+        """
+        if len(audio) == 0:
+            return []
+
+        energy_db, voice_ratio = self._frame_features(audio)
+        if len(energy_db) == 0:
+            return []
+
+        noise_floor = np.percentile(energy_db, 10)
+        is_speech = (
+            (energy_db > noise_floor + self.threshold_db) &
+            (voice_ratio >= self.min_voice_band_ratio)
+        )
+
+        regions = []
+        start = None
+        for i, speech in enumerate(is_speech):
+            if speech and start is None:
+                start = i
+            elif not speech and start is not None:
+                regions.append([start * self.frame_duration, i * self.frame_duration])
+                start = None
+        if start is not None:
+            end = len(is_speech) * self.frame_duration
+            regions.append([start * self.frame_duration, end])
+
+        merged = []
+        for region in regions:
+            if merged and region[0] - merged[-1][1] < self.min_silence_duration:
+                merged[-1][1] = region[1]
+            else:
+                merged.append(region)
+
+        audio_duration = len(audio) / self.sample_rate
+        speech_regions = []
+        for start_time, end_time in merged:
+            if end_time - start_time < self.min_speech_duration:
+                continue
+            start_time = max(start_time - self.padding, 0.0)
+            end_time = min(end_time + self.padding, audio_duration)
+            if speech_regions and start_time <= speech_regions[-1][1]:
+                speech_regions[-1] = (speech_regions[-1][0], end_time)
+            else:
+                speech_regions.append((start_time, end_time))
+
+        return speech_regions
+
+    def extract_speech(self, audio, regions):
+        """Concatenates the speech regions of the audio.
+
+        Args:
+            audio (np.ndarray): Mono audio samples.
+            regions (List[Tuple[float, float]]): The speech regions, in seconds.
+
+        Returns:
+            np.ndarray: The audio samples of the speech regions.
+        """
+        pieces = [
+            audio[int(start * self.sample_rate):int(end * self.sample_rate)]
+            for start, end in regions
+        ]
+        return np.concatenate(pieces) if pieces else audio[:0]
+
+    def restore_timestamps(self, segments, regions):
+        """Maps segment timestamps of the trimmed audio back to the original audio.
+
+        Args:
+            segments (List[dict]): The transcript segments with ``start`` and
+                ``end`` times relative to the trimmed audio.
+            regions (List[Tuple[float, float]]): The speech regions the trimmed
+                audio was built from, in seconds.
+
+        Returns:
+            List[dict]: The segments with times relative to the original audio.
+        """
+        trimmed_starts = []
+        offset = 0.0
+        for start, end in regions:
+            trimmed_starts.append(offset)
+            n_samples = int(end * self.sample_rate) - int(start * self.sample_rate)
+            offset += n_samples / self.sample_rate
+
+        def to_original_time(t, is_end=False):
+            bisect_fn = bisect.bisect_left if is_end else bisect.bisect_right
+            idx = max(bisect_fn(trimmed_starts, t) - 1, 0)
+            region_start, region_end = regions[idx]
+            return min(region_start + t - trimmed_starts[idx], region_end)
+
+        restored_segments = []
+        for segment in segments:
+            segment = dict(segment)
+            segment["start"] = to_original_time(segment["start"])
+            segment["end"] = to_original_time(segment["end"], is_end=True)
+            restored_segments.append(segment)
+        return restored_segments
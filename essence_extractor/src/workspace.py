@@ -0,0 +1,59 @@
+"""Keeps the files of every job apart, so jobs can share an output directory."""
+
+import os
+import re
+import shutil
+
+JOB_ID_PATTERN = re.compile(r"^[\w-]+$")
+
+
+class JobWorkspace:
+    """The files of one job inside a shared output directory.
+
+    The video, audio, transcript and run manifest of a job live in
+    ``<output_dir>/workspaces/<job_id>``, and the images of its blog post in
+    ``<output_dir>/images/<job_id>``, next to the blog post that links them.
+    Jobs running at the same time never write to or clean up the files of
+    another job.
+
+    Attributes:
+        output_dir (str): The output directory shared by all jobs.
+        job_id (str): The id of the job. Letters, digits, "_" and "-" only.
+        root (str): The directory of the intermediate files of the job.
+        video_dir (str): The directory of the downloaded video.
+        audio_dir (str): The directory of the audio and the transcript.
+        manifest_path (str): The path to the run manifest of the job.
+        image_subdir (str): The directory of the images, relative to the
+            image directory of the output directory.
+    """
+
+    WORKSPACES_DIR_NAME = "workspaces"
+
+    def __init__(self, output_dir, job_id):
+        if not JOB_ID_PATTERN.match(job_id):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        self.output_dir = output_dir
+        self.job_id = job_id
+        self.root = os.path.join(output_dir, self.WORKSPACES_DIR_NAME, job_id)
+        self.video_dir = os.path.join(self.root, "video")
+        self.audio_dir = os.path.join(self.root, "audio")
+        self.manifest_path = os.path.join(self.root, "run.json")
+        self.image_subdir = job_id
+
+    def create(self):
+        """Create the directories of the job.
+
+        Returns:
+            JobWorkspace: The workspace itself.
+        """
+        for directory in [self.video_dir, self.audio_dir]:
+            os.makedirs(directory, exist_ok=True)
+        return self
+
+    def cleanup(self):
+        """Delete the intermediate files of the job.
+
+        The blog post and its images are kept. Files of other jobs are never
+        touched.
+        """
+        shutil.rmtree(self.root, ignore_errors=True)
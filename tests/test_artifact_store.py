@@ -0,0 +1,87 @@
+import os
+from unittest.mock import MagicMock, patch
+from essence_extractor.src.artifact_store import ArtifactStore, link_or_copy
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def test_key_depends_on_params():
+    key = ArtifactStore.key("transcript", "abc", {"model": "base", "chunk_size": 200})
+    assert key == ArtifactStore.key("transcript", "abc", {"chunk_size": 200, "model": "base"})
+    assert key != ArtifactStore.key("transcript", "abc", {"model": "small", "chunk_size": 200})
+    assert key != ArtifactStore.key("audio", "abc", {"model": "base", "chunk_size": 200})
+
+
+def test_hit_is_linked_into_another_output_dir(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"))
+    key = store.key("video", "abc")
+    compute = MagicMock(return_value=_write(str(tmp_path / "first" / "video.mp4"), "video"))
+
+    first_path = store.fetch_or_compute(key, str(tmp_path / "first"), compute)
+    second_path = store.fetch_or_compute(key, str(tmp_path / "second"), compute)
+
+    compute.assert_called_once()
+    assert second_path == str(tmp_path / "second" / "video.mp4")
+    assert os.stat(first_path).st_ino == os.stat(second_path).st_ino
+    assert not os.access(second_path, os.W_OK) or os.geteuid() == 0
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"], stats["artifacts"]) == (1, 1, 1)
+    assert stats["bytes"] == len("video")
+
+
+def test_corrupted_artifact_is_dropped(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"), verify_hashes=True)
+    key = store.key("transcript", "abc")
+    store.put(key, _write(str(tmp_path / "a" / "video.txt"), "transcript"))
+    object_path = store._object_path(key, "video.txt")
+    os.chmod(object_path, 0o644)
+    _write(object_path, "tampered!!")
+
+    assert store.get(key, str(tmp_path / "b")) is None
+    assert store.corrupted == 1
+    assert store.stats()["artifacts"] == 0
+
+
+def test_verify_drops_changed_artifacts(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"))
+    intact_key, changed_key = store.key("audio", "a"), store.key("audio", "b")
+    store.put(intact_key, _write(str(tmp_path / "a" / "a.wav"), "audio a"))
+    store.put(changed_key, _write(str(tmp_path / "b" / "b.wav"), "audio b"))
+    object_path = store._object_path(changed_key, "b.wav")
+    os.chmod(object_path, 0o644)
+    _write(object_path, "audio c")
+
+    assert store.verify() == 1
+    assert store.get(intact_key, str(tmp_path / "c")) is not None
+    assert store.get(changed_key, str(tmp_path / "c")) is None
+
+
+def test_least_recently_used_artifacts_are_evicted(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"), max_bytes=10)
+    keys = [store.key("video", video_id) for video_id in "abc"]
+    with patch("essence_extractor.src.artifact_store.time.time", side_effect=range(100)):
+        store.put(keys[0], _write(str(tmp_path / "a" / "a.mp4"), "aaaa"))
+        store.put(keys[1], _write(str(tmp_path / "b" / "b.mp4"), "bbbb"))
+        assert store.get(keys[0], str(tmp_path / "out")) is not None
+        store.put(keys[2], _write(str(tmp_path / "c" / "c.mp4"), "cccc"))
+
+    assert store.evictions == 1
+    assert store.get(keys[1], str(tmp_path / "out")) is None
+    assert store.get(keys[0], str(tmp_path / "out")) is not None
+    assert store.stats()["bytes"] == 8
+
+
+def test_link_or_copy_falls_back_to_copy(tmp_path):
+    source_path = _write(str(tmp_path / "source.txt"), "content")
+    target_path = str(tmp_path / "target.txt")
+    with patch("os.link", side_effect=OSError("cross-device link")):
+        method = link_or_copy(source_path, target_path)
+    assert method in ("reflink", "copy")
+    with open(target_path) as f:
+        assert f.read() == "content"
+    assert os.stat(source_path).st_ino != os.stat(target_path).st_ino
@@ -1,6 +1,8 @@
+from types import SimpleNamespace
 from unittest.mock import MagicMock
+import numpy as np
 import pytest
-from essence_extractor import BlogGenerator
+from essence_extractor import BlogGenerator, CostManager, utils
 from pydantic import ValidationError
 from tempfile import NamedTemporaryFile
 import os
@@ -43,3 +45,237 @@ def test_split_into_first_chunk(monkeypatch):
     expected_chunk = "This is a test"
     assert chunk == expected_chunk, "The chunked text does not match the expected output"
 
+
+
+def test_generate_article_content_resumes_refine_loop(monkeypatch, tmp_path):
+    def mock_count_tokens(self, text):
+        return len(text.split())
+
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    monkeypatch.setattr('essence_extractor.src.utils.TokenCounter.count_tokens', mock_count_tokens)
+
+    generator = BlogGenerator(output_path=str(tmp_path))
+    generator._generate_answer = MagicMock(return_value="# Refined draft")
+    transcript_path = tmp_path / "transcript.txt"
+    transcript_path.write_text("[00:00] The full transcript")
+
+    checkpoint = MagicMock()
+    checkpoint.load_refine_state.return_value = ("# Draft", "[01:00] The rest")
+    blog_post = generator.generate_article_content(str(transcript_path), checkpoint=checkpoint)
+
+    assert blog_post == "# Refined draft"
+    user_message = generator._generate_answer.call_args[0][1]
+    assert "The rest" in user_message and "The full transcript" not in user_message
+    checkpoint.save_refine_state.assert_called_with("# Refined draft", "")
+
+
+def test_topic_segmenter_sends_whole_topics(monkeypatch, tmp_path):
+    from essence_extractor.src.blog_generator import (
+        BLOG_POST_INSTRUCTIONS,
+        OUTPUT_TOKEN_LENGTH_BUFFER,
+    )
+    from essence_extractor.src.topic_segmenter import TopicSegmenter
+
+    def mock_count_tokens(self, text):
+        return len(text.split())
+
+    def encode(texts):
+        topics = ["cats", "dogs", "fish"]
+        return np.eye(3)[[topics.index(text.split()[0]) for text in texts]]
+
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    monkeypatch.setattr('essence_extractor.src.utils.TokenCounter.count_tokens', mock_count_tokens)
+    generator = BlogGenerator(output_path=str(tmp_path), topic_segmenter=TopicSegmenter(encode))
+    generator._generate_answer = MagicMock(return_value="Draft")
+    # 21 words of the transcript fit into the first request, and 20 into the others.
+    generator.token_counter.model_token_length = (
+        len(BLOG_POST_INSTRUCTIONS.split())
+        + len(generator._create_refine_prompt("", "").split())
+        + OUTPUT_TOKEN_LENGTH_BUFFER + 21
+    )
+    transcript_path = tmp_path / "transcript.txt"
+    transcript_path.write_text("".join(
+        f"[{i:02d}:00] {topic} and more words "
+        for i, topic in enumerate(["cats"] * 4 + ["dogs"] * 4 + ["fish"] * 4)
+    ))
+
+    generator.generate_article_content(str(transcript_path))
+
+    chunks = [call[0][1].split("------------\n")[1]
+              for call in generator._generate_answer.call_args_list]
+    assert [{word for word in chunk.split() if word in ("cats", "dogs", "fish")}
+            for chunk in chunks] == [{"cats"}, {"dogs"}, {"fish"}]
+
+
+def _section_generator(monkeypatch, tmp_path):
+    def mock_count_tokens(self, text):
+        return len(text.split())
+
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    monkeypatch.setattr('essence_extractor.src.utils.TokenCounter.count_tokens', mock_count_tokens)
+    generator = BlogGenerator(output_path=str(tmp_path), refine_strategy="sections")
+    # One timestamped chunk of the transcript per refine call
+    generator._split_into_first_chunk = lambda text, chunk_size: "[" + text.split("[")[1]
+    return generator
+
+
+def test_refine_strategy_must_be_known(monkeypatch):
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    with pytest.raises(ValueError):
+        BlogGenerator(refine_strategy="append")
+
+
+def test_merge_sections_replaces_changed_sections_and_keeps_conclusion_last(monkeypatch, tmp_path):
+    generator = _section_generator(monkeypatch, tmp_path)
+    draft = ("# Gradient Descent\nAn intro.\n\n## The Gradient\nPoints uphill. [00:00 - 01:00]"
+             "\n\n## Conclusion\nStep downhill.")
+
+    merged = generator._merge_sections(
+        draft, "## The gradient [00:00 - 01:30]\nPoints uphill, steeply.\n\n"
+               "## Learning Rate\nSets the step size. [01:30 - 02:00]",
+    )
+
+    assert [heading for heading, _ in generator._split_sections(merged)] == [
+        "# Gradient Descent", "## The gradient [00:00 - 01:30]", "## Learning Rate",
+        "## Conclusion",
+    ]
+    assert "Points uphill, steeply." in merged and "Points uphill. " not in merged
+    assert generator._create_outline(merged).splitlines()[1:3] == [
+        "## The gradient [00:00 - 01:30]", "## Learning Rate [01:30 - 02:00]",
+    ]
+
+
+def test_section_refine_only_sends_the_outline_of_the_draft(monkeypatch, tmp_path):
+    generator = _section_generator(monkeypatch, tmp_path)
+    transcript_path = tmp_path / "transcript.txt"
+    transcript_path.write_text("".join(f"[0{i}:00] Part {i} " for i in range(5)))
+
+    def generate_answer(system_prompt, user_prompt):
+        part = user_prompt.split("------------\n")[1].split()[1:3]
+        return f"## {' '.join(part)}\nThe body of {' '.join(part)}.\n\n## Conclusion\nThe end."
+
+    generator._generate_answer = MagicMock(side_effect=generate_answer)
+    blog_post = generator.generate_article_content(str(transcript_path))
+
+    assert [heading for heading, _ in generator._split_sections(blog_post)] == [
+        f"## Part {i}" for i in range(5)
+    ] + ["## Conclusion"]
+    last_prompt = generator._generate_answer.call_args[0][1]
+    assert "## Part 3" in last_prompt and "The body of Part 3" not in last_prompt
+    # Every answer only holds the new section, so the output does not grow with the draft
+    assert generator._generate_answer.call_count == 5
+
+
+def _response(answer, prompt_tokens=None, completion_tokens=None, cached_tokens=None):
+    usage = None
+    if prompt_tokens is not None:
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        )
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=answer))], usage=usage,
+    )
+
+
+def test_chat_records_the_cached_tokens_reported_by_the_provider(monkeypatch):
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    generator = BlogGenerator(model_name="gpt-4o-mini", cost_manager=CostManager("gpt-4o-mini"))
+    generator.client.chat.completions.create.return_value = _response(
+        "Answer", prompt_tokens=1200, completion_tokens=50, cached_tokens=1024,
+    )
+
+    assert generator._generate_answer("System", "User") == "Answer"
+    assert generator.cost_manager.get_token_usage()["cached_input_tokens"] == 1024
+    assert generator.cost_manager.output_tokens == 50
+
+
+def test_chat_counts_tokens_locally_without_reported_usage(monkeypatch):
+    def mock_count_tokens(self, text):
+        return len(text.split())
+
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    monkeypatch.setattr('essence_extractor.src.utils.TokenCounter.count_tokens', mock_count_tokens)
+    generator = BlogGenerator(cost_manager=CostManager(utils.DEFAULT_MODEL_NAME))
+    generator.client.chat.completions.create.return_value = _response("Three word answer")
+
+    generator._generate_answer("Be brief", "Say something")
+
+    assert generator.cost_manager.get_token_usage() == {
+        "input_tokens": 4, "cached_input_tokens": 0, "output_tokens": 3,
+        "cache_hit_rate": 0.0,
+    }
+
+
+def test_refine_prompts_start_with_the_same_instructions(monkeypatch):
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    generator = BlogGenerator()
+    for create_prompt in [generator._create_refine_prompt,
+                          generator._create_section_refine_prompt]:
+        first = create_prompt("# Draft", "First chunk")
+        second = create_prompt("# Longer draft", "Second chunk")
+        instructions = create_prompt("", "").split("------------")[0]
+        assert os.path.commonprefix([first, second]) == instructions + "------------\n"
+
+
+def test_generate_artifacts_share_the_transcript_prefix(monkeypatch, tmp_path):
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    generator = BlogGenerator(output_path=str(tmp_path))
+    generator.client.chat.completions.create.side_effect = [
+        _response("# Blog"), _response("A summary."), _response("[00:00] Intro"),
+    ]
+    transcript_path = tmp_path / "transcript.txt"
+    transcript_path.write_text("[00:00] Welcome to the course")
+
+    artifacts = generator.generate_artifacts(str(transcript_path))
+
+    assert artifacts == {"blog_post": "# Blog", "summary": "A summary.",
+                         "chapters": "[00:00] Intro"}
+    requests = [call.kwargs["messages"]
+                for call in generator.client.chat.completions.create.call_args_list]
+    assert all(messages[:-1] == requests[0][:-1] for messages in requests)
+    assert "Welcome to the course" in requests[0][1]["content"]
+    assert len({messages[-1]["content"] for messages in requests}) == 3
+
+
+def test_generate_artifacts_of_long_transcripts_start_from_the_blog_post(monkeypatch, tmp_path):
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    generator = BlogGenerator(output_path=str(tmp_path))
+    generator.token_counter.model_token_length = 2000
+    generator.generate_article_content = MagicMock(return_value="# Refined blog")
+    generator._chat = MagicMock(return_value="A summary.")
+    transcript_path = tmp_path / "transcript.txt"
+    transcript_path.write_text("[00:00] A long lecture " * 500)
+
+    artifacts = generator.generate_artifacts(str(transcript_path), ["blog_post", "summary"])
+
+    assert artifacts == {"blog_post": "# Refined blog", "summary": "A summary."}
+    assert "# Refined blog" in generator._chat.call_args[0][0][1]["content"]
+
+
+def test_generate_artifacts_rejects_unknown_types(monkeypatch, tmp_path):
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    generator = BlogGenerator(output_path=str(tmp_path))
+    with pytest.raises(ValueError):
+        generator.generate_artifacts(str(tmp_path / "transcript.txt"), ["poem"])
+
+
+def test_chat_records_latency_and_tokens_in_the_metrics(monkeypatch):
+    from essence_extractor.src.blog_generator import LLM_REQUEST_SECONDS, LLM_TOKENS
+
+    monkeypatch.setattr('essence_extractor.src.blog_generator.OpenAI', MagicMock())
+    generator = BlogGenerator(model_name="gpt-4")
+    generator.client.chat.completions.create.return_value = _response(
+        "Answer", prompt_tokens=1200, completion_tokens=50, cached_tokens=1024,
+    )
+    requests_before = LLM_REQUEST_SECONDS.count(model="gpt-4")
+    tokens_before = {kind: LLM_TOKENS.value(model="gpt-4", kind=kind)
+                     for kind in ["input", "cached_input", "output"]}
+
+    generator._generate_answer("System", "User")
+
+    assert LLM_REQUEST_SECONDS.count(model="gpt-4") == requests_before + 1
+    assert {kind: LLM_TOKENS.value(model="gpt-4", kind=kind) - tokens
+            for kind, tokens in tokens_before.items()} == {
+        "input": 176, "cached_input": 1024, "output": 50,
+    }
@@ -1,9 +1,13 @@
 from unittest.mock import patch, MagicMock
 from essence_extractor import BlogMediaEnhancer
+from essence_extractor.src.blog_media_enhancer import OCR_SKIPPED_FRAMES, image_to_text
 import numpy as np
+import tracemalloc
 import os
 import pytest
 import faiss
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
 
 
 @patch('essence_extractor.src.blog_media_enhancer.VideoFileClip')
@@ -12,7 +16,7 @@ def test_extract_images(mock_video_clip):
     mock_video_clip.return_value = mock_video
     enhancer = BlogMediaEnhancer(output_path='test_output')
 
-    extracted_images = enhancer._extract_images('dummy_video_path', interval=10)
+    extracted_images = list(enhancer._extract_images('dummy_video_path', interval=10))
     assert len(extracted_images) == 3
 
 
@@ -34,15 +38,62 @@ def test_extract_images_with_short_video(mock_video_clip):
     enhancer = BlogMediaEnhancer(output_path='test_output')
 
     # Short video
-    extracted_images = enhancer._extract_images('dummy_video_path', interval=2)
+    extracted_images = list(enhancer._extract_images('dummy_video_path', interval=2))
     assert len(extracted_images) == 3, "Should handle short videos correctly"
 
 
-@patch('essence_extractor.src.blog_media_enhancer.pytesseract.image_to_string', return_value="Sample Text")
-def test_extract_text_from_image(mock_image_to_string):
+@patch('essence_extractor.src.blog_media_enhancer.image_to_text', return_value="Sample Text")
+def test_extract_text_from_image(mock_image_to_text):
     enhancer = BlogMediaEnhancer(output_path='test_output')
-    text = enhancer._extract_text_from_image(MagicMock())
-    assert text == "Sample Text"
+    assert enhancer._extract_text_from_image(MagicMock()) == ("Sample Text", False)
+
+
+@patch('essence_extractor.src.blog_media_enhancer.image_to_text', return_value="Slide")
+def test_extract_text_from_image_skips_frames_without_text(mock_image_to_text):
+    enhancer = BlogMediaEnhancer(output_path='test_output')
+
+    blank_frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    assert enhancer._extract_text_from_image(blank_frame) == ("", True)
+    mock_image_to_text.assert_not_called()
+
+    image = Image.new("RGB", (1280, 720), (255, 255, 255))
+    ImageDraw.Draw(image).text((100, 300), "Slide title", fill=(0, 0, 0),
+                               font=ImageFont.load_default(size=48))
+    assert enhancer._extract_text_from_image(np.array(image)) == ("Slide", False)
+    cropped = mock_image_to_text.call_args[0][0]
+    assert cropped.shape[0] < 200 and cropped.shape[1] < 1280
+
+
+@patch('essence_extractor.src.blog_media_enhancer.subprocess.run')
+def test_image_to_text_limits_the_threads_of_tesseract_only(mock_run, monkeypatch):
+    monkeypatch.delenv("OMP_THREAD_LIMIT", raising=False)
+    mock_run.return_value.stdout = b"Slide title"
+
+    assert image_to_text(np.zeros((10, 10, 3), dtype=np.uint8)) == "Slide title"
+    assert mock_run.call_args.kwargs["env"]["OMP_THREAD_LIMIT"] == "1"
+    assert mock_run.call_args.kwargs["input"].startswith(b"\x89PNG")
+    assert "OMP_THREAD_LIMIT" not in os.environ
+
+
+@patch('essence_extractor.src.blog_media_enhancer.subprocess.run')
+def test_ocr_in_this_process_uses_the_thread_budget_of_the_stage(mock_run):
+    mock_run.return_value.stdout = b"Slide"
+    resource_manager = MagicMock()
+    resource_manager.threads.return_value = 3
+    enhancer = BlogMediaEnhancer(output_path='test_output', use_text_prefilter=False,
+                                 resource_manager=resource_manager)
+
+    assert enhancer._extract_text_from_image(np.zeros((10, 10, 3), dtype=np.uint8)) == (
+        "Slide", False,
+    )
+    assert mock_run.call_args.kwargs["env"]["OMP_THREAD_LIMIT"] == "3"
+
+
+@patch('essence_extractor.src.blog_media_enhancer.subprocess.run',
+       side_effect=FileNotFoundError)
+def test_image_to_text_reports_a_missing_tesseract(mock_run):
+    with pytest.raises(pytesseract.TesseractNotFoundError):
+        image_to_text(np.zeros((10, 10, 3), dtype=np.uint8))
 
 
 def test_create_index():
@@ -52,6 +103,17 @@ def test_create_index():
     assert index.ntotal == 10
 
 
+def test_create_index_uses_cosine_similarity():
+    enhancer = BlogMediaEnhancer(output_path='test_output')
+    embeddings = np.array([[10.0, 0.0], [1.0, 1.0]], dtype=np.float32)
+    index = enhancer._create_index(embeddings)
+    query = np.array([[1.0, 1.2]], dtype=np.float32)
+    query /= np.linalg.norm(query)
+    similarities, idxs = index.search(query, k=1)
+    assert idxs[0][0] == 1
+    assert similarities[0][0] <= 1.0
+
+
 def test_query_index():
     enhancer = BlogMediaEnhancer(output_path='test_output')
     dimension = 768
@@ -78,8 +140,8 @@ def test_remove_unused_images(mock_remove, mock_listdir):
     mock_remove.assert_called_once_with(os.path.join('test_output', 'images', 'image2.png'))
 
 
-@patch('essence_extractor.src.blog_media_enhancer.pytesseract.image_to_string', return_value="Image Text")
-def test_extract_alt_text_with_image_tags(mock_image_to_string):
+@patch('essence_extractor.src.blog_media_enhancer.image_to_text', return_value="Image Text")
+def test_extract_alt_text_with_image_tags(mock_image_to_text):
     markdown_content = """
     Here is an image: ![Alt text](image_url)
     """
@@ -92,21 +154,48 @@ def test_extract_alt_text_with_image_tags(mock_image_to_string):
 def test_add_images_to_blog():
     enhancer = BlogMediaEnhancer(output_path='test_output')
 
-    enhancer._extract_images = MagicMock(return_value={'image1.png': 'dummy_data'})
+    enhancer._extract_images = MagicMock(return_value=iter([('image1.png', 'dummy_data')]))
 
     enhancer._extract_alt_text_with_image_tags = MagicMock(return_value={'Alt text': '![Alt text](image_url)'})
 
-    enhancer._embed_text = MagicMock(return_value=np.array([0.5]))
+    enhancer.embed_texts = MagicMock(
+        side_effect=lambda texts: np.full((len(texts), 1), 0.5),
+    )
 
     mock_index = MagicMock()
     enhancer._create_index = MagicMock(return_value=mock_index)
 
     enhancer._query_index = MagicMock(return_value=['image1.png'])
 
+    enhancer._save_images = MagicMock()
+
     blog_content = "Here is an image: ![Alt text](image_url)"
     updated_content = enhancer.add_images_to_blog('dummy_video_path', blog_content)
 
     assert '![Alt text](images/image1.png)' in updated_content
+    enhancer._save_images.assert_called_once_with(
+        'dummy_video_path', ['image1.png'], enhancer.image_output_path,
+    )
+
+
+@patch('essence_extractor.src.blog_media_enhancer.VideoFileClip')
+def test_save_images(mock_video_clip, tmp_path):
+    mock_video = MagicMock(duration=30)
+    mock_video.get_frame.return_value = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    mock_video_clip.return_value = mock_video
+    enhancer = BlogMediaEnhancer(
+        output_path=str(tmp_path), image_format="webp", max_image_width=640,
+    )
+
+    image_names = [name for name, _ in enhancer._extract_images('dummy_video_path')]
+    assert os.listdir(enhancer.image_output_path) == []
+
+    enhancer._save_images('dummy_video_path', image_names[1:2])
+
+    assert os.listdir(enhancer.image_output_path) == ['frame_at_10_seconds.webp']
+    mock_video.get_frame.assert_called_with(10)
+    with Image.open(os.path.join(enhancer.image_output_path, image_names[1])) as image:
+        assert image.size == (640, 360)
 
 
 @patch('essence_extractor.src.blog_media_enhancer.YouTubeURL')
@@ -120,3 +209,217 @@ def test_add_url_timestamps_to_blog(mock_youtube_url):
     updated_content = enhancer.add_url_timestamps_to_blog(youtube_url, blog_content)
 
     assert "[01:03 - 07:58](https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=63s)" in updated_content
+
+
+def test_add_media_fragment_timestamps_to_blog():
+    video_url = "https://videos.example.com/talk.mp4"
+    blog_content = "Here is a timestamp: [01:03 - 07:58] in the video."
+
+    enhancer = BlogMediaEnhancer(output_path='test_output')
+    updated_content = enhancer.add_media_fragment_timestamps_to_blog(video_url, blog_content)
+
+    assert "[01:03 - 07:58](https://videos.example.com/talk.mp4#t=63)" in updated_content
+
+
+def test_embed_texts_uses_cache(tmp_path):
+    enhancer = BlogMediaEnhancer(
+        output_path='test_output', embedding_cache_dir=str(tmp_path),
+    )
+    enhancer.embedding_backend = MagicMock()
+    enhancer.embedding_backend.encode.side_effect = lambda texts: np.ones((len(texts), 4))
+
+    embeddings = enhancer.embed_texts(["Slide one", "slide  ONE", "Slide two"])
+    assert embeddings.shape == (3, 4)
+    assert enhancer.embedding_backend.encode.call_args[0][0] == ["Slide one", "Slide two"]
+
+    rerun_enhancer = BlogMediaEnhancer(
+        output_path='test_output', embedding_cache_dir=str(tmp_path),
+    )
+    rerun_enhancer.embedding_backend = MagicMock()
+    rerun_embeddings = rerun_enhancer.embed_texts(["Slide two", "Slide one"])
+    rerun_enhancer.embedding_backend.encode.assert_not_called()
+    assert np.array_equal(rerun_embeddings, embeddings[[2, 0]])
+
+
+class _FakeVideo:
+    frame_shape = (360, 640, 3)
+
+    def __init__(self, duration):
+        self.duration = duration
+
+    def get_frame(self, t):
+        return np.full(self.frame_shape, t % 255, dtype=np.uint8)
+
+    def close(self):
+        pass
+
+
+def _peak_memory_of_indexing(duration, buffer_size):
+    enhancer = BlogMediaEnhancer(output_path='test_output')
+    # Plain functions instead of mocks, since mocks keep references to their calls
+    enhancer._extract_text_from_image = lambda img, threads=None: ("Slide text", False)
+    enhancer.embed_texts = lambda texts: np.zeros((len(texts), 8), dtype=np.float32)
+
+    with patch('essence_extractor.src.blog_media_enhancer.VideoFileClip',
+               return_value=_FakeVideo(duration)):
+        tracemalloc.start()
+        images_text_dict = enhancer.index_video_frames(
+            'dummy_video_path', buffer_size=buffer_size,
+        )
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    assert len(images_text_dict) == duration // 10
+    return peak, np.prod(_FakeVideo.frame_shape)
+
+
+def test_index_video_frames_memory_is_independent_of_video_length():
+    buffer_size = 4
+    for duration in [500, 5000]:
+        peak, frame_size = _peak_memory_of_indexing(duration, buffer_size)
+        assert peak < (buffer_size + 4) * frame_size
+
+
+def test_extract_placeholder_windows():
+    enhancer = BlogMediaEnhancer(output_path='test_output')
+    blog_content = (
+        "# Title\n![Cover](image_url)\n"
+        "## Intro\nWelcome [00:00 - 01:30] and more [01:30 - 02:05].\n"
+        "![Diagram](image_url)\n"
+        "## Details\n![Chart](image_url)\nDetails [10:00 - 12:00]\n"
+        "## Outro\n![Goodbye](image_url)\n"
+    )
+
+    windows = enhancer._extract_placeholder_windows(blog_content)
+
+    assert windows == {
+        'Cover': (0, 125), 'Diagram': (0, 125),
+        'Chart': (600, 720), 'Goodbye': (600, 720),
+    }
+
+
+def test_add_images_to_blog_only_indexes_frames_of_the_section():
+    enhancer = BlogMediaEnhancer(output_path='test_output')
+    enhancer._extract_text_from_image = lambda img, threads=None: ("Slide text", False)
+    enhancer.embed_texts = lambda texts: np.ones((len(texts), 8), dtype=np.float32)
+    enhancer._save_images = MagicMock()
+    blog_content = "## Details\nDetails [10:00 - 12:00]\n![Chart](image_url)\n"
+
+    video = _FakeVideo(3600)
+    video.get_frame = MagicMock(side_effect=video.get_frame)
+    with patch('essence_extractor.src.blog_media_enhancer.VideoFileClip',
+               return_value=video):
+        updated_content = enhancer.add_images_to_blog('dummy_video_path', blog_content)
+
+    extracted_times = [call.args[0] for call in video.get_frame.call_args_list]
+    assert extracted_times == list(range(600, 721, 10))
+    assert '![Chart](images/frame_at_600_seconds.jpg)' in updated_content
+
+
+def test_add_images_to_blog_keeps_images_of_other_jobs(tmp_path):
+    enhancer = BlogMediaEnhancer(output_path=str(tmp_path))
+    other_job_image = os.path.join(enhancer.image_output_path, "other_job", "frame_at_0_seconds.jpg")
+    os.makedirs(os.path.dirname(other_job_image))
+    open(other_job_image, "w").close()
+    stale_image = os.path.join(enhancer.image_output_path, "job", "frame_at_90_seconds.jpg")
+    os.makedirs(os.path.dirname(stale_image))
+    open(stale_image, "w").close()
+    enhancer.embed_texts = MagicMock(side_effect=lambda texts: np.ones((len(texts), 2)))
+    enhancer._save_images = MagicMock()
+
+    updated_content = enhancer.add_images_to_blog(
+        'dummy_video_path', "![Alt text](image_url)",
+        images_text_dict={"frame_at_10_seconds.jpg": np.ones(2)}, image_subdir="job",
+    )
+
+    assert updated_content == "![Alt text](images/job/frame_at_10_seconds.jpg)"
+    enhancer._save_images.assert_called_once_with(
+        'dummy_video_path', ['frame_at_10_seconds.jpg'],
+        os.path.join(enhancer.image_output_path, "job"),
+    )
+    assert not os.path.exists(stale_image)
+    assert os.path.exists(other_job_image)
+
+
+def test_index_video_frames_in_ocr_worker_processes():
+    enhancer = BlogMediaEnhancer(output_path='test_output', ocr_workers=2)
+    enhancer.embed_texts = lambda texts: np.zeros((len(texts), 8), dtype=np.float32)
+
+    # Uniform frames have no text, so the workers skip them without running OCR
+    for _ in range(2):
+        skipped_before = OCR_SKIPPED_FRAMES.value()
+        with patch('essence_extractor.src.blog_media_enhancer.VideoFileClip',
+                   return_value=_FakeVideo(120)):
+            images_text_dict = enhancer.index_video_frames('dummy_video_path')
+
+        assert list(images_text_dict) == [
+            f"frame_at_{t}_seconds.jpg" for t in range(0, 120, 10)
+        ]
+        assert OCR_SKIPPED_FRAMES.value() - skipped_before == 12
+
+
+def test_ocr_workers_are_capped_by_the_thread_budget():
+    resource_manager = MagicMock()
+    resource_manager.threads.return_value = 2
+    enhancer = BlogMediaEnhancer(output_path='test_output', ocr_workers=8,
+                                 resource_manager=resource_manager)
+    enhancer._extract_texts_in_workers = MagicMock(return_value=iter([]))
+
+    with patch('essence_extractor.src.blog_media_enhancer.VideoFileClip',
+               return_value=_FakeVideo(120)):
+        assert enhancer.index_video_frames('dummy_video_path') == {}
+    assert enhancer._extract_texts_in_workers.call_args[0][1] == 2
+
+
+def _write_test_video(video_path, duration=40):
+    from moviepy.editor import VideoClip
+    clip = VideoClip(
+        lambda t: np.full((48, 64, 3), int(t * 6) % 256, dtype=np.uint8), duration=duration,
+    )
+    clip.write_videofile(str(video_path), fps=5, codec="libx264", audio=False, logger=None)
+
+
+def _index_with_fake_text(enhancer, video_path):
+    # The text and embedding of a frame depend on all of its pixels
+    enhancer._extract_text_from_image = lambda img, threads=None: (
+        str(int(img.astype(np.int64).sum())), False,
+    )
+    enhancer.embed_texts = lambda texts: np.array(
+        [[float(text), len(text)] for text in texts], dtype=np.float32,
+    )
+    return enhancer.index_video_frames(str(video_path), window=(0, 39))
+
+
+def test_sharded_frame_reading_matches_serial_reading(tmp_path):
+    video_path = tmp_path / "video.mp4"
+    _write_test_video(video_path)
+
+    serial = _index_with_fake_text(
+        BlogMediaEnhancer(output_path='test_output', frames_per_window=13), video_path,
+    )
+    sharded = _index_with_fake_text(
+        BlogMediaEnhancer(output_path='test_output', frames_per_window=13,
+                          frame_reader_processes=3),
+        video_path,
+    )
+
+    assert list(sharded) == list(serial)
+    assert len(serial) == 14
+    for name in serial:
+        assert np.array_equal(sharded[name], serial[name])
+
+
+def test_frame_reader_count_follows_duration_and_cores():
+    resource_manager = MagicMock()
+    resource_manager.threads.return_value = 4
+    enhancer = BlogMediaEnhancer(output_path='test_output', frame_reader_processes="auto",
+                                 resource_manager=resource_manager)
+
+    assert enhancer._frame_reader_count(duration=3 * 3600, n_frames=1080) == 4
+    assert enhancer._frame_reader_count(duration=700, n_frames=70) == 2
+    assert enhancer._frame_reader_count(duration=120, n_frames=12) == 1
+    enhancer.frame_reader_processes = 8
+    assert enhancer._frame_reader_count(duration=30, n_frames=3) == 2
+
+    with pytest.raises(ValueError):
+        BlogMediaEnhancer(output_path='test_output', frame_reader_processes=0)
@@ -0,0 +1,41 @@
+import os
+from essence_extractor.src.checkpoint import RunManifest
+
+
+def test_complete_and_resume(tmp_path):
+    manifest_path = str(tmp_path / "run.json")
+    video_path = tmp_path / "video.mp4"
+    video_path.write_text("video")
+
+    manifest = RunManifest(manifest_path, params={"model_name": "gpt-4"})
+    manifest.complete("Downloading Video", str(video_path), is_path=True)
+    manifest.complete("Adding Images", "# Blog")
+
+    resumed_manifest = RunManifest(manifest_path, params={"model_name": "gpt-4"})
+    assert resumed_manifest.is_complete("Downloading Video")
+    assert resumed_manifest.get("Adding Images") == "# Blog"
+    assert not resumed_manifest.is_complete("Extracting Audio")
+
+    os.remove(video_path)
+    assert not resumed_manifest.is_complete("Downloading Video")
+
+
+def test_changed_params_start_over(tmp_path):
+    manifest_path = str(tmp_path / "run.json")
+    RunManifest(manifest_path, params={"model_name": "gpt-4"}).complete("Stage", "text")
+    assert not RunManifest(manifest_path, params={"model_name": "gpt-4-32k"}).is_complete(
+        "Stage",
+    )
+
+
+def test_refine_state(tmp_path):
+    manifest_path = str(tmp_path / "run.json")
+    manifest = RunManifest(manifest_path)
+    assert manifest.load_refine_state() is None
+    manifest.save_refine_state("# Draft", "remaining transcript")
+    assert RunManifest(manifest_path).load_refine_state() == (
+        "# Draft", "remaining transcript",
+    )
+    manifest.discard()
+    assert RunManifest(manifest_path).load_refine_state() is None
+    assert not [f for f in os.listdir(tmp_path) if f.startswith(".tmp-")]
@@ -1,4 +1,5 @@
 from unittest.mock import patch
+import tiktoken
 from essence_extractor import CostManager
 from essence_extractor import utils
 
@@ -29,3 +30,55 @@ def test_get_total_cost():
     assert total_cost == expected_cost
 
 
+
+
+def test_cached_input_tokens_are_billed_at_the_cached_rate():
+    cost_manager = CostManager("gpt-4o-mini")
+    cost = cost_manager.calculate_cost_usage(2000, 100, cached_input_tokens=1500)
+
+    assert cost == (500 / 1000 * cost_manager.input_token_cost
+                    + 1500 / 1000 * cost_manager.cached_input_token_cost
+                    + 100 / 1000 * cost_manager.output_token_cost)
+    assert cost_manager.cached_input_token_cost < cost_manager.input_token_cost
+    assert cost_manager.get_token_usage() == {
+        "input_tokens": 2000, "cached_input_tokens": 1500, "output_tokens": 100,
+        "cache_hit_rate": 0.75,
+    }
+
+
+def test_models_without_prompt_caching_bill_cached_tokens_as_input():
+    cost_manager = CostManager(utils.DEFAULT_MODEL_NAME)
+    assert cost_manager.cached_input_token_cost == cost_manager.input_token_cost
+
+
+def test_gpt_4o_models_count_tokens(monkeypatch):
+    encodings = []
+    cl100k_base = tiktoken.get_encoding("cl100k_base")
+
+    def get_encoding(name):
+        encodings.append(name)
+        return cl100k_base
+
+    monkeypatch.setattr(utils.tiktoken, "get_encoding", get_encoding)
+    utils.get_encoding.cache_clear()
+    try:
+        cost_manager = CostManager("gpt-4o")
+        cost = cost_manager.calculate_cost_text("some text", is_input=True)
+    finally:
+        utils.get_encoding.cache_clear()
+    assert cost > 0
+    assert encodings[0] == "o200k_base"
+
+
+def test_unknown_encodings_fall_back_to_cl100k(monkeypatch):
+    def old_tiktoken_get_encoding(name):
+        if name == "o200k_base":
+            raise ValueError(f"Unknown encoding {name}")
+        return name
+
+    monkeypatch.setattr(utils.tiktoken, "get_encoding", old_tiktoken_get_encoding)
+    utils.get_encoding.cache_clear()
+    try:
+        assert utils.get_encoding("gpt-4o") == utils.FALLBACK_ENCODING
+    finally:
+        utils.get_encoding.cache_clear()
@@ -0,0 +1,120 @@
+import json
+import os
+import numpy as np
+import pytest
+from benchmarks.evaluate_embedding_backends import evaluate_backend
+from essence_extractor.src.embedding_backends import (
+    EMBEDDING_BACKENDS,
+    OnnxBackend,
+    SentenceTransformerBackend,
+    get_embedding_backend,
+)
+
+FIXTURE_PATH = os.path.join(
+    os.path.dirname(__file__), '..', 'benchmarks', 'fixtures', 'frames_alt_texts.json',
+)
+
+
+class _BagOfWordsBackend:
+    cache_key = "bag-of-words"
+
+    def __init__(self, vocabulary):
+        self.vocabulary = {word: i for i, word in enumerate(sorted(vocabulary))}
+
+    def encode(self, texts):
+        embeddings = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                if word in self.vocabulary:
+                    embeddings[row, self.vocabulary[word]] += 1
+        return embeddings
+
+
+def test_get_embedding_backend():
+    assert isinstance(get_embedding_backend("minilm"), SentenceTransformerBackend)
+    onnx_backend = get_embedding_backend("minilm-onnx-int8")
+    assert isinstance(onnx_backend, OnnxBackend)
+    assert onnx_backend.cache_key.endswith("-onnx-int8")
+    assert len({get_embedding_backend(name).cache_key for name in EMBEDDING_BACKENDS}) == 4
+    with pytest.raises(ValueError):
+        get_embedding_backend("unknown")
+
+
+def test_evaluate_backend():
+    with open(FIXTURE_PATH, "r") as f:
+        fixture = json.load(f)
+    queries = [tuple(query) for query in fixture["queries"]]
+    vocabulary = {word for text in fixture["frames"].values() for word in text.lower().split()}
+
+    result = evaluate_backend(_BagOfWordsBackend(vocabulary), fixture["frames"], queries)
+
+    assert 0 < result["top1_accuracy"] <= result["mean_reciprocal_rank"] <= 1
+    assert result["texts_per_second"] > 0
+    assert result["dimension"] == len(vocabulary)
+
+
+def _tiny_sentence_transformer(path):
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizer
+
+    words = "gradient descent slide chart loss model plot of the a".split()
+    bert_path = os.path.join(path, "bert")
+    os.makedirs(bert_path)
+    with open(os.path.join(bert_path, "vocab.txt"), "w") as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words))
+    BertTokenizer(os.path.join(bert_path, "vocab.txt")).save_pretrained(bert_path)
+    config = BertConfig(vocab_size=5 + len(words), hidden_size=32, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=64)
+    BertModel(config).save_pretrained(bert_path)
+    model = SentenceTransformer(modules=[models.Transformer(bert_path), models.Pooling(32)])
+    model.save(os.path.join(path, "model"))
+    return model, os.path.join(path, "model")
+
+
+def test_onnx_backend_matches_sentence_transformer(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    model, model_path = _tiny_sentence_transformer(str(tmp_path))
+    texts = ["gradient descent slide", "the loss of the model", "a plot"]
+    expected = model.encode(texts)
+
+    for quantize in [False, True]:
+        backend = OnnxBackend(model_path, quantize=quantize, onnx_dir=str(tmp_path / "onnx"))
+        embeddings = backend.encode(texts)
+        similarities = np.sum(embeddings * expected, axis=1) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(expected, axis=1)
+        )
+        assert embeddings.shape == expected.shape
+        assert np.all(similarities > 0.99)
+    assert os.path.exists(tmp_path / "onnx" / "model_int8.onnx")
+
+
+def test_export_writes_through_a_unique_temporary_file(tmp_path):
+    from essence_extractor.src.embedding_backends import _replacing
+    path = str(tmp_path / "model.onnx")
+
+    with pytest.raises(RuntimeError):
+        with _replacing(path) as part_path:
+            open(part_path, "w").close()
+            raise RuntimeError("export failed")
+    assert os.listdir(tmp_path) == []
+
+    with _replacing(path) as part_path, _replacing(path) as other_part_path:
+        assert part_path != other_part_path
+        for written_path in (part_path, other_part_path):
+            with open(written_path, "w") as f:
+                f.write("model")
+    assert os.listdir(tmp_path) == ["model.onnx"]
+
+
+def test_dynamo_is_only_turned_off_where_torch_has_it():
+    from essence_extractor.src.embedding_backends import _onnx_export_options
+
+    def old_export(model, args, f, input_names=None, opset_version=None):
+        pass
+
+    def new_export(model, args, f, input_names=None, opset_version=None, dynamo=True):
+        pass
+
+    assert _onnx_export_options(old_export) == {}
+    assert _onnx_export_options(new_export) == {"dynamo": False}
@@ -0,0 +1,55 @@
+from unittest.mock import MagicMock
+import numpy as np
+from essence_extractor.src.embedding_cache import EmbeddingCache
+
+
+def _encode(texts):
+    return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_embed_deduplicates_texts():
+    cache = EmbeddingCache("test-model")
+    encode = MagicMock(side_effect=_encode)
+    embeddings = cache.embed(["a b", "A  b", "c"], encode)
+    encode.assert_called_once_with(["a b", "c"])
+    assert np.array_equal(embeddings[0], embeddings[1])
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_embed_reads_from_disk(tmp_path):
+    EmbeddingCache("test-model", cache_dir=str(tmp_path)).embed(["slide"], _encode)
+
+    cache = EmbeddingCache("test-model", cache_dir=str(tmp_path))
+    encode = MagicMock(side_effect=_encode)
+    embeddings = cache.embed(["slide"], encode)
+    encode.assert_not_called()
+    assert np.array_equal(embeddings, _encode(["slide"]))
+
+
+def test_key_depends_on_model_name(tmp_path):
+    EmbeddingCache("model-a", cache_dir=str(tmp_path)).embed(["slide"], _encode)
+    assert EmbeddingCache("model-b", cache_dir=str(tmp_path)).get("slide") is None
+
+
+def test_memory_keeps_the_most_recently_used_embeddings():
+    cache = EmbeddingCache("test-model", maxsize=2)
+    cache.embed(["a", "b"], _encode)
+    cache.get("a")
+    cache.embed(["c"], _encode)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_writes_append_to_the_index(tmp_path):
+    cache = EmbeddingCache("test-model", cache_dir=str(tmp_path))
+    cache.embed(["a", "b"], _encode)
+    index_path = tmp_path / "embeddings" / "test-model" / EmbeddingCache.INDEX_FILE_NAME
+    first_index = index_path.read_text()
+
+    cache.embed(["c", "a"], _encode)
+
+    index = index_path.read_text()
+    assert index.startswith(first_index)
+    assert len(index.splitlines()) == 4
+    other_cache = EmbeddingCache("test-model", cache_dir=str(tmp_path), maxsize=0)
+    assert np.array_equal(other_cache.get("c"), _encode(["c"])[0])
@@ -0,0 +1,78 @@
+import multiprocessing
+import queue
+
+import numpy as np
+import pytest
+
+from benchmarks.frame_handoff import measure_handoff
+from essence_extractor.src.frame_ring_buffer import SharedFrameRingBuffer
+
+
+def _sum_frame(ring_buffer, slot, results):
+    results.put(int(ring_buffer.view(slot).sum()))
+    ring_buffer.release(slot)
+    ring_buffer.close()
+
+
+def test_write_view_and_release():
+    with SharedFrameRingBuffer(2, (4, 6, 3)) as ring_buffer:
+        frame = np.arange(72, dtype=np.uint8).reshape(4, 6, 3)
+        slot = ring_buffer.acquire(timeout=1)
+        ring_buffer.write(slot, frame)
+
+        view = ring_buffer.view(slot)
+        assert np.array_equal(view, frame)
+        assert not np.shares_memory(view, frame)
+
+        ring_buffer.release(slot)
+        slots = {ring_buffer.acquire(timeout=1), ring_buffer.acquire(timeout=1)}
+        assert slots == {0, 1}
+
+
+def test_write_rejects_frames_of_another_shape():
+    with SharedFrameRingBuffer(1, (4, 6, 3)) as ring_buffer:
+        slot = ring_buffer.acquire(timeout=1)
+        with pytest.raises(ValueError):
+            ring_buffer.write(slot, np.zeros((6, 4, 3), dtype=np.uint8))
+
+
+def test_acquire_waits_for_a_free_slot():
+    with SharedFrameRingBuffer(2, (2, 2)) as ring_buffer:
+        ring_buffer.acquire(timeout=1)
+        slot = ring_buffer.acquire(timeout=1)
+        with pytest.raises(queue.Empty):
+            ring_buffer.acquire(timeout=0.1)
+
+        ring_buffer.release(slot)
+        assert ring_buffer.acquire(timeout=1) == slot
+
+
+def test_needs_at_least_one_slot():
+    with pytest.raises(ValueError):
+        SharedFrameRingBuffer(0, (2, 2))
+
+
+def test_worker_process_reads_and_releases_the_slot():
+    context = multiprocessing.get_context("spawn")
+    with SharedFrameRingBuffer(1, (720, 1280, 3), context=context) as ring_buffer:
+        slot = ring_buffer.acquire(timeout=1)
+        ring_buffer.write(slot, np.ones((720, 1280, 3), dtype=np.uint8))
+        results = context.Queue()
+        worker = context.Process(target=_sum_frame, args=(ring_buffer, slot, results))
+        worker.start()
+
+        assert results.get(timeout=60) == 720 * 1280 * 3
+        worker.join(timeout=10)
+        assert ring_buffer.acquire(timeout=10) == slot
+
+
+def test_shared_memory_handoff_sends_no_frames_through_the_pipe():
+    kwargs = {"n_frames": 8, "frame_shape": (180, 320, 3), "n_workers": 1}
+    through_queue = measure_handoff("queue", **kwargs)
+    through_shared_memory = measure_handoff("shared_memory", **kwargs)
+
+    frame_bytes = 8 * 180 * 320 * 3
+    assert through_queue["pipe_bytes"] > frame_bytes
+    assert through_shared_memory["pipe_bytes"] < 1000
+    assert through_shared_memory["copied_bytes"] == frame_bytes
+    assert through_queue["copied_bytes"] == 2 * frame_bytes
@@ -0,0 +1,57 @@
+import os
+from essence_extractor.src.hot_folder import HotFolder
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_files_are_ready_once_they_stop_changing(tmp_path):
+    clock = FakeClock()
+    hot_folder = HotFolder(str(tmp_path), settle_seconds=5, clock=clock)
+    video_path = tmp_path / "talk.mp4"
+    video_path.write_bytes(b"part")
+
+    assert hot_folder.poll() == []
+    assert hot_folder.pending == [str(video_path)]
+
+    clock.now = 4
+    video_path.write_bytes(b"partial video")
+    os.utime(video_path, ns=(0, 10 ** 9))
+    clock.now = 8
+    assert hot_folder.poll() == []
+
+    clock.now = 13
+    assert hot_folder.poll() == [str(video_path)]
+    assert hot_folder.pending == []
+    clock.now = 100
+    assert hot_folder.poll() == []
+
+
+def test_other_and_hidden_files_are_ignored(tmp_path):
+    hot_folder = HotFolder(str(tmp_path), settle_seconds=0)
+    (tmp_path / "notes.txt").write_text("notes")
+    (tmp_path / ".part-talk.mp4").write_bytes(b"video")
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "talk.mp4").write_bytes(b"video")
+    (tmp_path / "TALK.MOV").write_bytes(b"video")
+    os.utime(tmp_path / "nested" / "talk.mp4", ns=(0, 2 * 10 ** 9))
+    os.utime(tmp_path / "TALK.MOV", ns=(0, 10 ** 9))
+
+    assert hot_folder.poll() == [str(tmp_path / "TALK.MOV")]
+    assert HotFolder(str(tmp_path), settle_seconds=0, recursive=True).poll() == [
+        str(tmp_path / "TALK.MOV"), str(tmp_path / "nested" / "talk.mp4"),
+    ]
+
+
+def test_reported_files_are_skipped(tmp_path):
+    hot_folder = HotFolder(str(tmp_path), settle_seconds=0)
+    (tmp_path / "old.mp4").write_bytes(b"video")
+    (tmp_path / "new.mp4").write_bytes(b"video")
+    hot_folder.mark_reported([str(tmp_path / "old.mp4")])
+
+    assert hot_folder.poll() == [str(tmp_path / "new.mp4")]
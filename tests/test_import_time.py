@@ -0,0 +1,19 @@
+import pytest
+
+from benchmarks.import_time import (
+    ENTRY_POINTS,
+    IMPORT_TIME_BUDGET_SECONDS,
+    heavy_imports,
+    measure_import_time,
+)
+
+
+@pytest.mark.parametrize("entry_point", list(ENTRY_POINTS))
+def test_entry_point_does_not_import_heavy_dependencies(entry_point):
+    result = measure_import_time(ENTRY_POINTS[entry_point])
+    assert heavy_imports(result["modules"]) == set()
+    assert result["seconds"] < IMPORT_TIME_BUDGET_SECONDS
+
+
+def test_heavy_imports():
+    assert heavy_imports(["torch.nn", "numpy", "whisper"]) == {"torch", "whisper"}
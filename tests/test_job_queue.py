@@ -0,0 +1,166 @@
+from unittest.mock import MagicMock
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from essence_extractor.src import utils
+from essence_extractor.src.job_queue import (
+    JobStore, JobWorkerPool, CANCELLED, FAILED, LOCAL_FILE, QUEUED, RUNNING, SUCCEEDED,
+)
+
+YOUTUBE_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def test_submit_and_claim(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    first_job_id = job_store.submit(YOUTUBE_URL)
+    job_store.submit(YOUTUBE_URL)
+
+    job = job_store.claim_next()
+    assert job["id"] == first_job_id
+    assert job["status"] == RUNNING
+    assert job_store.count(QUEUED) == 1
+
+
+def test_cancel(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    running_job_id = job_store.submit(YOUTUBE_URL)
+    queued_job_id = job_store.submit(YOUTUBE_URL)
+    job_store.claim_next()
+
+    assert job_store.cancel(queued_job_id)
+    assert job_store.get(queued_job_id)["status"] == CANCELLED
+    assert job_store.cancel(running_job_id)
+    assert job_store.is_cancel_requested(running_job_id)
+
+
+def test_run_job_records_outcome(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    worker_pool = JobWorkerPool(job_store, MagicMock())
+
+    def run(url, on_stage_done, is_cancelled, job_id):
+        assert job_id == job_store.get(job_id)["id"]
+        on_stage_done("Downloading Video", 1.5)
+        return {"blog_post_path": "video.md", "cost": 0.1, "stage_timings": {}}
+
+    pipeline = MagicMock()
+    pipeline.run.side_effect = run
+    job_id = job_store.submit(YOUTUBE_URL)
+    worker_pool.run_job(pipeline, job_store.claim_next())
+
+    job = job_store.get(job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["stage_timings"] == {"Downloading Video": 1.5}
+    assert job["result"]["blog_post_path"] == "video.md"
+
+    pipeline.run.side_effect = utils.JobCancelledError()
+    job_id = job_store.submit(YOUTUBE_URL)
+    worker_pool.run_job(pipeline, job_store.claim_next())
+    assert job_store.get(job_id)["status"] == CANCELLED
+
+    pipeline.run.side_effect = RuntimeError("boom")
+    job_id = job_store.submit(YOUTUBE_URL)
+    worker_pool.run_job(pipeline, job_store.claim_next())
+    assert job_store.get(job_id)["status"] == FAILED
+    assert job_store.get(job_id)["error"] == "boom"
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _set_worker_pid(job_store, job_id, worker_pid):
+    with job_store._connect() as connection:
+        connection.execute(
+            "UPDATE jobs SET worker_pid = ? WHERE id = ?", (worker_pid, job_id),
+        )
+
+
+def test_requeue_running(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    orphaned_job_id = job_store.submit(YOUTUBE_URL)
+    live_job_id = job_store.submit(YOUTUBE_URL)
+    job_store.claim_next()
+    job_store.claim_next()
+    _set_worker_pid(job_store, orphaned_job_id, _dead_pid())
+
+    assert job_store.requeue_running() == 1
+    assert job_store.get(orphaned_job_id)["status"] == QUEUED
+    assert job_store.get(live_job_id)["status"] == RUNNING
+
+
+def test_starting_a_pool_keeps_the_jobs_of_another_live_pool(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_started, release_job = threading.Event(), threading.Event()
+
+    def run(url, **kwargs):
+        job_started.set()
+        release_job.wait(10)
+        return {"blog_post_path": "video.md"}
+
+    first_pipeline = MagicMock()
+    first_pipeline.run.side_effect = run
+    first_pool = JobWorkerPool(job_store, lambda: first_pipeline, poll_interval=0.05)
+    second_pool = JobWorkerPool(job_store, MagicMock(), poll_interval=0.05)
+    job_id = job_store.submit(YOUTUBE_URL)
+    first_pool.start()
+    try:
+        assert job_started.wait(10)
+        second_pool.start()
+        second_pool.stop()
+        assert job_store.get(job_id)["status"] == RUNNING
+    finally:
+        release_job.set()
+        first_pool.stop()
+    assert job_store.get(job_id)["status"] == SUCCEEDED
+    first_pipeline.run.assert_called_once()
+
+
+def test_run_job_runs_local_files_with_run_file(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    worker_pool = JobWorkerPool(job_store, MagicMock())
+    video_path = str(tmp_path / "talk.mp4")
+    pipeline = MagicMock()
+    pipeline.run_file.return_value = {"blog_post_path": "talk.md"}
+
+    # The file was deleted before the job ran, so it must not be downloaded.
+    job_id = job_store.submit(video_path, source=LOCAL_FILE)
+    worker_pool.run_job(pipeline, job_store.claim_next())
+
+    pipeline.run.assert_not_called()
+    assert pipeline.run_file.call_args[0][0] == video_path
+    assert job_store.get(job_id)["status"] == SUCCEEDED
+
+
+def test_workers_share_one_pipeline(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    pipeline_factory = MagicMock()
+    pipeline = pipeline_factory.return_value
+    pipeline.run.return_value = {"blog_post_path": "video.md"}
+    job_ids = [job_store.submit(YOUTUBE_URL) for _ in range(3)]
+    worker_pool = JobWorkerPool(job_store, pipeline_factory, n_workers=2,
+                                poll_interval=0.01)
+
+    worker_pool.start()
+    try:
+        deadline = time.monotonic() + 10
+        while job_store.count(SUCCEEDED) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker_pool.stop(timeout=5)
+
+    pipeline_factory.assert_called_once()
+    pipeline.close.assert_called_once()
+    assert all(job_store.get(job_id)["status"] == SUCCEEDED for job_id in job_ids)
+
+
+def test_start_fails_when_the_pipeline_cannot_be_created(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    worker_pool = JobWorkerPool(job_store, MagicMock(side_effect=RuntimeError("no GPU")))
+
+    with pytest.raises(RuntimeError):
+        worker_pool.start()
+    assert worker_pool._threads == []
@@ -0,0 +1,107 @@
+import pytest
+from essence_extractor.src import metrics, utils
+from essence_extractor.src.metrics import MetricsRegistry
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = MetricsRegistry()
+    registry.counter("download_bytes", "Downloaded bytes.").inc(1024)
+    registry.gauge("jobs", "Jobs.", ["status"]).set(3, status="queued")
+    histogram = registry.histogram("request_seconds", "Latency.", ["model"], buckets=(1, 5))
+    for seconds in [0.5, 1, 2, 10]:
+        histogram.observe(seconds, model="gpt-4o")
+
+    assert registry.render().splitlines() == [
+        "# TYPE essence_extractor_download_bytes counter",
+        "# HELP essence_extractor_download_bytes Downloaded bytes.",
+        "essence_extractor_download_bytes_total 1024",
+        "# TYPE essence_extractor_jobs gauge",
+        "# HELP essence_extractor_jobs Jobs.",
+        'essence_extractor_jobs{status="queued"} 3',
+        "# TYPE essence_extractor_request_seconds histogram",
+        "# HELP essence_extractor_request_seconds Latency.",
+        'essence_extractor_request_seconds_bucket{model="gpt-4o",le="1.0"} 2',
+        'essence_extractor_request_seconds_bucket{model="gpt-4o",le="5.0"} 3',
+        'essence_extractor_request_seconds_bucket{model="gpt-4o",le="+Inf"} 4',
+        'essence_extractor_request_seconds_sum{model="gpt-4o"} 13.5',
+        'essence_extractor_request_seconds_count{model="gpt-4o"} 4',
+        "# EOF",
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("stages", "Stages.", ["stage"]).inc(stage='say "hi"\\\n')
+
+    assert 'essence_extractor_stages_total{stage="say \\"hi\\"\\\\\\n"} 1' in registry.render()
+
+
+def test_metrics_need_all_their_labels():
+    counter = MetricsRegistry().counter("lookups", "Lookups.", ["cache", "result"])
+
+    with pytest.raises(ValueError):
+        counter.inc(cache="embedding")
+    with pytest.raises(ValueError):
+        counter.inc(-1, cache="embedding", result="hit")
+
+
+def test_registry_returns_existing_metrics_and_rejects_conflicts():
+    registry = MetricsRegistry()
+    counter = registry.counter("lookups", "Lookups.", ["result"])
+
+    assert registry.counter("lookups", "Lookups.", ["result"]) is counter
+    with pytest.raises(ValueError):
+        registry.gauge("lookups", "Lookups.", ["result"])
+    with pytest.raises(ValueError):
+        registry.counter("lookups", "Lookups.", ["cache"])
+
+
+def test_function_metrics_are_read_when_rendered():
+    registry = MetricsRegistry()
+    depth = {"queued": 1}
+    registry.gauge("jobs", "Jobs.", ["status"],
+                   function=lambda: {(status,): n for status, n in depth.items()})
+
+    assert 'essence_extractor_jobs{status="queued"} 1' in registry.render()
+    depth["queued"] = 4
+    assert 'essence_extractor_jobs{status="queued"} 4' in registry.render()
+
+
+def test_failing_function_does_not_break_rendering():
+    registry = MetricsRegistry()
+    registry.gauge("broken", "Broken.", function=lambda: 1 / 0)
+    registry.counter("runs", "Runs.").inc()
+
+    rendered = registry.render()
+
+    assert "essence_extractor_runs_total 1" in rendered
+    assert "essence_extractor_broken" not in rendered
+    assert rendered.endswith("# EOF\n")
+
+
+def test_histogram_time_observes_the_duration():
+    histogram = MetricsRegistry().histogram("stage_seconds", "Stages.", ["stage"])
+
+    with histogram.time(stage="Saving to File"):
+        pass
+
+    assert histogram.count(stage="Saving to File") == 1
+
+
+def test_write_textfile(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("runs", "Runs.").inc()
+    textfile_path = tmp_path / "essence_extractor.prom"
+
+    registry.write_textfile(str(textfile_path))
+
+    assert textfile_path.read_text() == registry.render()
+
+
+def test_token_count_cache_lookups_are_collected():
+    cache = utils.get_token_count_cache("test-encoding")
+    cache.hits += 2
+
+    assert metrics.TOKEN_COUNT_CACHE_LOOKUPS.value(
+        encoding="test-encoding", result="hit",
+    ) == cache.info()["hits"]
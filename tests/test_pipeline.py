@@ -0,0 +1,271 @@
+from unittest.mock import patch, MagicMock
+import os
+import threading
+import pytest
+from essence_extractor.src import utils
+from essence_extractor.src.pipeline import (
+    Pipeline, STAGES, SEARCH_INDEX_STAGE, local_video_id,
+)
+from essence_extractor.src.semantic_index import SemanticIndex
+import numpy as np
+
+YOUTUBE_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def _create_pipeline(output_dir):
+    with patch('essence_extractor.src.pipeline.YouTubeDownloader'), \
+            patch('essence_extractor.src.pipeline.Transcriber'), \
+            patch('essence_extractor.src.pipeline.BlogGenerator'), \
+            patch('essence_extractor.src.pipeline.BlogMediaEnhancer'):
+        pipeline = Pipeline(output_dir=output_dir)
+    for file_name in ["video.mp4", "video.wav", "video.txt"]:
+        open(os.path.join(output_dir, file_name), "w").close()
+    pipeline.yt_downloader.download_video.return_value = os.path.join(output_dir, "video.mp4")
+    pipeline.transcriber.extract_audio.return_value = os.path.join(output_dir, "video.wav")
+    pipeline.transcriber.transcribe_audio.return_value = os.path.join(output_dir, "video.txt")
+    pipeline.blog_generator.generate_article_content.return_value = "# Blog"
+    pipeline.blog_generator.add_image_placeholder.return_value = "# Blog"
+    pipeline.media_enhancer.add_url_timestamps_to_blog.return_value = "# Blog"
+    pipeline.media_enhancer.add_images_to_blog.return_value = "# Blog"
+    return pipeline
+
+
+def test_run_records_stage_timings(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    on_stage_done = MagicMock()
+
+    result = pipeline.run(YOUTUBE_URL, on_stage_done=on_stage_done)
+
+    assert result["blog_post_path"] == str(tmp_path / "video.md")
+    assert set(result["stage_timings"]) == set(STAGES)
+    assert on_stage_done.call_count == len(STAGES)
+    assert (tmp_path / "video.md").read_text() == "# Blog"
+
+
+def test_run_stops_when_cancelled(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    with pytest.raises(utils.JobCancelledError):
+        pipeline.run(YOUTUBE_URL, is_cancelled=lambda: True)
+    pipeline.yt_downloader.download_video.assert_not_called()
+
+
+def test_run_resumes_after_completed_stages(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.media_enhancer.add_images_to_blog.side_effect = RuntimeError("crash")
+    with pytest.raises(RuntimeError):
+        pipeline.run(YOUTUBE_URL)
+
+    pipeline.media_enhancer.add_images_to_blog.side_effect = None
+    pipeline.blog_generator.generate_article_content.reset_mock()
+    pipeline.run(YOUTUBE_URL)
+
+    pipeline.blog_generator.generate_article_content.assert_not_called()
+    assert pipeline.media_enhancer.add_images_to_blog.call_count == 2
+
+
+@pytest.mark.parametrize("option, value", [
+    ("refine_strategy", "sections"),
+    ("topic_chunking", True),
+    ("retrieval_mode", "full"),
+    ("embedding_backend", "minilm"),
+    ("extra_artifacts", ["summary"]),
+])
+def test_run_starts_over_when_an_output_option_changes(tmp_path, option, value):
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.run(YOUTUBE_URL)
+    pipeline.blog_generator.generate_article_content.reset_mock()
+
+    setattr(pipeline, option, value)
+    pipeline.blog_generator.generate_artifacts.return_value = {
+        "blog_post": "# Blog", "summary": "Summary",
+    }
+    pipeline.run(YOUTUBE_URL)
+
+    generated = (pipeline.blog_generator.generate_article_content.call_count
+                 + pipeline.blog_generator.generate_artifacts.call_count)
+    assert generated == 1
+
+
+def test_frames_are_indexed_while_blog_post_is_generated(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.media_enhancer.retrieval_mode = "full"
+    frames_indexed = threading.Event()
+
+    def index_video_frames(video_path):
+        frames_indexed.set()
+        return {"frame.png": None}
+
+    def generate_article_content(transcription_path, checkpoint):
+        assert frames_indexed.wait(timeout=5)
+        return "# Blog"
+
+    pipeline.media_enhancer.index_video_frames.side_effect = index_video_frames
+    pipeline.blog_generator.generate_article_content.side_effect = generate_article_content
+    pipeline.run(YOUTUBE_URL)
+
+    images_text_dict = pipeline.media_enhancer.add_images_to_blog.call_args[0][2]
+    assert images_text_dict == {"frame.png": None}
+
+
+def test_frames_are_indexed_per_section_in_timestamp_mode(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.media_enhancer.retrieval_mode = "timestamp"
+    pipeline.run(YOUTUBE_URL)
+
+    pipeline.media_enhancer.index_video_frames.assert_not_called()
+    assert pipeline.media_enhancer.add_images_to_blog.call_args[0][2] is None
+
+
+def test_run_adds_video_to_search_index(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.search_index = SemanticIndex(str(tmp_path / "search"))
+    pipeline.media_enhancer.retrieval_mode = "timestamp"
+    (tmp_path / "video.txt").write_text("[00:00]Hello there [01:05]Gradient descent ")
+    frame_embeddings = {"frame_at_0_seconds.jpg": np.ones(4), "frame_at_10_seconds.jpg": -np.ones(4)}
+    pipeline.media_enhancer.index_video_frames.return_value = frame_embeddings
+    pipeline.media_enhancer.frame_timestamp.side_effect = lambda name: int(name.split("_")[2])
+    pipeline.media_enhancer.embed_texts.side_effect = lambda texts: np.eye(4)[:len(texts)]
+
+    result = pipeline.run(YOUTUBE_URL)
+
+    assert set(result["stage_timings"]) == set(STAGES) | {SEARCH_INDEX_STAGE}
+    assert pipeline.media_enhancer.add_images_to_blog.call_args[0][2] == frame_embeddings
+    assert pipeline.search_index.stats()["kinds"] == {"frame": 2, "transcript": 2}
+    transcript_result = pipeline.search_index.search(np.eye(4)[1], k=1, kind="transcript")[0]
+    assert transcript_result["video_id"] == "dQw4w9WgXcQ"
+    assert transcript_result["start_time"] == 65
+    assert transcript_result["source"] == YOUTUBE_URL
+
+
+def test_run_reports_cpu_usage_per_stage(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    result = pipeline.run(YOUTUBE_URL)
+    assert set(result["stage_resources"]) == set(STAGES)
+    assert all(usage["average_threads"] >= 1
+               for usage in result["stage_resources"].values()
+               if usage["wall_seconds"] > 0)
+    assert set(pipeline.resource_manager.usage) == set(STAGES)
+
+
+def test_jobs_run_in_their_own_workspace(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    first_result = pipeline.run(YOUTUBE_URL, job_id="first")
+    second_result = pipeline.run(YOUTUBE_URL, job_id="second")
+
+    download_calls = pipeline.yt_downloader.download_video.call_args_list
+    assert [call.kwargs["output_path"] for call in download_calls] == [
+        os.path.join(str(tmp_path), "workspaces", job_id, "video")
+        for job_id in ["first", "second"]
+    ]
+    image_calls = pipeline.media_enhancer.add_images_to_blog.call_args_list
+    assert [call.kwargs["image_subdir"] for call in image_calls] == ["first", "second"]
+    assert (tmp_path / "workspaces" / "first" / "run.json").exists()
+    assert (tmp_path / "workspaces" / "second" / "run.json").exists()
+    assert first_result["blog_post_path"] == str(tmp_path / "video_first.md")
+    assert second_result["blog_post_path"] == str(tmp_path / "video_second.md")
+    assert (tmp_path / "video_first.md").read_text() == "# Blog"
+
+
+def test_stored_artifacts_are_reused_by_later_jobs(tmp_path):
+    from essence_extractor.src.artifact_store import ArtifactStore
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.artifact_store = ArtifactStore(str(tmp_path / "store"))
+    pipeline.yt_downloader.stream_profile = "highest_resolution"
+    pipeline.transcriber.model_name = "base"
+    pipeline.transcriber.chunk_size = 200
+    pipeline.transcriber.use_vad = True
+
+    pipeline.run(YOUTUBE_URL, job_id="first")
+    result = pipeline.run(YOUTUBE_URL, job_id="second")
+
+    pipeline.yt_downloader.download_video.assert_called_once()
+    pipeline.transcriber.extract_audio.assert_called_once()
+    pipeline.transcriber.transcribe_audio.assert_called_once()
+    assert (tmp_path / "workspaces" / "second" / "video" / "video.mp4").exists()
+    assert (tmp_path / "workspaces" / "second" / "audio" / "video.txt").exists()
+    assert result["blog_post_path"] == str(tmp_path / "video_second.md")
+    assert pipeline.artifact_store.stats()["hits"] == 3
+
+
+def test_blog_post_is_generated_from_the_compacted_transcript(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    (tmp_path / "video.txt").write_text(
+        "[00:00] Um, so today we look at, uh, the the gradient descent. Thank you. "
+        "Thank you. Thank you. [01:05] The learning rate, um, sets the size of every step. ",
+    )
+
+    result = pipeline.run(YOUTUBE_URL)
+
+    compacted_path = pipeline.blog_generator.generate_article_content.call_args[0][0]
+    assert compacted_path == str(tmp_path / "video.compact.txt")
+    assert open(compacted_path).read() == (
+        "[00:00] so today we look at the gradient descent. Thank you. "
+        "[01:05] The learning rate sets the size of every step. "
+    )
+    assert result["transcript_tokens"]["tokens_saved"] > 0
+    assert "Compacting Transcript" in result["stage_timings"]
+
+
+def test_extra_artifacts_are_saved_next_to_the_blog_post(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.extra_artifacts = ["summary", "chapters"]
+    pipeline.blog_generator.generate_artifacts.return_value = {
+        "blog_post": "# Blog", "summary": "A summary.", "chapters": "[00:00] Intro",
+    }
+
+    result = pipeline.run(YOUTUBE_URL)
+
+    assert pipeline.blog_generator.generate_artifacts.call_args[0][1] == [
+        "blog_post", "summary", "chapters",
+    ]
+    pipeline.blog_generator.generate_article_content.assert_not_called()
+    assert (tmp_path / "video.md").read_text() == "# Blog"
+    assert (tmp_path / "dQw4w9WgXcQ_summary.md").read_text() == "A summary."
+    assert (tmp_path / "dQw4w9WgXcQ_chapters.md").read_text() == "[00:00] Intro"
+    assert result["llm_tokens"]["input_tokens"] == 0
+
+
+def test_run_file_uses_the_local_file(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    video_path = tmp_path / "my talk.mkv"
+    video_path.write_bytes(b"video")
+
+    result = pipeline.run_file(str(video_path))
+
+    pipeline.yt_downloader.download_video.assert_not_called()
+    pipeline.transcriber.extract_audio.assert_called_once()
+    assert pipeline.transcriber.extract_audio.call_args[0][0] == str(video_path)
+    pipeline.media_enhancer.add_url_timestamps_to_blog.assert_not_called()
+    pipeline.media_enhancer.add_media_fragment_timestamps_to_blog.assert_not_called()
+    assert result["blog_post_path"] == str(tmp_path / "my talk.md")
+
+
+def test_run_file_links_timestamps_to_the_published_file(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    pipeline.timestamp_base_url = "https://videos.example.com/talks/"
+    pipeline.media_enhancer.add_media_fragment_timestamps_to_blog.return_value = "# Blog"
+    video_path = tmp_path / "my talk.mkv"
+    video_path.write_bytes(b"video")
+
+    pipeline.run_file(str(video_path))
+
+    pipeline.media_enhancer.add_media_fragment_timestamps_to_blog.assert_called_once_with(
+        "https://videos.example.com/talks/my%20talk.mkv", "# Blog",
+    )
+
+
+def test_run_file_needs_an_existing_file(tmp_path):
+    pipeline = _create_pipeline(str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        pipeline.run_file(str(tmp_path / "missing.mp4"))
+
+
+def test_local_video_id_changes_with_the_file(tmp_path):
+    video_path = tmp_path / "My Talk (final).mp4"
+    video_path.write_bytes(b"video")
+    video_id = local_video_id(str(video_path))
+
+    assert video_id.startswith("My-Talk-final-")
+    assert local_video_id(str(video_path)) == video_id
+    video_path.write_bytes(b"edited video")
+    assert local_video_id(str(video_path)) != video_id
@@ -0,0 +1,122 @@
+import gc
+import os
+import signal
+import time
+import pytest
+from essence_extractor.src.job_queue import (
+    JobStore, FAILED, LOCAL_FILE, RUNNING, SUCCEEDED,
+)
+from essence_extractor.src.prefork_pool import PreforkWorkerPool, process_memory
+
+
+class FakePipeline:
+    crash_on = None
+
+    def __init__(self):
+        self.models_loaded_by = None
+
+    def load_models(self):
+        self.models_loaded_by = os.getpid()
+
+    def run_file(self, video_path, on_stage_done, is_cancelled, job_id):
+        if video_path == self.crash_on:
+            os._exit(3)
+        on_stage_done("Downloading Video", 0.1)
+        return {"pid": os.getpid(), "models_loaded_by": self.models_loaded_by}
+
+    def close(self):
+        pass
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError()
+        time.sleep(0.05)
+
+
+def _submit_videos(job_store, tmp_path, n_videos):
+    job_ids = []
+    for i in range(n_videos):
+        video_path = tmp_path / f"video-{i}.mp4"
+        video_path.write_bytes(b"video")
+        job_ids.append(job_store.submit(str(video_path), source=LOCAL_FILE))
+    return job_ids
+
+
+def test_workers_are_forked_from_the_loaded_pipeline(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_ids = _submit_videos(job_store, tmp_path, 3)
+    pipelines = []
+
+    def pipeline_factory():
+        pipelines.append(FakePipeline())
+        return pipelines[-1]
+
+    worker_pool = PreforkWorkerPool(job_store, pipeline_factory, n_workers=2,
+                                    poll_interval=0.05)
+    worker_pool.start()
+    try:
+        assert gc.isenabled()
+        _wait_for(lambda: job_store.count(SUCCEEDED) == 3)
+    finally:
+        worker_pool.stop(timeout=10)
+
+    assert len(pipelines) == 1
+    for job_id in job_ids:
+        job = job_store.get(job_id)
+        assert job["result"]["pid"] != os.getpid()
+        assert job["result"]["models_loaded_by"] == os.getpid()
+        assert job["stage_timings"] == {"Downloading Video": 0.1}
+
+
+def test_dead_workers_are_respawned(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    worker_pool = PreforkWorkerPool(job_store, FakePipeline, n_workers=1,
+                                    poll_interval=0.05)
+    worker_pool.start()
+    try:
+        (pid,) = worker_pool.worker_memory()
+        os.kill(pid, signal.SIGKILL)
+        _wait_for(lambda: not worker_pool.worker_memory())
+
+        assert worker_pool.respawn_dead_workers() == 1
+        job_id = _submit_videos(job_store, tmp_path, 1)[0]
+        _wait_for(lambda: job_store.get(job_id)["status"] == SUCCEEDED)
+        assert job_store.get(job_id)["result"]["pid"] not in (pid, os.getpid())
+    finally:
+        worker_pool.stop(timeout=10)
+
+
+def test_the_job_of_a_dead_worker_fails(tmp_path):
+    job_store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = _submit_videos(job_store, tmp_path, 1)[0]
+
+    def pipeline_factory():
+        pipeline = FakePipeline()
+        pipeline.crash_on = job_store.get(job_id)["url"]
+        return pipeline
+
+    worker_pool = PreforkWorkerPool(job_store, pipeline_factory, n_workers=1,
+                                    poll_interval=0.05)
+    worker_pool.start()
+    try:
+        _wait_for(lambda: not worker_pool.worker_memory())
+        assert worker_pool.respawn_dead_workers() == 1
+    finally:
+        worker_pool.stop(timeout=10)
+
+    job = job_store.get(job_id)
+    assert job["status"] == FAILED
+    assert "exited with code 3" in job["error"]
+    assert job_store.count(RUNNING) == 0
+
+
+def test_process_memory():
+    memory = process_memory(os.getpid())
+    if memory is None:
+        pytest.skip("The system does not report the memory of processes")
+
+    assert memory["rss"] >= memory["pss"] >= memory["uss"] > 0
+    assert process_memory(-1) is None
@@ -0,0 +1,84 @@
+import threading
+from unittest.mock import MagicMock, patch
+import pytest
+from essence_extractor.src.resource_manager import ResourceManager
+
+
+def test_stage_alone_gets_all_threads():
+    manager = ResourceManager(total_threads=8)
+    assert manager.threads() == 8
+    with manager.stage("Transcribing Audio") as usage:
+        assert manager.threads() == 8
+        assert manager.pool_size(3) == 3
+    assert usage["wall_seconds"] >= 0
+    assert manager.usage["Transcribing Audio"]["runs"] == 1
+
+
+def test_concurrent_stages_split_threads_by_weight():
+    manager = ResourceManager(total_threads=12)
+    budgets = {}
+    started = threading.Barrier(2, timeout=5)
+    measured = threading.Barrier(2, timeout=5)
+
+    def run(stage_name):
+        with manager.stage(stage_name):
+            started.wait()
+            budgets[stage_name] = manager.threads()
+            measured.wait()
+
+    threads = [threading.Thread(target=run, args=(name,))
+               for name in ["Transcribing Audio", "Generating Blog Post"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert budgets == {"Transcribing Audio": 9, "Generating Blog Post": 2}
+    assert sum(budgets.values()) <= manager.total_threads
+
+
+def test_torch_threads_follow_budget():
+    torch = MagicMock()
+    manager = ResourceManager(total_threads=6)
+    with patch.dict("sys.modules", {"torch": torch}):
+        with manager.stage("Transcribing Audio"):
+            torch.set_num_threads.assert_called_with(6)
+            with manager.stage("Indexing Video Frames"):
+                torch.set_num_threads.assert_called_with(2)
+            torch.set_num_threads.assert_called_with(6)
+        with manager.stage("Generating Blog Post"):
+            pass
+    assert torch.set_num_threads.call_count == 3
+
+
+def test_usage_reports_cpu_utilization():
+    manager = ResourceManager(total_threads=1)
+    with manager.stage("Adding Images") as usage:
+        sum(i * i for i in range(2_000_000))
+    assert usage["cpu_seconds"] > 0
+    assert 0 < usage["utilization"] <= 1.5
+    assert manager.report()["Adding Images"]["cpu_seconds"] == usage["cpu_seconds"]
+
+
+def test_configure_environment_keeps_existing_values(monkeypatch):
+    monkeypatch.setenv("OMP_NUM_THREADS", "3")
+    monkeypatch.delenv("MKL_NUM_THREADS", raising=False)
+    monkeypatch.delenv("TOKENIZERS_PARALLELISM", raising=False)
+    ResourceManager(total_threads=4).configure_environment()
+    import os
+    assert os.environ["OMP_NUM_THREADS"] == "3"
+    assert os.environ["MKL_NUM_THREADS"] == "4"
+    assert os.environ["TOKENIZERS_PARALLELISM"] == "false"
+
+
+def test_configure_environment_does_not_limit_openmp_threads(monkeypatch):
+    monkeypatch.delenv("OMP_THREAD_LIMIT", raising=False)
+    ResourceManager(total_threads=4).configure_environment()
+    import os
+    # A process-wide limit would also cap the intra-op threads of torch.
+    assert "OMP_THREAD_LIMIT" not in os.environ
+
+
+def test_invalid_thread_count():
+    with pytest.raises(ValueError):
+        ResourceManager(total_threads=0)
@@ -0,0 +1,42 @@
+import threading
+import pytest
+from essence_extractor.src.scheduler import Stage, StageScheduler, descendants
+
+
+def test_run_passes_results_of_inputs():
+    stages = [
+        Stage("a", lambda: 1),
+        Stage("b", lambda a: a + 1, inputs=["a"]),
+        Stage("c", lambda a, b, offset: a + b + offset, inputs=["a", "b"], args=[10]),
+    ]
+    results = StageScheduler().run(stages)
+    assert results == {"a": 1, "b": 2, "c": 13}
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+    stages = [
+        Stage("left", barrier.wait),
+        Stage("right", barrier.wait),
+    ]
+    StageScheduler(max_workers=2).run(stages)
+
+
+def test_invalid_graphs():
+    with pytest.raises(ValueError):
+        StageScheduler().run([Stage("a", lambda b: b, inputs=["b"])])
+    with pytest.raises(ValueError):
+        StageScheduler().run([
+            Stage("a", lambda b: b, inputs=["b"]),
+            Stage("b", lambda a: a, inputs=["a"]),
+        ])
+
+
+def test_descendants():
+    stages = [
+        Stage("a", lambda: 1),
+        Stage("b", lambda a: a, inputs=["a"]),
+        Stage("c", lambda b: b, inputs=["b"]),
+        Stage("d", lambda: 1),
+    ]
+    assert descendants(stages, "a") == {"b", "c"}
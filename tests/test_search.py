@@ -0,0 +1,37 @@
+import numpy as np
+from unittest.mock import patch, MagicMock
+from essence_extractor.search import format_result, result_link, search
+from essence_extractor.src.semantic_index import SemanticIndex
+
+
+def test_search(tmp_path):
+    backend = MagicMock(cache_key="model")
+    backend.encode.return_value = np.array([[0.0, 1.0]], dtype=np.float32)
+    SemanticIndex(str(tmp_path), model_key="model").add_video(
+        "dQw4w9WgXcQ", "transcript", ["transcript_chunk_0", "transcript_chunk_1"],
+        np.array([[1.0, 0.0], [0.1, 1.0]]), texts=["Intro", "Gradient descent"],
+        start_times=[0, 65], source="https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    )
+
+    with patch('essence_extractor.search.get_embedding_backend', return_value=backend):
+        results = search(str(tmp_path), "How does gradient descent work?", k=1)
+
+    assert results[0]["text"] == "Gradient descent"
+    line = format_result(results[0])
+    assert "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=65s" in line
+    assert line.endswith("Gradient descent")
+    assert results[0]["source"] == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def test_local_videos_link_to_their_source():
+    result = {"video_id": "talk-3f2a9c1b", "kind": "frame", "name": "frame_at_90_seconds.jpg",
+              "text": "Slide", "start_time": 90.0, "score": 0.5}
+
+    assert result_link({**result, "source": "/videos/talk.mp4"}) == "/videos/talk.mp4#t=90"
+    assert result_link({**result, "source": "https://media.example.com/talk.mp4"}) == (
+        "https://media.example.com/talk.mp4#t=90"
+    )
+    assert result_link({**result, "source": None}) == "talk-3f2a9c1b"
+    assert result_link({**result, "video_id": "dQw4w9WgXcQ", "source": None}) == (
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=90s"
+    )
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from essence_extractor.src.semantic_index import SemanticIndex
+
+
+def _embeddings(n, seed, dimension=16):
+    return np.random.default_rng(seed).normal(size=(n, dimension)).astype(np.float32)
+
+
+def _add_frames(index, video_id, embeddings):
+    names = [f"frame_at_{i * 10}_seconds.jpg" for i in range(len(embeddings))]
+    return index.add_video(video_id, "frame", names, embeddings,
+                           start_times=[i * 10 for i in range(len(embeddings))])
+
+
+def test_search_uses_cosine_similarity(tmp_path):
+    index = SemanticIndex(str(tmp_path))
+    embeddings = _embeddings(20, seed=0)
+    _add_frames(index, "video_a", embeddings)
+
+    results = index.search(embeddings[3] * 10, k=2)
+
+    assert results[0]["name"] == "frame_at_30_seconds.jpg"
+    assert results[0]["start_time"] == 30
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+    assert results[1]["score"] < 1
+
+
+def test_add_delete_and_filter_videos(tmp_path):
+    index = SemanticIndex(str(tmp_path))
+    embeddings = _embeddings(10, seed=1)
+    _add_frames(index, "video_a", embeddings)
+    _add_frames(index, "video_b", _embeddings(10, seed=2))
+    index.add_video("video_b", "transcript", ["transcript_chunk_0"], embeddings[:1],
+                    texts=["Gradient descent"], start_times=[0])
+
+    assert len(index) == 21
+    results = index.search(embeddings[0], k=5, video_id="video_b", kind="transcript")
+    assert [result["text"] for result in results] == ["Gradient descent"]
+
+    _add_frames(index, "video_a", embeddings[:5])
+    assert len(index) == 16
+
+    assert index.delete_video("video_a") == 5
+    assert all(result["video_id"] == "video_b" for result in index.search(embeddings[0]))
+
+
+def test_index_persists_and_rebuilds(tmp_path):
+    embeddings = _embeddings(10, seed=3)
+    _add_frames(SemanticIndex(str(tmp_path), model_key="model"), "video_a", embeddings)
+
+    reopened = SemanticIndex(str(tmp_path), model_key="model")
+    assert reopened.search(embeddings[4], k=1)[0]["start_time"] == 40
+
+    (tmp_path / SemanticIndex.INDEX_FILE_NAME).unlink()
+    rebuilt = SemanticIndex(str(tmp_path))
+    assert rebuilt.search(embeddings[4], k=1)[0]["start_time"] == 40
+
+    with pytest.raises(ValueError):
+        SemanticIndex(str(tmp_path), model_key="other model")
+
+
+@pytest.mark.parametrize("storage", ["fp16", "pq"])
+def test_switches_to_approximate_index(tmp_path, storage):
+    index = SemanticIndex(str(tmp_path), ann_threshold=300, storage=storage, nprobe=64)
+    _add_frames(index, "video_a", _embeddings(200, seed=4))
+    assert index.stats()["index_type"] == "IndexIDMap2"
+
+    embeddings = _embeddings(300, seed=5)
+    _add_frames(index, "video_b", embeddings)
+
+    stats = index.stats()
+    assert stats["items"] == 500 and stats["videos"] == 2
+    assert stats["index_type"] != "IndexIDMap2"
+    results = index.search(embeddings[7], k=1, video_id="video_b")
+    assert results[0]["start_time"] == 70
+
+
+def test_index_is_written_every_save_interval_and_on_close(tmp_path):
+    index = SemanticIndex(str(tmp_path), save_interval=3)
+    embeddings = _embeddings(10, seed=6)
+    _add_frames(index, "video_a", embeddings[:2])
+    index_path = tmp_path / SemanticIndex.INDEX_FILE_NAME
+    written = index_path.stat().st_mtime_ns
+    _add_frames(index, "video_b", embeddings[2:4])
+    _add_frames(index, "video_c", embeddings[4:6])
+    assert index_path.stat().st_mtime_ns == written
+
+    # Another process catches up with the changes that are not written yet.
+    other = SemanticIndex(str(tmp_path))
+    assert other.search(embeddings[4], k=1)[0]["video_id"] == "video_c"
+    index.delete_video("video_c")
+    assert other.search(embeddings[4], k=1)[0]["video_id"] != "video_c"
+
+    _add_frames(index, "video_d", embeddings[6:8])
+    index.close()
+    reopened = SemanticIndex(str(tmp_path))
+    assert reopened.search(embeddings[6], k=1)[0]["video_id"] == "video_d"
+    assert reopened.stats()["items"] == 6
+
+
+def test_filtered_search_reuses_its_selector(tmp_path, monkeypatch):
+    from essence_extractor.src import semantic_index
+    index = SemanticIndex(str(tmp_path))
+    embeddings = _embeddings(10, seed=7)
+    _add_frames(index, "video_a", embeddings[:5])
+    _add_frames(index, "video_b", embeddings[5:])
+    selectors = []
+    id_selector_batch = semantic_index.faiss.IDSelectorBatch
+    monkeypatch.setattr(semantic_index.faiss, "IDSelectorBatch",
+                        lambda ids: selectors.append(ids) or id_selector_batch(ids))
+
+    for _ in range(3):
+        assert index.search(embeddings[6], k=1, video_id="video_b")[0]["start_time"] == 10
+    assert len(selectors) == 1
+
+    _add_frames(index, "video_b", embeddings[:2])
+    assert index.search(embeddings[1], k=1, video_id="video_b")[0]["start_time"] == 10
+    assert list(selectors[-1]) == [11, 12]
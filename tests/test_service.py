@@ -0,0 +1,79 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from essence_extractor.service import create_server
+from essence_extractor.src.job_queue import JobStore, CANCELLED, SUCCEEDED
+
+
+@pytest.fixture
+def job_store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+@pytest.fixture
+def server_url(job_store):
+    server = create_server(job_store, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _request(url, method="GET", body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method)
+    with urllib.request.urlopen(request) as response:
+        return response.status, json.loads(response.read())
+
+
+def test_submit_get_and_cancel_job(server_url):
+    status, body = _request(
+        f"{server_url}/jobs", "POST", {"url": "https://youtu.be/dQw4w9WgXcQ"},
+    )
+    assert status == 201
+    job_url = f"{server_url}/jobs/{body['id']}"
+
+    status, job = _request(job_url)
+    assert status == 200 and job["status"] == "queued"
+
+    status, job = _request(job_url, "DELETE")
+    assert status == 202 and job["status"] == CANCELLED
+
+
+def test_submit_invalid_url(server_url):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _request(f"{server_url}/jobs", "POST", {"url": "https://example.com"})
+    assert e.value.code == 400
+
+
+def test_metrics_report_the_queue_depth(server_url):
+    _request(f"{server_url}/jobs", "POST", {"url": "https://youtu.be/dQw4w9WgXcQ"})
+
+    with urllib.request.urlopen(f"{server_url}/metrics") as response:
+        content_type = response.headers["Content-Type"]
+        text = response.read().decode("utf-8")
+
+    assert content_type.startswith("application/openmetrics-text")
+    assert 'essence_extractor_jobs{status="queued"} 1' in text
+    assert 'essence_extractor_jobs{status="running"} 0' in text
+    assert text.endswith("# EOF\n")
+
+
+def test_result_of_a_deleted_blog_post_is_gone(server_url, job_store, tmp_path):
+    blog_post_path = tmp_path / "video.md"
+    blog_post_path.write_text("# Blog")
+    job_id = job_store.submit("https://youtu.be/dQw4w9WgXcQ")
+    job_store.claim_next()
+    job_store.finish(job_id, SUCCEEDED, result={"blog_post_path": str(blog_post_path)})
+
+    with urllib.request.urlopen(f"{server_url}/jobs/{job_id}/result") as response:
+        assert response.read().decode("utf-8") == "# Blog"
+
+    blog_post_path.unlink()
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _request(f"{server_url}/jobs/{job_id}/result")
+    assert e.value.code == 410
+    assert "error" in json.loads(e.value.read())
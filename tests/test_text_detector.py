@@ -0,0 +1,44 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from essence_extractor.src.text_detector import TextPresenceDetector
+
+
+def _slide(text="Gradient descent converges", position=(100, 300)):
+    image = Image.new("RGB", (1280, 720), (255, 255, 255))
+    ImageDraw.Draw(image).text(
+        position, text, fill=(0, 0, 0), font=ImageFont.load_default(size=48),
+    )
+    return np.array(image)
+
+
+def _speaker_shot():
+    yy, xx = np.mgrid[0:720, 0:1280]
+    frame = np.stack([xx / 6, yy / 3, np.full_like(xx, 90)], axis=-1).astype(np.uint8)
+    frame[200:600, 500:800] = 180
+    return frame
+
+
+def test_detect_text_regions():
+    detector = TextPresenceDetector()
+    regions = detector.detect_text_regions(_slide())
+    assert regions
+    top, left, bottom, right = TextPresenceDetector.bounding_box(regions)
+    assert top <= 300 and bottom >= 348
+    assert left <= 100 and right >= 700
+
+
+def test_frames_without_text_are_skipped():
+    detector = TextPresenceDetector()
+    assert not detector.contains_text(_speaker_shot())
+    assert not detector.contains_text(np.zeros((720, 1280, 3), dtype=np.uint8))
+    assert detector.contains_text(_slide())
+
+
+def test_thresholds_are_configurable():
+    detector = TextPresenceDetector(min_cell_edge_density=1.0)
+    assert not detector.contains_text(_slide())
+
+
+def test_bounding_box():
+    regions = [(10, 20, 30, 40), (5, 25, 15, 60)]
+    assert TextPresenceDetector.bounding_box(regions) == (5, 20, 30, 60)
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+from essence_extractor.src.topic_segmenter import TopicSegmenter
+
+TOPIC_VECTORS = {"cats": [1.0, 0.0, 0.0], "dogs": [0.0, 1.0, 0.0], "fish": [0.0, 0.0, 1.0]}
+
+
+def _encode(texts):
+    return np.array([TOPIC_VECTORS[text.split()[0]] for text in texts])
+
+
+def _count_words(text):
+    return len(text.split())
+
+
+def _transcript(topics, words_per_chunk=4):
+    chunks = []
+    for topic in topics:
+        words = " ".join([topic] + ["word"] * (words_per_chunk - 2))
+        chunks.append(f"[{len(chunks):02d}:00] {words} ")
+    return "".join(chunks)
+
+
+def test_split_units_adds_up_to_the_transcript():
+    transcript = "Intro [00:00] first chunk [01:30] second chunk "
+
+    units = TopicSegmenter.split_units(transcript)
+
+    assert units == ["Intro ", "[00:00] first chunk ", "[01:30] second chunk "]
+    assert "".join(units) == transcript
+
+
+def test_segment_finds_topic_boundaries():
+    transcript = _transcript(["cats"] * 4 + ["dogs"] * 4 + ["fish"] * 4)
+
+    topics = TopicSegmenter(_encode).segment(transcript)
+
+    assert [len(topic["units"]) for topic in topics] == [4, 4, 4]
+    assert "".join("".join(topic["units"]) for topic in topics) == transcript
+    assert all(topic["units"][0].split()[1] == topic["units"][-1].split()[1]
+               for topic in topics)
+
+
+def test_first_chunk_packs_whole_topics():
+    segmenter = TopicSegmenter(_encode)
+    topics = segmenter.segment(_transcript(["cats"] * 4 + ["dogs"] * 4 + ["fish"] * 4))
+
+    # Two topics of 16 words fit, the third does not.
+    chunk, topics = segmenter.first_chunk(topics, 40, _count_words)
+
+    assert _count_words(chunk) == 32
+    assert chunk.split()[-3] == "dogs"
+    assert len(topics) == 1
+
+
+def test_first_chunk_cuts_a_long_topic_at_its_weakest_gap():
+    segmenter = TopicSegmenter(_encode)
+    topic = {"units": [f"[0{i}:00] cats word " for i in range(6)],
+             "similarities": [0.9, 0.9, 0.5, 0.9, 0.9]}
+
+    chunk, topics = segmenter.first_chunk([topic], 15, _count_words)
+
+    # Five chunks fit, and the weakest gap is after the third.
+    assert chunk == "".join(topic["units"][:3])
+    assert topics[0]["units"] == topic["units"][3:]
+    assert topics[0]["similarities"] == [0.9, 0.9]
+
+
+def test_first_chunk_continues_into_the_next_topic_when_mostly_empty():
+    segmenter = TopicSegmenter(_encode)
+    short_topic = {"units": ["[00:00] cats word "], "similarities": []}
+    long_topic = {"units": [f"[0{i}:00] dogs word " for i in range(1, 9)],
+                  "similarities": [0.9] * 7}
+
+    chunk, topics = segmenter.first_chunk([short_topic, long_topic], 20, _count_words)
+
+    assert _count_words(chunk) == 18
+    assert len(topics[0]["units"]) == 3
+
+
+def test_first_chunk_cuts_a_chunk_longer_than_the_budget_at_a_word():
+    segmenter = TopicSegmenter(_encode)
+    unit = "[00:00] " + " ".join(["cats"] * 10) + " "
+    topics = [{"units": [unit, "[01:00] dogs "], "similarities": [0.1]}]
+
+    chunk, topics = segmenter.first_chunk(topics, 5, _count_words)
+
+    assert _count_words(chunk) == 5
+    assert chunk + "".join(topics[0]["units"]) == unit + "[01:00] dogs "
+
+
+def _count_words_with_join_cost(min_markers):
+    # Token counts do not add up: joined chunks cost more than the chunks alone.
+    def count_tokens(text):
+        return _count_words(text) + (3 if text.count("[") >= min_markers else 0)
+    return count_tokens
+
+
+def test_first_chunk_cuts_at_the_last_gap_when_every_chunk_fits():
+    segmenter = TopicSegmenter(_encode)
+    short_topic = {"units": ["[00:00] cats word "], "similarities": []}
+    long_topic = {"units": ["[01:00] dogs word ", "[02:00] dogs word "],
+                  "similarities": [0.9]}
+
+    chunk, topics = segmenter.first_chunk(
+        [short_topic, long_topic], 10, _count_words_with_join_cost(3),
+    )
+
+    assert chunk == "[00:00] cats word [01:00] dogs word "
+    assert topics == [{"units": ["[02:00] dogs word "], "similarities": []}]
+
+
+def test_first_chunk_cuts_a_topic_of_one_fitting_chunk_at_a_word():
+    segmenter = TopicSegmenter(_encode)
+    short_topic = {"units": ["[00:00] cats word "], "similarities": []}
+    long_topic = {"units": ["[01:00] dogs word word word "], "similarities": []}
+
+    chunk, topics = segmenter.first_chunk(
+        [short_topic, long_topic], 10, _count_words_with_join_cost(2),
+    )
+
+    assert chunk == "[00:00] cats word [01:00] dogs word word word "
+    assert "".join(topics[0]["units"]) == ""
+
+
+def test_first_chunk_needs_a_positive_budget():
+    segmenter = TopicSegmenter(_encode)
+    topics = [{"units": ["[00:00] cats word "], "similarities": []}]
+
+    with pytest.raises(ValueError):
+        segmenter.first_chunk(topics, 0, _count_words)
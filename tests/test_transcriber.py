@@ -1,14 +1,17 @@
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
+import numpy as np
+import os
 from essence_extractor import Transcriber
 
 
 
 @patch('essence_extractor.src.transcriber.AudioFileClip')
 def test_extract_audio(mock_audio_file_clip):
-    mock_audio_file_clip.return_value.write_audiofile = lambda x: None
+    mock_audio_file_clip.return_value.write_audiofile = lambda path: open(path, "w").close()
     transcriber = Transcriber("test_output")
     audio_file_path = transcriber.extract_audio("test_video.mp4")
     assert audio_file_path == "test_output/test_video.wav"
+    os.remove(audio_file_path)
 
 
 def test_split_audio_into_token_chunks():
@@ -31,3 +34,179 @@ def test_assemble_transcript():
 
 
 
+
+@patch('essence_extractor.src.transcriber.whisper.load_audio')
+def test_transcribe_speech_regions(mock_load_audio):
+    sample_rate = 16000
+    t = np.arange(2 * sample_rate) / sample_rate
+    speech = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    silence = np.zeros(10 * sample_rate, dtype=np.float32)
+    mock_load_audio.return_value = np.concatenate([silence, speech])
+
+    transcriber = Transcriber("test_output")
+    transcriber.transcribe_model = MagicMock()
+    transcriber.transcribe_model.transcribe.return_value = {
+        "segments": [{"text": "Hello", "start": 0.5, "end": 1.5}],
+    }
+    result = transcriber._transcribe_speech_regions("test_audio.wav")
+
+    trimmed_audio = transcriber.transcribe_model.transcribe.call_args[0][0]
+    assert len(trimmed_audio) < 3 * sample_rate
+    assert 10 <= result["segments"][0]["start"] < 11
+
+
+def _tiny_whisper_model():
+    import torch
+    from whisper.model import ModelDimensions, Whisper
+    torch.manual_seed(0)
+    dims = ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=32, n_audio_head=2, n_audio_layer=1,
+        n_vocab=51865, n_text_ctx=32, n_text_state=32, n_text_head=2, n_text_layer=1,
+    )
+    return Whisper(dims).eval()
+
+
+def test_transcribe_clips_batches_match_single_clips():
+    transcriber = Transcriber("test_output")
+    transcriber.transcribe_model = _tiny_whisper_model()
+    rng = np.random.default_rng(0)
+    clips = [0.1 * rng.standard_normal(16000 * seconds).astype(np.float32)
+             for seconds in (2, 5, 9)]
+
+    with patch('essence_extractor.src.transcriber.whisper.decode',
+               wraps=__import__('whisper').decode) as mock_decode:
+        batched = transcriber.transcribe_clips(clips, batch_size=3, language="en")
+    assert mock_decode.call_count == 1
+    assert mock_decode.call_args[0][1].shape[0] == 3
+
+    single = [transcriber.transcribe_clips([clip], language="en")[0] for clip in clips]
+    assert batched == single
+    for clip, segments in zip(clips, batched):
+        assert all(0 <= s["start"] <= s["end"] <= len(clip) / 16000 for s in segments)
+
+
+def test_segments_from_tokens():
+    tokenizer = MagicMock(timestamp_begin=100, eot=50)
+    tokenizer.decode.side_effect = lambda tokens: " ".join(map(str, tokens))
+    tokens = [100, 1, 2, 125, 125, 3, 150, 50]
+    segments = Transcriber._segments_from_tokens(tokens, tokenizer, duration=2.0)
+    assert segments == [
+        {"start": 0.0, "end": 0.5, "text": "1 2"},
+        {"start": 0.5, "end": 1.0, "text": "3"},
+    ]
+    assert Transcriber._segments_from_tokens([100, 4], tokenizer, 2.0) == [
+        {"start": 0.0, "end": 2.0, "text": "4"},
+    ]
+
+
+@patch('essence_extractor.src.transcriber.whisper.load_audio')
+def test_transcribe_audio_batch_batches_short_clips(mock_load_audio, tmp_path):
+    durations = {"short_a.wav": 10, "long.wav": 90, "short_b.wav": 20}
+    mock_load_audio.side_effect = lambda path: np.zeros(
+        16000 * durations[os.path.basename(path)], dtype=np.float32,
+    )
+    transcriber = Transcriber(str(tmp_path), use_vad=False)
+    transcriber.transcribe_model = MagicMock()
+    transcriber.transcribe_model.transcribe.return_value = {
+        "segments": [{"text": "Long", "start": 0, "end": 90}],
+    }
+    transcriber.transcribe_clips = MagicMock(return_value=[
+        [{"text": "Short A", "start": 0, "end": 10}], [],
+    ])
+    paths = [str(tmp_path / name) for name in durations]
+
+    transcription_paths = transcriber.transcribe_audio_batch(paths)
+
+    clips = transcriber.transcribe_clips.call_args[0][0]
+    assert [len(clip) for clip in clips] == [16000 * 10, 16000 * 20]
+    transcriber.transcribe_model.transcribe.assert_called_once()
+    assert transcription_paths == [path.replace(".wav", ".txt") for path in paths]
+    with open(transcription_paths[0]) as f:
+        assert f.read().startswith("[00:00]Short A")
+    with open(transcription_paths[1]) as f:
+        assert "Long" in f.read()
+    with open(transcription_paths[2]) as f:
+        assert f.read() == ""
+
+
+def test_clip_batcher_batches_concurrent_clips():
+    import threading
+    from essence_extractor.src.transcriber import ClipBatcher
+
+    calls = []
+
+    def transcribe_clips(audios, batch_size):
+        calls.append(len(audios))
+        return [[{"text": str(len(audio)), "start": 0, "end": 1}] for audio in audios]
+
+    batcher = ClipBatcher(transcribe_clips, max_wait=5, batch_size=3)
+    results = {}
+
+    def transcribe(n_samples):
+        results[n_samples] = batcher.transcribe(np.zeros(n_samples))
+
+    threads = [threading.Thread(target=transcribe, args=(n,)) for n in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert calls == [3]
+    assert {n: segments[0]["text"] for n, segments in results.items()} == {
+        1: "1", 2: "2", 3: "3",
+    }
+
+
+def test_clip_batcher_passes_errors_to_every_clip():
+    from essence_extractor.src.transcriber import ClipBatcher
+
+    batcher = ClipBatcher(MagicMock(side_effect=RuntimeError("decode failed")),
+                          max_wait=0)
+    try:
+        batcher.transcribe(np.zeros(10))
+    except RuntimeError as e:
+        assert str(e) == "decode failed"
+    else:
+        raise AssertionError("The error of the batch was not raised")
+
+
+@patch('essence_extractor.src.transcriber.audio_duration')
+@patch('essence_extractor.src.transcriber.whisper.load_audio')
+def test_transcribe_audio_batches_short_clips(mock_load_audio, mock_audio_duration,
+                                              tmp_path):
+    mock_audio_duration.side_effect = lambda path: 10 if "short" in path else 90
+    mock_load_audio.return_value = np.zeros(16000 * 10, dtype=np.float32)
+    transcriber = Transcriber(str(tmp_path), use_vad=False, clip_batch_wait=0)
+    transcriber.transcribe_model = MagicMock()
+    transcriber.transcribe_model.transcribe.return_value = {
+        "segments": [{"text": "Long", "start": 0, "end": 90}],
+    }
+    transcriber._clip_batcher.transcribe_clips = MagicMock(return_value=[
+        [{"text": "Short", "start": 0, "end": 10}],
+    ])
+
+    short_path = transcriber.transcribe_audio(str(tmp_path / "short.wav"))
+    long_path = transcriber.transcribe_audio(str(tmp_path / "long.wav"))
+
+    transcriber._clip_batcher.transcribe_clips.assert_called_once()
+    transcriber.transcribe_model.transcribe.assert_called_once()
+    with open(short_path) as f:
+        assert f.read().startswith("[00:00]Short")
+    with open(long_path) as f:
+        assert "Long" in f.read()
+
+
+def test_audio_duration(tmp_path):
+    import wave
+    from essence_extractor.src.transcriber import audio_duration
+
+    audio_file_path = str(tmp_path / "audio.wav")
+    with wave.open(audio_file_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(b"\0\0" * 24000)
+
+    assert audio_duration(audio_file_path) == 1.5
+    assert audio_duration(np.zeros(8000, dtype=np.float32)) == 0.5
+    assert audio_duration(str(tmp_path / "missing.wav")) is None
@@ -0,0 +1,73 @@
+from essence_extractor.src.pipeline import TRANSCRIPT_CHUNK_PATTERN
+from essence_extractor.src.transcript_compactor import TranscriptCompactor
+
+
+def test_removes_filler_words_and_phrases():
+    compactor = TranscriptCompactor(min_chunk_words=0)
+    text = "Um, so we are going to, you know, talk about, uh, gradient descent, uh."
+    assert compactor.compact_chunk(text) == "so we are going to talk about gradient descent."
+
+
+def test_collapses_false_starts():
+    compactor = TranscriptCompactor()
+    text = "I think I think it is the the most important idea"
+    assert compactor.compact_chunk(text) == "I think it is the most important idea"
+
+
+def test_keeps_words_that_are_doubled_on_purpose():
+    compactor = TranscriptCompactor()
+    text = "He said that that model had had the best loss"
+    assert compactor.compact_chunk(text) == text
+
+
+def test_drops_stutter_fragments():
+    compactor = TranscriptCompactor()
+    text = "The gr- gradient and the the learning r- rate"
+    assert compactor.compact_chunk(text) == "The gradient and the learning rate"
+
+
+def test_drops_hallucination_loops_across_chunks():
+    compactor = TranscriptCompactor(min_chunk_words=0)
+    transcript = ("[00:00] The gradient points uphill. Thank you. "
+                  "[00:30] Thank you. Thank you. Thank you. "
+                  "[01:00] Thank you. So we step downhill instead. ")
+    assert compactor.compact(transcript) == (
+        "[00:00] The gradient points uphill. Thank you. "
+        "[01:00] So we step downhill instead. "
+    )
+
+
+def test_keeps_timestamps_and_merges_tiny_chunks():
+    compactor = TranscriptCompactor(min_chunk_words=4)
+    transcript = ("[00:00] Gradient descent follows the slope. "
+                  "[00:10] Um, right. "
+                  "[01:05] The learning rate sets the step size. ")
+    compacted = compactor.compact(transcript)
+    assert compacted == ("[00:00] Gradient descent follows the slope. right. "
+                         "[01:05] The learning rate sets the step size. ")
+    assert TRANSCRIPT_CHUNK_PATTERN.findall(compacted) == [("00", "00"), ("01", "05")]
+
+
+def test_compaction_is_deterministic_and_idempotent():
+    compactor = TranscriptCompactor()
+    transcript = ("[00:00] Uh, so so today, you know, we look at at loss functions and "
+                  "why they matter. Why they matter. [02:10] A loss function, "
+                  "um, scores a prediction against the label it should have had. ")
+    compacted = compactor.compact(transcript)
+    assert compactor.compact(transcript) == compacted
+    assert compactor.compact(compacted) == compacted
+
+
+def test_compact_file_reports_tokens_saved(tmp_path):
+    compactor = TranscriptCompactor()
+    transcript_path = tmp_path / "video.txt"
+    transcript_path.write_text("[00:00] Um, uh, the the model, um, learns. " * 5)
+
+    compacted_path = compactor.compact_file(str(transcript_path))
+
+    assert compacted_path == str(tmp_path / "video.compact.txt")
+    assert open(compacted_path).read() == "[00:00] the model learns. "
+    savings = compactor.token_savings(str(transcript_path), compacted_path)
+    assert savings["tokens_saved"] == savings["tokens_before"] - savings["tokens_after"]
+    assert savings["tokens_saved"] > 0
+    assert 0 < savings["saved_ratio"] < 1
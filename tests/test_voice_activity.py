@@ -0,0 +1,37 @@
+import numpy as np
+from essence_extractor.src.voice_activity import VoiceActivityDetector
+
+
+def _tone(seconds, sample_rate=16000, frequency=440):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def _silence(seconds, sample_rate=16000):
+    return np.zeros(int(seconds * sample_rate), dtype=np.float32)
+
+
+def test_detect_speech_regions():
+    audio = np.concatenate([_silence(5), _tone(3), _silence(10), _tone(2)])
+    vad = VoiceActivityDetector(padding=0.0)
+    regions = vad.detect_speech_regions(audio)
+    assert len(regions) == 2
+    assert abs(regions[0][0] - 5) < 0.1 and abs(regions[0][1] - 8) < 0.1
+    assert abs(regions[1][0] - 18) < 0.1 and abs(regions[1][1] - 20) < 0.1
+
+
+def test_short_pauses_are_kept():
+    audio = np.concatenate([_silence(2), _tone(1), _silence(0.5), _tone(1), _silence(2)])
+    vad = VoiceActivityDetector(padding=0.0, min_silence_duration=1.0)
+    regions = vad.detect_speech_regions(audio)
+    assert len(regions) == 1
+
+
+def test_restore_timestamps():
+    vad = VoiceActivityDetector()
+    regions = [(5.0, 8.0), (18.0, 20.0)]
+    segments = [{"text": "a", "start": 0.5, "end": 3.0},
+                {"text": "b", "start": 3.5, "end": 4.5}]
+    restored = vad.restore_timestamps(segments, regions)
+    assert restored[0]["start"] == 5.5 and restored[0]["end"] == 8.0
+    assert restored[1]["start"] == 18.5 and restored[1]["end"] == 19.5
@@ -0,0 +1,21 @@
+import os
+import pytest
+from essence_extractor.src.workspace import JobWorkspace
+
+
+def test_workspaces_of_jobs_are_separate(tmp_path):
+    first = JobWorkspace(str(tmp_path), "job-1").create()
+    second = JobWorkspace(str(tmp_path), "job_2").create()
+    assert first.root != second.root
+    assert first.image_subdir != second.image_subdir
+    assert os.path.isdir(first.video_dir) and os.path.isdir(first.audio_dir)
+
+    first.cleanup()
+    assert not os.path.exists(first.root)
+    assert os.path.isdir(second.video_dir)
+
+
+@pytest.mark.parametrize("job_id", ["", "../other", "a/b"])
+def test_invalid_job_id(tmp_path, job_id):
+    with pytest.raises(ValueError):
+        JobWorkspace(str(tmp_path), job_id)
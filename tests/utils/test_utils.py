@@ -0,0 +1,53 @@
+from unittest.mock import patch
+from essence_extractor.src import utils
+
+
+def test_token_counters_share_encoding():
+    first_counter = utils.TokenCounter(utils.DEFAULT_MODEL_NAME)
+    second_counter = utils.TokenCounter(utils.DEFAULT_MODEL_NAME)
+    assert first_counter.encoding is second_counter.encoding
+    assert first_counter.cache is second_counter.cache
+
+
+def test_count_tokens_is_memoized():
+    counter = utils.TokenCounter(utils.DEFAULT_MODEL_NAME)
+    text = "A system prompt that is counted over and over."
+    expected_count = len(counter.encoding.encode(text))
+
+    with patch.object(counter.encoding, "encode") as mock_encode:
+        mock_encode.return_value = [0] * expected_count
+        first_count = counter.count_tokens(text)
+        hits_before = counter.cache_info()["hits"]
+        second_count = counter.count_tokens(text)
+
+    assert first_count == second_count
+    assert mock_encode.call_count <= 1
+    assert counter.cache_info()["hits"] == hits_before + 1
+
+
+def test_count_tokens_many():
+    counter = utils.TokenCounter(utils.DEFAULT_MODEL_NAME)
+    texts = ["Hello world", "Another text", "Hello world"]
+    counts = counter.count_tokens_many(texts)
+    assert counts == [len(counter.encoding.encode(text)) for text in texts]
+
+
+def test_token_count_cache_is_bounded():
+    cache = utils.TokenCountCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 1)
+    cache.put("c", 1)
+    assert cache.get("a") is None
+    assert cache.get("c") == 1
+    assert cache.info()["size"] == 2
+
+
+def test_lazy_import_imports_on_first_use():
+    lazy_dumps = utils.lazy_import("json", "dumps")
+    with patch("importlib.import_module", wraps=utils.importlib.import_module) as mock:
+        assert "json.dumps" in repr(lazy_dumps)
+        mock.assert_not_called()
+        assert lazy_dumps([1]) == "[1]"
+        assert lazy_dumps({}) == "{}"
+    mock.assert_called_once_with("json")
+    assert utils.lazy_import("json").loads("[2]") == [2]